@@ -6,6 +6,10 @@ import { useAuth } from '../context/AuthContext';
 export const Market = () => {
     const [items, setItems] = useState([]);
     const [loading, setLoading] = useState(true);
+    const [page, setPage] = useState(1);
+    const [hasMore, setHasMore] = useState(false);
+    const [searchMode, setSearchMode] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [category, setCategory] = useState('All');
     const [searchTerm, setSearchTerm] = useState('');
     const [cart, setCart] = useState([]);
@@ -24,21 +28,30 @@ export const Market = () => {
         return () => clearTimeout(delayDebounceFn);
     }, [category, searchTerm]);
 
-    const fetchItems = async () => {
-        setLoading(true);
+    // The API returns one page at a time; X-Has-More says whether to offer "Load more"
+    const fetchItems = async (nextPage = 1) => {
+        const more = nextPage > 1;
+        const setBusy = more ? setLoadingMore : setLoading;
+        setBusy(true);
         try {
-            let url = '/api/market';
-            const params = [];
-            if (category !== 'All') params.push(`category=${category}`);
-            if (searchTerm) params.push(`search=${searchTerm}`);
-            if (params.length > 0) url += `?${params.join('&')}`;
+            const params = { page: nextPage };
+            if (category !== 'All') params.category = category;
+            if (searchTerm) params.search = searchTerm;
+            // Keep later pages on the mode the first page used (text or prefix)
+            if (more && searchMode) params.mode = searchMode;
 
-            const response = await axios.get(url);
-            setItems(response.data);
+            const response = await axios.get('/api/market', { params });
+            setItems(more ? (prev) => [...prev, ...response.data] : response.data);
+            setPage(nextPage);
+            setHasMore(response.headers['x-has-more'] === 'true');
+            if (!more) {
+                const mode = response.headers['x-search-mode'];
+                setSearchMode(mode === 'text' || mode === 'prefix' ? mode : null);
+            }
         } catch (error) {
             console.error("Error fetching market items:", error);
         } finally {
-            setLoading(false);
+            setBusy(false);
         }
     };
 
@@ -203,6 +216,17 @@ export const Market = () => {
                         ))}
                     </div>
                 )}
+                {!loading && hasMore && (
+                    <div className="flex justify-center pb-20">
+                        <button
+                            onClick={() => fetchItems(page + 1)}
+                            disabled={loadingMore}
+                            className="px-6 py-2 rounded-full bg-gray-100 text-gray-700 text-sm font-medium hover:bg-gray-200 disabled:opacity-50"
+                        >
+                            {loadingMore ? 'Loading...' : 'Load more'}
+                        </button>
+                    </div>
+                )}
             </div>
 
             {/* Cart Drawer */}
@@ -8,7 +8,12 @@ except Exception:
     CORS = None  # type: ignore
 
 
-def create_app() -> Flask:
+def create_app(load_models: bool = True) -> Flask:
+    """
+    load_models=False leaves model loading to the caller; the pre-fork
+    server (backend/wsgi.py) loads fork-safe weights in the master and the
+    rest in each worker.
+    """
     app = Flask(__name__)
 
     # Enable CORS for frontend (localhost:5173)
@@ -30,6 +35,9 @@ def create_app() -> Flask:
         from backend.routes.multispectral import multispec_bp
         app.register_blueprint(multispec_bp)
 
+        from backend.routes.fusion import fusion_bp
+        app.register_blueprint(fusion_bp)
+
         from backend.routes.market import market_bp
         app.register_blueprint(market_bp)
 
@@ -57,6 +65,9 @@ def create_app() -> Flask:
             from .routes.multispectral import multispec_bp
             app.register_blueprint(multispec_bp)
 
+            from .routes.fusion import fusion_bp
+            app.register_blueprint(fusion_bp)
+
             from .routes.market import market_bp
             app.register_blueprint(market_bp)
 
@@ -89,11 +100,58 @@ def create_app() -> Flask:
         except Exception as e:
             print(f"CRITICAL: Failed to register consult_bp: {e}")
 
+    # Models load lazily on first use; MODEL_WARMUP optionally preloads them.
+    # Models listed in MODEL_WORKERS run in their own processes instead.
+    try:
+        from backend.inference import registry, workers
+    except Exception:
+        from .inference import registry, workers
+    if load_models:
+        workers.start_from_env()
+        registry.warm_up_from_env(exclude=workers.configured())
+
+    # Background jobs (e.g. community cascade deletes); pre-fork servers start them per worker
+    try:
+        from backend import jobs
+    except Exception:
+        from . import jobs
+    if load_models:
+        jobs.start()
+
     # Health Check
     @app.get("/health")
     def health_check():
         return jsonify(status="ok"), 200
 
+    @app.get("/health/models")
+    def models_health():
+        return jsonify(registry.status()), 200
+
+    @app.get("/health/workers")
+    def workers_health():
+        return jsonify(workers.status()), 200
+
+    @app.get("/health/llm")
+    def llm_health():
+        try:
+            from backend import llm_client
+        except Exception:
+            from . import llm_client
+        return jsonify(llm_client.stats()), 200
+
+    @app.get("/health/db")
+    def db_health():
+        try:
+            from backend import database
+        except Exception:
+            from . import database
+        info = database.health()
+        return jsonify(info), 200 if info["connected"] else 503
+
+    @app.get("/health/jobs")
+    def jobs_health():
+        return jsonify(jobs.status()), 200
+
     # Serve static frontend
     @app.get("/")
     def index():
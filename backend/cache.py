@@ -0,0 +1,309 @@
+"""
+Small caching building blocks shared by the inference and LLM routes.
+
+- LRUCache: thread-safe in-process LRU with an optional per-entry TTL.
+- MongoCache: optional persistent tier in a MongoDB collection whose
+  documents expire through a TTL index.
+- TieredCache: LRU in front of Mongo, with hit/miss counters per tier.
+- SingleFlight: coalesces concurrent misses for the same key into one call.
+"""
+from __future__ import annotations
+
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Entries are bounded by count (`maxsize`) and, if `maxbytes` is set, by
+    the total of `sizeof(value)`; a single value larger than `maxbytes` is
+    not cached at all.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        maxbytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _pop(self, key: Hashable, last: Optional[bool] = None) -> None:
+        # Caller holds the lock; `last=False` pops the least recently used entry instead of `key`
+        if last is None:
+            self._data.pop(key, None)
+        else:
+            key, _ = self._data.popitem(last=last)
+        self.bytes -= self._sizes.pop(key, 0)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            self._pop(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self._data[key] = (value, expires)
+            if size:
+                self._sizes[key] = size
+                self.bytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes is not None and self.bytes > self.maxbytes):
+                self._pop(None, last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        info = {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+        if self.maxbytes is not None:
+            info.update(bytes=self.bytes, maxbytes=self.maxbytes)
+        return info
+
+
+class MongoCache:
+    """
+    Persistent cache tier. Errors are counted and swallowed: a cache outage
+    must never fail the request it is trying to speed up. After a failure
+    the tier is skipped for `retry_interval` seconds (MONGO_RETRY_INTERVAL
+    by default), and the outage is logged once rather than per request.
+    """
+
+    def __init__(self, collection: str, ttl: float, retry_interval: Optional[float] = None) -> None:
+        if retry_interval is None:
+            from backend import database
+
+            retry_interval = database.MONGO_RETRY_INTERVAL
+        self.collection_name = collection
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._indexed = False
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.skipped = 0
+
+    def _get_collection(self):
+        # Looked up per call on the shared client (cheap) so a forked child never reuses the parent's pool
+        from backend.database import get_db
+
+        db = get_db()
+        if db is None:
+            raise RuntimeError("Database connection failed")
+        collection = db[self.collection_name]
+        if not self._indexed:
+            with self._lock:
+                if not self._indexed:
+                    collection.create_index("expires_at", expireAfterSeconds=0)
+                    self._indexed = True
+        return collection
+
+    def available(self) -> bool:
+        if self._down_until and time.monotonic() < self._down_until:
+            self.skipped += 1
+            return False
+        return True
+
+    def _failed(self, action: str, exc: Exception) -> None:
+        self.errors += 1
+        with self._lock:
+            was_up = not self._down_until
+            self._down_until = time.monotonic() + self.retry_interval
+        if was_up:
+            print(f"Cache '{self.collection_name}' {action} failed, skipping it for {self.retry_interval:g}s: {exc}")
+
+    def _succeeded(self) -> None:
+        if self._down_until:
+            with self._lock:
+                self._down_until = 0.0
+            print(f"Cache '{self.collection_name}' is available again")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if not self.available():
+            return default
+        try:
+            doc = self._get_collection().find_one(
+                {"_id": key, "expires_at": {"$gt": datetime.datetime.utcnow()}}, {"value": 1}
+            )
+        except Exception as exc:
+            self._failed("read", exc)
+            return default
+        self._succeeded()
+        if doc is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return doc["value"]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if not self.available():
+            return
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl or self.ttl)
+        try:
+            self._get_collection().replace_one(
+                {"_id": key}, {"_id": key, "value": value, "expires_at": expires_at}, upsert=True
+            )
+        except Exception as exc:
+            self._failed("write", exc)
+            return
+        self._succeeded()
+
+    def delete(self, key: str) -> None:
+        if not self.available():
+            return
+        try:
+            self._get_collection().delete_one({"_id": key})
+        except Exception as exc:
+            self._failed("delete", exc)
+            return
+        self._succeeded()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "collection": self.collection_name,
+            "available": not self._down_until or time.monotonic() >= self._down_until,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class TieredCache:
+    """LRU first, then Mongo (if configured); Mongo hits are promoted into the LRU."""
+
+    def __init__(self, local: LRUCache, remote: Optional[MongoCache] = None) -> None:
+        self.local = local
+        self.remote = remote
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.remote is not None:
+            value = self.remote.get(key, _MISSING)
+            if value is not _MISSING:
+                self.local.set(key, value)
+                return value
+        return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.local.set(key, value, ttl=ttl)
+        if self.remote is not None:
+            self.remote.set(key, value, ttl=ttl)
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        if self.remote is not None:
+            self.remote.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        local = self.local.stats()
+        hits = self.local.hits + (self.remote.hits if self.remote else 0)
+        lookups = self.local.hits + self.local.misses
+        return {
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "memory": local,
+            "mongo": self.remote.stats() if self.remote else None,
+        }
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Run `fn` once per key at a time: callers arriving while a call for the
+    same key is in progress wait for it and share its result (or exception).
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                flight.value = fn()
+            except BaseException as exc:
+                flight.error = exc
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+        elif not flight.done.wait(timeout):
+            raise TimeoutError(f"Timed out waiting for in-flight call for {key!r}")
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._flights), "calls": self.calls, "coalesced": self.coalesced}
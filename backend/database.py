@@ -1,6 +1,17 @@
+"""
+Process-wide MongoDB access.
+
+One `MongoClient` (and so one connection pool) per process, created on the
+first `get_db()` call rather than at import, and dropped in forked children
+so pre-fork servers never share sockets with their master. Handlers call
+`get_db()` per request; it is a cheap lookup once connected.
+"""
 import os
+import threading
+import time
 import certifi
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 
 from pathlib import Path
@@ -46,36 +57,273 @@ if not MONGO_URI:
 # if not MONGO_URI:
 #     print("CRITICAL: Still no MONGO_URI found.")
 
-def get_db():
-    if not MONGO_URI:
-        print("WARNING: MONGO_URI not found.")
-        return None
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "agri4")
+# Pool sized for gunicorn threads plus background jobs; waits beyond the queue timeout fail fast
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+# After a failed connect, requests get None immediately instead of re-dialling each time
+MONGO_RETRY_INTERVAL = float(os.getenv("MONGO_RETRY_INTERVAL", "30"))
+
+
+class _PoolMetrics(monitoring.ConnectionPoolListener, monitoring.CommandListener):
+    """Connection-pool and command counters for /health/db."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkins": 0,
+            "checkout_failures": 0,
+            "pool_clears": 0,
+            "commands": 0,
+            "command_failures": 0,
+        }
+        self.checkout_wait_total = 0.0
+        self.command_time_total = 0.0
+
+    def _inc(self, key, value=1):
+        with self.lock:
+            self.counters[key] += value
+
+    # Pool events
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): self._inc("pool_clears")
+    def pool_closed(self, event): pass
+    def connection_created(self, event): self._inc("connections_created")
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): self._inc("connections_closed")
+    def connection_check_out_started(self, event): pass
+    def connection_check_out_failed(self, event): self._inc("checkout_failures")
+    def connection_checked_in(self, event): self._inc("checkins")
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.counters["checkouts"] += 1
+            # `duration` (time spent waiting for the pool) exists on pymongo >= 4.7
+            self.checkout_wait_total += getattr(event, "duration", 0.0) or 0.0
+
+    # Command events
+    def started(self, event): pass
+
+    def succeeded(self, event):
+        with self.lock:
+            self.counters["commands"] += 1
+            self.command_time_total += event.duration_micros / 1e6
+
+    def failed(self, event):
+        with self.lock:
+            self.counters["commands"] += 1
+            self.counters["command_failures"] += 1
+            self.command_time_total += event.duration_micros / 1e6
 
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+            checkouts = counters["checkouts"]
+            commands = counters["commands"]
+            return {
+                **counters,
+                "open_connections": counters["connections_created"] - counters["connections_closed"],
+                "in_use": checkouts - counters["checkins"],
+                "mean_checkout_wait_ms": round(self.checkout_wait_total / checkouts * 1000.0, 3) if checkouts else None,
+                "mean_command_ms": round(self.command_time_total / commands * 1000.0, 2) if commands else None,
+            }
+
+
+_client = None
+_db = None
+_on_connect = []
+# None until the first transaction tells us whether the deployment supports them
+_transactions_supported = None
+_insecure = False
+_last_failure = 0.0
+_lock = threading.Lock()
+_metrics = _PoolMetrics()
+
+
+def _reset_after_fork():
+    # MongoClient is not fork-safe: the child must build its own pool
+    global _client, _db, _lock, _metrics, _last_failure
+    _client = None
+    _db = None
+    _last_failure = 0.0
+    _lock = threading.Lock()
+    _metrics = _PoolMetrics()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _make_client(**tls):
+    return MongoClient(
+        MONGO_URI,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        event_listeners=[_metrics],
+        **tls,
+    )
+
+
+def _default_database(client):
+    # Try to get the default database from the URI, or fallback to MONGO_DB_NAME
+    try:
+        return client.get_default_database()
+    except Exception:
+        return client[MONGO_DB_NAME]
+
+
+def _connect():
+    global _insecure
+    client = None
     try:
         # tlsCAFile is needed for MongoDB Atlas to work with some SSL environments
-        client = MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-        
-        # Try to get the default database from the URI, or fallback to 'agri4'
-        try:
-            db = client.get_default_database()
-        except:
-            db = client["agri4"]
-        
-        # Test connection
+        client = _make_client(tlsCAFile=certifi.where())
         client.admin.command('ping')
         print("Connected successfully to MongoDB!")
-        return db
+        return client
     except Exception as e:
         print(f"Initial connection failed: {e}")
+        if client is not None:
+            client.close()
+        client = None
+
+    try:
+        print("Retrying without SSL verification...")
+        client = _make_client(tlsAllowInvalidCertificates=True)
+        client.admin.command('ping')
+        _insecure = True
+        print("Connected successfully to MongoDB! (Insecure fallback)")
+        return client
+    except Exception as e2:
+        print(f"All Connection Attempts Failed: {e2}")
+        if client is not None:
+            client.close()
+        return None
+
+
+def on_connect(fn):
+    """
+    Run `fn(db)` whenever this process connects (e.g. to create indexes).
+    Usable as a decorator; hooks must be idempotent and their errors are only logged.
+    """
+    _on_connect.append(fn)
+    if _db is not None:
+        _run_hook(fn, _db)
+    return fn
+
+
+def _run_hook(fn, db):
+    try:
+        fn(db)
+    except Exception as e:
+        print(f"MongoDB on_connect hook {getattr(fn, '__name__', fn)} failed: {e}")
+
+
+def get_client():
+    """The shared MongoClient, connecting on first use; None if unavailable."""
+    global _client, _db, _last_failure
+    if _client is not None:
+        return _client
+    if not MONGO_URI:
+        print("WARNING: MONGO_URI not found.")
+        return None
+
+    with _lock:
+        if _client is None:
+            if _last_failure and time.monotonic() - _last_failure < MONGO_RETRY_INTERVAL:
+                return None
+            client = _connect()
+            if client is None:
+                _last_failure = time.monotonic()
+                return None
+            db = _default_database(client)
+            for fn in _on_connect:
+                _run_hook(fn, db)
+            _db = db
+            _client = client
+            _last_failure = 0.0
+    return _client
+
+
+def get_db():
+    """The application database on the shared client, or None if MongoDB is unavailable."""
+    if _db is not None:
+        return _db
+    get_client()
+    return _db
+
+
+def run_in_transaction(fn):
+    """
+    Return `fn(session)` run inside a transaction (retried on transient
+    errors). Standalone servers have no transactions; there `fn(None)` runs
+    the same operations without one, so `fn` should order its writes so
+    that a partial failure is harmless or compensated.
+    """
+    global _transactions_supported
+    client = get_client()
+    if client is None:
+        raise RuntimeError("Database connection failed")
+    if _transactions_supported is False:
+        return fn(None)
+
+    with client.start_session() as session:
+        try:
+            result = session.with_transaction(fn)
+        except OperationFailure as e:
+            # IllegalOperation: "Transaction numbers are only allowed on a replica set member or mongos"
+            if e.code != 20 or _transactions_supported:
+                raise
+            print("MongoDB transactions unavailable (standalone server); writing without them")
+            _transactions_supported = False
+            return fn(None)
+    _transactions_supported = True
+    return result
+
+
+def health():
+    """Ping latency and pool/command metrics for this process."""
+    info = {
+        "configured": bool(MONGO_URI),
+        "connected": _client is not None,
+        "database": _db.name if _db is not None else None,
+        "insecure_tls": _insecure,
+        "transactions": _transactions_supported,
+        "pool": {
+            "max_size": MONGO_MAX_POOL_SIZE,
+            "min_size": MONGO_MIN_POOL_SIZE,
+            "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        },
+        "metrics": _metrics.snapshot(),
+    }
+    client = get_client()
+    if client is not None:
+        start = time.perf_counter()
         try:
-            print("Retrying without SSL verification...")
-            client = MongoClient(MONGO_URI, tlsAllowInvalidCertificates=True)
-            db = client.get_default_database()
             client.admin.command('ping')
-            print("Connected successfully to MongoDB! (Insecure fallback)")
-            return db
-        except Exception as e2:
-            print(f"All Connection Attempts Failed: {e2}")
-            return None
+            info["ping_ms"] = round((time.perf_counter() - start) * 1000.0, 2)
+        except Exception as e:
+            info["ping_error"] = str(e)
+    info["connected"] = _client is not None
+    return info
+
 
-db = get_db()
+def close():
+    global _client, _db
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _db = None
@@ -0,0 +1,43 @@
+"""
+gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+
+Graceful operations (send to the master PID):
+  HUP          re-fork workers from the preloaded master (config changes; model weights are kept)
+  USR2, WINCH  start a new master with fresh code/weights, then drain the old workers;
+               QUIT the old master once the new one is serving (zero downtime)
+  TTIN / TTOU  add / remove a worker
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Import the app (and fork-safe weights) once in the master; workers share those pages copy-on-write
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Recycle workers periodically to bound fragmentation; jitter avoids restarting them all at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "50"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def pre_fork(server, worker):
+    # Lowest slot no live worker holds, so a replacement takes over its predecessor's share of
+    # MODEL_WORKERS pools and cores instead of piling onto the same ones
+    taken = {getattr(w, "slot", None) for w in server.WORKERS.values()}
+    worker.slot = next(i for i in range(len(taken) + 1) if i not in taken)
+
+
+def post_fork(server, worker):
+    from backend.wsgi import post_fork as init_worker
+
+    init_worker(worker.slot, server.num_workers)
+    server.log.info("Worker %s initialised (slot %s)", worker.pid, worker.slot)
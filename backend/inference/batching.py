@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-item requests into one batched call.
+
+    The worker thread blocks until the first item arrives, then keeps
+    collecting until either `max_batch_size` items are queued or
+    `max_wait_ms` has elapsed, runs `batch_fn` once on the whole batch and
+    resolves each caller's future with its own result.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[Sequence[Any]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10.0,
+        name: str = "batcher",
+        latency_window: int = 2048,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must be >= 0")
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._latencies_ms: Deque[float] = deque(maxlen=latency_window)
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name=f"{name}-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        if self._closed:
+            raise RuntimeError(f"{self.name} is closed")
+        future: Future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def predict(self, item: Any, timeout: Optional[float] = None) -> Any:
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _collect(self) -> List[tuple]:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                # Re-queue the sentinel so the loop exits after this batch
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+
+            items = [entry[0] for entry in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as exc:
+                with self._stats_lock:
+                    self._errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(exc)
+                continue
+
+            done = time.perf_counter()
+            for (_, future, enqueued), result in zip(batch, results):
+                future.set_result(result)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                self._latencies_ms.extend((done - enqueued) * 1000.0 for _, _, enqueued in batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            latencies = sorted(self._latencies_ms)
+            batches = self._batches
+            items = self._items
+            sizes = dict(sorted(self._batch_sizes.items()))
+            errors = self._errors
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            idx = min(len(latencies) - 1, int(round(p / 100.0 * (len(latencies) - 1))))
+            return round(latencies[idx], 3)
+
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queue_depth": self._queue.qsize(),
+            "batches": batches,
+            "items": items,
+            "errors": errors,
+            "mean_batch_size": round(items / batches, 3) if batches else None,
+            "batch_size_histogram": sizes,
+            "latency_ms": {"p50": percentile(50), "p95": percentile(95), "p99": percentile(99)},
+        }
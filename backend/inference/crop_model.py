@@ -1,30 +1,59 @@
 # inference/crop_model.py
 
-import tensorflow as tf
 import numpy as np
-from tensorflow.keras.preprocessing import image
-from io import BytesIO
-from PIL import Image
 
-# Load model once (for performance)
+from . import onnx_backend, prediction_cache, preprocessing, registry, workers
+
 model_path = "backend/models/crop_model.h5"
-model = tf.keras.models.load_model(model_path)
-print("✅ Crop model loaded successfully!")
+
+def _load_model():
+    if onnx_backend.backend_for("crop") == "onnx":
+        return onnx_backend.OnnxClassifier(onnx_backend.onnx_path("crop"))
+
+    # TensorFlow is imported here so processes that never serve crop traffic don't pay for it
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+    print("✅ Crop model loaded successfully!")
+    return model
+
+def get_model():
+    """Load once on first use (for performance)."""
+    return registry.get("crop")
 
 # Define class labels
 class_names = ["Healthy", "Diseased"]
 
+def decode_image(img_bytes, out=None):
+    """(224, 224, 3) float32 in [0, 1]; writes into `out` when given."""
+    return preprocessing.crop_array(img_bytes, out=out)
+
 def preprocess_image(img_bytes):
-    img = Image.open(BytesIO(img_bytes)).convert("RGB")
-    img = img.resize((224, 224))
-    img_array = np.array(img) / 255.0
+    img_array = decode_image(img_bytes)
     img_array = np.expand_dims(img_array, axis=0)
     return img_array
 
-def predict_crop_health(img_bytes):
-    img_array = preprocess_image(img_bytes)
-    prediction = model.predict(img_array)
-    class_index = int(prediction[0][0] > 0.5)
+def _to_result(score):
+    class_index = int(score > 0.5)
     label = class_names[class_index]
-    confidence = float(prediction[0][0]) if label == "Diseased" else 1 - float(prediction[0][0])
+    confidence = float(score) if label == "Diseased" else 1 - float(score)
     return {"class": label, "confidence": round(confidence, 3)}
+
+def _predict_uncached(img_bytes):
+    return predict_crop_health_batch(preprocess_image(img_bytes))[0]
+
+def predict_crop_health(img_bytes):
+    version = prediction_cache.model_version("crop", model_path)
+    return prediction_cache.cached_predict(img_bytes, version, lambda: _predict_uncached(img_bytes))
+
+def predict_crop_health_batch(img_arrays):
+    """
+    img_arrays: (N, 224, 224, 3) batch, or a sequence of arrays from decode_image.
+    Runs in a model worker process when MODEL_WORKERS includes crop.
+    """
+    pool = workers.get_pool("crop")
+    if pool is not None:
+        return pool.predict(img_arrays)
+    batch = img_arrays if isinstance(img_arrays, np.ndarray) else np.stack(img_arrays)
+    prediction = get_model().predict(batch, batch_size=len(batch), verbose=0)
+    return [_to_result(row[0]) for row in prediction]
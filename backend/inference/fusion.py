@@ -0,0 +1,177 @@
+"""
+Multi-model fusion.
+
+Runs the pest, crop-health and (optionally) multispectral models on the
+same field observation concurrently and combines them into one diagnosis.
+Each model runs on its own thread of a shared pool; Torch, TensorFlow and
+ONNX Runtime release the GIL inside the forward pass, so end-to-end latency
+tracks the slowest model rather than the sum. The pool has one thread per
+model for each of FUSION_CONCURRENCY simultaneous requests, and a model's
+FUSION_TIMEOUT starts when its task starts running, not while it queues.
+
+Every model is reduced to a risk score in [0, 1]:
+  pest           confidence of the detected pest (1 - confidence for a "healthy" class)
+  crop           probability of "Diseased"
+  multispectral  expected severity over Healthy/Medium/Stressed/Diseased (0, 1/3, 2/3, 1)
+The fused risk is their weighted mean over the models that succeeded.
+"""
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+MODELS = ("pest", "crop", "multispectral")
+
+# Fusion requests expected at once (defaults to the gunicorn threads per worker)
+FUSION_CONCURRENCY = int(os.getenv("FUSION_CONCURRENCY", os.getenv("GUNICORN_THREADS", "4")))
+FUSION_WORKERS = int(os.getenv("FUSION_WORKERS", "0")) or len(MODELS) * FUSION_CONCURRENCY
+FUSION_TIMEOUT = float(os.getenv("FUSION_TIMEOUT", "30"))
+DEFAULT_WEIGHTS = os.getenv("FUSION_WEIGHTS", "pest=0.35,crop=0.35,multispectral=0.3")
+
+# Fused risk -> diagnosis, same labels as the multispectral model
+RISK_LEVELS = ((0.25, "Healthy"), (0.5, "Medium"), (0.75, "Stressed"))
+_SEVERITY = {"Healthy": 0.0, "Medium": 1.0 / 3.0, "Stressed": 2.0 / 3.0, "Diseased": 1.0}
+_NEGATIVE_PEST_LABELS = ("healthy", "none", "no_pest", "no pest", "background")
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=FUSION_WORKERS, thread_name_prefix="fusion")
+    return _pool
+
+
+def parse_weights(spec: Optional[str]) -> Dict[str, float]:
+    """'pest=0.5,crop=0.3,multispectral=0.2' -> dict; unspecified models keep the default weight."""
+    weights = {}
+    for source in (DEFAULT_WEIGHTS, spec or ""):
+        for part in source.split(","):
+            if not part.strip():
+                continue
+            name, sep, value = part.partition("=")
+            name = name.strip().lower()
+            if not sep or name not in MODELS:
+                raise ValueError(f"Invalid weight '{part.strip()}' (expected name=value for {', '.join(MODELS)})")
+            weights[name] = float(value)
+            if weights[name] < 0:
+                raise ValueError("Weights must be non-negative")
+    return weights
+
+
+def _pest(image_bytes: bytes) -> Dict[str, Any]:
+    from . import pest_model
+
+    label, confidence, _ = pest_model.predict(image_bytes)
+    negative = label.lower() in _NEGATIVE_PEST_LABELS
+    return {"label": label, "confidence": confidence, "risk": 1.0 - confidence if negative else confidence}
+
+
+def _crop(image_bytes: bytes) -> Dict[str, Any]:
+    from .crop_model import predict_crop_health
+
+    result = predict_crop_health(image_bytes)
+    diseased = result["confidence"] if result["class"] == "Diseased" else 1.0 - result["confidence"]
+    return {**result, "risk": diseased}
+
+
+def _multispectral(patch: np.ndarray) -> Dict[str, Any]:
+    from .multispectral_model import CLASSES, predict_multispectral
+
+    result = predict_multispectral(patch)
+    probs = result["probabilities"]
+    risk = sum(p * _SEVERITY[name] for name, p in zip(CLASSES, probs)) / max(sum(probs), 1e-9)
+    return {**result, "risk": risk}
+
+
+def risk_level(risk: float) -> str:
+    for threshold, label in RISK_LEVELS:
+        if risk < threshold:
+            return label
+    return "Diseased"
+
+
+def _timed(fn: Callable[..., Dict[str, Any]], arg: Any, started: Dict[str, float], name: str) -> Dict[str, Any]:
+    start = started[name] = time.perf_counter()
+    result = fn(arg)
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000.0, 2)
+    return result
+
+
+def diagnose(
+    image_bytes: bytes,
+    ms_patch: Optional[np.ndarray] = None,
+    weights: Optional[Dict[str, float]] = None,
+    timeout: float = FUSION_TIMEOUT,
+) -> Dict[str, Any]:
+    """
+    Run every applicable model in parallel and fuse the results. A model
+    that fails, runs longer than `timeout`, or is still queued `timeout`
+    seconds after submission is reported under "errors" and left out of the
+    fused score.
+    """
+    weights = weights if weights is not None else parse_weights(None)
+    jobs = {"pest": (_pest, image_bytes), "crop": (_crop, image_bytes)}
+    if ms_patch is not None:
+        jobs["multispectral"] = (_multispectral, ms_patch)
+
+    start = time.perf_counter()
+    pool = get_pool()
+    started: Dict[str, float] = {}
+    futures = {name: pool.submit(_timed, fn, arg, started, name) for name, (fn, arg) in jobs.items()}
+
+    errors: Dict[str, str] = {}
+    pending = dict(futures)
+    while pending:
+        now = time.perf_counter()
+        for name, future in list(pending.items()):
+            if future.done():
+                del pending[name]
+            elif name in started:
+                if now >= started[name] + timeout:
+                    # A running task cannot be stopped; it finishes on its pool thread and is ignored
+                    errors[name] = f"timed out after {timeout}s"
+                    del pending[name]
+            elif now >= start + timeout and future.cancel():
+                errors[name] = f"not started within {timeout}s (fusion pool busy)"
+                del pending[name]
+        if not pending:
+            break
+        deadline = min(started.get(name, start) + timeout for name in pending)
+        wait(pending.values(), timeout=max(deadline - time.perf_counter(), 0.001), return_when=FIRST_COMPLETED)
+
+    models: Dict[str, Dict[str, Any]] = {}
+    for name, future in futures.items():
+        if name in errors:
+            continue
+        try:
+            models[name] = future.result()
+        except Exception as e:
+            errors[name] = str(e)
+
+    used = {name: weights.get(name, 0.0) for name in models if weights.get(name, 0.0) > 0}
+    total = sum(used.values())
+    fused = sum(models[name]["risk"] * w for name, w in used.items()) / total if total else None
+
+    result: Dict[str, Any] = {
+        "diagnosis": risk_level(fused) if fused is not None else None,
+        "risk": round(fused, 4) if fused is not None else None,
+        "weights": {name: round(w / total, 4) for name, w in used.items()} if total else {},
+        "models": {
+            name: {**out, "risk": round(out["risk"], 4)} for name, out in models.items()
+        },
+        "timings_ms": {
+            **{name: out["latency_ms"] for name, out in models.items()},
+            "total": round((time.perf_counter() - start) * 1000.0, 2),
+        },
+    }
+    if models:
+        result["primary_concern"] = max(used or models, key=lambda name: models[name]["risk"])
+    if errors:
+        result["errors"] = errors
+    return result
@@ -0,0 +1,604 @@
+"""
+Hyperspectral cube processing.
+
+Cubes (ENVI .hdr + raw data, or .npy) are memory-mapped and processed in
+full-width row strips sized from HYPERSPECTRAL_MEMORY_MB. A strip is copied
+band by band straight into a float32 buffer, so integer or float64 cubes
+are never materialised as float64, and only the selected bands are read.
+
+Pipeline:
+    cube = open_cube("field.hdr")
+    bands = select_bands(cube)                      # drop water-absorption / bad bands
+    proj = fit_projection(cube, bands, "mnf", 20)   # chunked PCA or MNF
+    result = classify_pixels(cube, proj)            # or classify_patches(...)
+
+Projection statistics are accumulated strip by strip (float64 only for the
+bands x bands sums), and strips are read and projected on a worker pool
+while the model classifies the previous ones.
+"""
+from __future__ import annotations
+
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import onnx_backend, rasters, registry
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.getenv("HYPERSPECTRAL_MODEL_PATH", os.path.join(BASE_DIR, "models", "hyperspectral_model.joblib"))
+PROJECTION_PATH = os.getenv(
+    "HYPERSPECTRAL_PROJECTION_PATH", os.path.join(BASE_DIR, "models", "hyperspectral_projection.npz")
+)
+CLASSES = [c.strip() for c in os.getenv("HYPERSPECTRAL_CLASSES", "").split(",") if c.strip()]
+
+WORKERS = int(os.getenv("HYPERSPECTRAL_WORKERS", str(min(8, os.cpu_count() or 1))))
+MEMORY_BUDGET_MB = float(os.getenv("HYPERSPECTRAL_MEMORY_MB", "256"))
+PREDICT_BATCH_SIZE = 65536
+
+# Atmospheric water vapour absorption (nm); these bands are mostly noise
+WATER_ABSORPTION_NM = ((1340.0, 1460.0), (1790.0, 1960.0))
+
+# ENVI "data type" codes
+ENVI_DTYPES = {
+    1: np.uint8, 2: np.int16, 3: np.int32, 4: np.float32, 5: np.float64,
+    12: np.uint16, 13: np.uint32, 14: np.int64, 15: np.uint64,
+}
+ENVI_DATA_EXTENSIONS = ("", ".img", ".dat", ".raw", ".bsq", ".bil", ".bip")
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_pool() -> ThreadPoolExecutor:
+    """Strip read/project pool (memmap copies and BLAS matmuls release the GIL)."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="hyperspectral")
+    return _pool
+
+
+# ---------------------------------------------------------------------------
+# Cubes
+# ---------------------------------------------------------------------------
+
+
+def parse_envi_header(path: str) -> Dict[str, Any]:
+    """Parse an ENVI .hdr into a dict; brace-delimited lists become lists of strings."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if not text.lstrip().upper().startswith("ENVI"):
+        raise ValueError(f"Not an ENVI header: {path}")
+
+    header: Dict[str, Any] = {}
+    for match in re.finditer(r"^\s*([^=\n]+?)\s*=\s*(\{[^}]*\}|[^\n]*)", text, re.MULTILINE):
+        key, value = match.group(1).strip().lower(), match.group(2).strip()
+        if value.startswith("{"):
+            header[key] = [v.strip() for v in value[1:-1].split(",") if v.strip()]
+        else:
+            header[key] = value
+    return header
+
+
+class HyperspectralCube:
+    """
+    Memory-mapped (H, W, bands) cube with the rasters.py source interface
+    (`shape`, `read`, `close`) plus optional band selection on read.
+    """
+
+    def __init__(self, data: np.ndarray, wavelengths: Optional[np.ndarray] = None,
+                 bad_bands: Optional[np.ndarray] = None, scale: float = 1.0) -> None:
+        self.data = data
+        self.shape: Tuple[int, int, int] = tuple(data.shape)  # type: ignore[assignment]
+        self.wavelengths = wavelengths
+        self.bad_bands = bad_bands
+        self.scale = scale
+
+    @classmethod
+    def from_envi(cls, hdr_path: str) -> "HyperspectralCube":
+        header = parse_envi_header(hdr_path)
+        try:
+            samples, lines, bands = int(header["samples"]), int(header["lines"]), int(header["bands"])
+            dtype = np.dtype(ENVI_DTYPES[int(header.get("data type", 4))])
+        except KeyError as e:
+            raise ValueError(f"ENVI header is missing or has an unsupported {e}") from e
+        if header.get("byte order", "0") == "1":
+            dtype = dtype.newbyteorder(">")
+        interleave = header.get("interleave", "bsq").lower()
+        offset = int(header.get("header offset", 0))
+
+        base = os.path.splitext(hdr_path)[0]
+        data_path = next((base + ext for ext in ENVI_DATA_EXTENSIONS if os.path.isfile(base + ext)), None)
+        if data_path is None:
+            raise FileNotFoundError(f"No data file found next to {hdr_path}")
+
+        if interleave == "bsq":
+            data = np.memmap(data_path, dtype=dtype, mode="r", offset=offset, shape=(bands, lines, samples))
+            data = data.transpose(1, 2, 0)
+        elif interleave == "bil":
+            data = np.memmap(data_path, dtype=dtype, mode="r", offset=offset, shape=(lines, bands, samples))
+            data = data.transpose(0, 2, 1)
+        elif interleave == "bip":
+            data = np.memmap(data_path, dtype=dtype, mode="r", offset=offset, shape=(lines, samples, bands))
+        else:
+            raise ValueError(f"Unsupported ENVI interleave: {interleave}")
+
+        wavelengths = None
+        if "wavelength" in header and len(header["wavelength"]) == bands:
+            wavelengths = np.array([float(w) for w in header["wavelength"]], dtype=np.float64)
+            if header.get("wavelength units", "").lower().startswith("micro"):
+                wavelengths *= 1000.0
+        bad_bands = None
+        if "bbl" in header and len(header["bbl"]) == bands:
+            bad_bands = np.array([float(b) == 0 for b in header["bbl"]])
+        scale = float(header.get("reflectance scale factor", 0) or 0)
+        return cls(data, wavelengths, bad_bands, 1.0 / scale if scale else 1.0)
+
+    @classmethod
+    def from_npy(cls, path: str, layout: str = "auto", wavelengths: Optional[Sequence[float]] = None) -> "HyperspectralCube":
+        data = np.load(path, mmap_mode="r")
+        if data.ndim != 3:
+            raise ValueError(f"Expected a 3-D cube, got shape {data.shape}")
+        if layout == "auto":
+            # Band axis is the short one; hundreds of bands still beat rasters.MAX_BANDS, so decide by size
+            layout = "chw" if data.shape[0] < min(data.shape[1], data.shape[2]) else "hwc"
+        if layout == "chw":
+            data = data.transpose(1, 2, 0)
+        elif layout != "hwc":
+            raise ValueError("layout must be auto, hwc or chw")
+        return cls(data, np.asarray(wavelengths, dtype=np.float64) if wavelengths is not None else None)
+
+    def read(self, row: int, col: int, height: int, width: int,
+             bands: Optional[Sequence[int]] = None, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """float32 (h, w, len(bands)) window, copied band by band with no wider intermediate."""
+        window = self.data[row : row + height, col : col + width]
+        bands = range(self.shape[2]) if bands is None else bands
+        if out is None:
+            out = np.empty((window.shape[0], window.shape[1], len(bands)), dtype=np.float32)
+        for i, band in enumerate(bands):
+            out[:, :, i] = window[:, :, band]
+        if self.scale != 1.0:
+            out *= np.float32(self.scale)
+        return out
+
+    def close(self) -> None:
+        self.data = None
+
+
+def open_cube(path: str, **kwargs) -> HyperspectralCube:
+    """Open an ENVI cube (.hdr, or its data file with the .hdr alongside) or a .npy cube."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in rasters.NPY_EXTENSIONS:
+        return HyperspectralCube.from_npy(path, **kwargs)
+    hdr = path if ext == ".hdr" else os.path.splitext(path)[0] + ".hdr"
+    if os.path.isfile(hdr):
+        return HyperspectralCube.from_envi(hdr)
+    raise ValueError(f"Unsupported cube format: {path} (expected an ENVI .hdr or .npy)")
+
+
+def select_bands(
+    cube: HyperspectralCube,
+    bands: Optional[Sequence[int]] = None,
+    wavelength_range: Optional[Tuple[float, float]] = None,
+    drop_water: bool = True,
+) -> List[int]:
+    """
+    0-based band indices to keep: `bands` if given, otherwise every band
+    inside `wavelength_range` (nm) that is not flagged bad in the header and,
+    with drop_water, outside the water-absorption windows.
+    """
+    n_bands = cube.shape[2]
+    if bands is not None:
+        bad = [b for b in bands if not 0 <= b < n_bands]
+        if bad:
+            raise ValueError(f"Band indices out of range [0, {n_bands}): {bad}")
+        return list(bands)
+
+    keep = np.ones(n_bands, dtype=bool)
+    if cube.bad_bands is not None:
+        keep &= ~cube.bad_bands
+    wl = cube.wavelengths
+    if wl is not None:
+        if wavelength_range is not None:
+            keep &= (wl >= wavelength_range[0]) & (wl <= wavelength_range[1])
+        if drop_water:
+            for lo, hi in WATER_ABSORPTION_NM:
+                keep &= ~((wl >= lo) & (wl <= hi))
+    elif wavelength_range is not None:
+        raise ValueError("wavelength_range needs a cube with wavelength metadata")
+    selected = np.nonzero(keep)[0].tolist()
+    if not selected:
+        raise ValueError("Band selection removed every band")
+    return selected
+
+
+def block_rows_for(width: int, n_bands: int, n_out: int, in_flight: int = WORKERS,
+                   budget_mb: float = MEMORY_BUDGET_MB) -> int:
+    # per strip: selected bands + shifted-difference scratch + projected output + class/confidence maps
+    bytes_per_row = width * (8 * n_bands + 4 * n_out + 8)
+    return max(1, int(budget_mb * 1024 * 1024 // (bytes_per_row * max(1, in_flight))))
+
+
+def _iter_strips(cube: HyperspectralCube, block_rows: int, fn) -> Iterator[Tuple[int, int, Any]]:
+    """Run fn(row, nrows) for each strip on the pool, at most WORKERS in flight, yielding in order."""
+    pool = get_pool()
+    blocks = list(rasters.iter_blocks(cube.shape[0], block_rows))
+    pending = []
+    for row, nrows in blocks:
+        pending.append((row, nrows, pool.submit(fn, row, nrows)))
+        if len(pending) >= WORKERS:
+            row0, n0, future = pending.pop(0)
+            yield row0, n0, future.result()
+    for row0, n0, future in pending:
+        yield row0, n0, future.result()
+
+
+# ---------------------------------------------------------------------------
+# Dimensionality reduction
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class Projection:
+    """Band subset + linear projection fitted by `fit_projection` (kind: none, pca or mnf)."""
+
+    kind: str
+    bands: List[int]
+    mean: np.ndarray
+    components: Optional[np.ndarray] = None  # (len(bands), n_components) float32
+    eigenvalues: np.ndarray = field(default_factory=lambda: np.zeros(0))
+
+    @property
+    def n_components(self) -> int:
+        return len(self.bands) if self.components is None else self.components.shape[1]
+
+    def apply(self, pixels: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Centre (in place) and project (N, len(bands)) float32 pixels to (N, n_components)."""
+        pixels -= self.mean
+        if self.components is None:
+            return pixels
+        return np.matmul(pixels, self.components, out=out)
+
+    def summary(self) -> Dict[str, Any]:
+        total = float(self.eigenvalues.sum()) if self.eigenvalues.size else 0.0
+        kept = self.eigenvalues[: self.n_components]
+        return {
+            "kind": self.kind,
+            "bands": len(self.bands),
+            "components": self.n_components,
+            "explained_ratio": round(float(kept.sum()) / total, 4) if total else None,
+        }
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            kind=self.kind,
+            bands=np.asarray(self.bands),
+            mean=self.mean,
+            components=self.components if self.components is not None else np.zeros((0, 0), np.float32),
+            eigenvalues=self.eigenvalues,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        with np.load(path) as f:
+            components = f["components"]
+            return cls(
+                kind=str(f["kind"]),
+                bands=f["bands"].tolist(),
+                mean=f["mean"].astype(np.float32),
+                components=components.astype(np.float32) if components.size else None,
+                eigenvalues=f["eigenvalues"],
+            )
+
+
+def fit_projection(
+    cube: HyperspectralCube,
+    bands: Optional[Sequence[int]] = None,
+    kind: str = "pca",
+    n_components: int = 20,
+    sample_step: int = 1,
+    block_rows: Optional[int] = None,
+) -> Projection:
+    """
+    Fit PCA or MNF on the selected bands in one chunked pass.
+
+    sample_step > 1 fits on every n-th row and column, which is usually
+    enough for covariance estimates on multi-million-pixel cubes. MNF
+    estimates noise from horizontal neighbour differences and orders
+    components by signal-to-noise instead of variance.
+    """
+    kind = kind.lower()
+    if kind not in ("none", "pca", "mnf"):
+        raise ValueError("kind must be none, pca or mnf")
+    bands = list(bands) if bands is not None else list(range(cube.shape[2]))
+    height, width, _ = cube.shape
+    n_bands = len(bands)
+    n_components = min(n_components, n_bands)
+    rows = block_rows or block_rows_for(width, n_bands, 0)
+    rows = max(sample_step, rows - rows % sample_step)
+
+    # Shift by a first-strip estimate of the mean so the float32 per-strip Gram matrices stay well conditioned
+    shift = cube.read(0, 0, min(rows, height), width, bands)[::sample_step, ::sample_step].reshape(-1, n_bands)
+    shift = shift.mean(axis=0, dtype=np.float64).astype(np.float32)
+
+    def partial(row: int, nrows: int):
+        strip = cube.read(row, 0, nrows, width, bands)[::sample_step]
+        result = {}
+        if kind == "mnf" and width > 1:
+            diff = np.subtract(strip[:, 1:], strip[:, :-1])[:, ::sample_step].reshape(-1, n_bands)
+            result["noise"] = (len(diff), diff.T @ diff)
+        pixels = strip[:, ::sample_step].reshape(-1, n_bands)
+        pixels -= shift
+        result["n"] = len(pixels)
+        result["sum"] = pixels.sum(axis=0, dtype=np.float64)
+        result["gram"] = pixels.T @ pixels
+        return result
+
+    n = 0
+    total = np.zeros(n_bands)
+    gram = np.zeros((n_bands, n_bands))
+    noise_n = 0
+    noise = np.zeros((n_bands, n_bands))
+    for _, _, part in _iter_strips(cube, rows, partial):
+        n += part["n"]
+        total += part["sum"]
+        gram += part["gram"]
+        if "noise" in part:
+            noise_n += part["noise"][0]
+            noise += part["noise"][1]
+    if n < 2:
+        raise ValueError("Cube is too small to fit a projection")
+
+    mean = total / n
+    cov = (gram - n * np.outer(mean, mean)) / (n - 1)
+    mean = (mean + shift).astype(np.float32)
+    if kind == "none":
+        return Projection("none", bands, mean, None, np.sort(np.diag(cov))[::-1])
+
+    if kind == "pca":
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        order = np.argsort(eigvals)[::-1]
+        return Projection("pca", bands, mean, eigvecs[:, order[:n_components]].astype(np.float32), eigvals[order])
+
+    if noise_n < 2:
+        raise ValueError("MNF needs a cube at least 2 pixels wide")
+    # Difference of neighbours has twice the noise variance
+    noise_cov = noise / (2.0 * noise_n)
+    nvals, nvecs = np.linalg.eigh(noise_cov)
+    whiten = nvecs / np.sqrt(np.maximum(nvals, np.finfo(np.float64).eps * nvals.max()))
+    eigvals, eigvecs = np.linalg.eigh(whiten.T @ cov @ whiten)
+    order = np.argsort(eigvals)[::-1]
+    components = (whiten @ eigvecs[:, order[:n_components]]).astype(np.float32)
+    return Projection("mnf", bands, mean, components, eigvals[order])
+
+
+def transform(
+    cube: HyperspectralCube,
+    projection: Projection,
+    out_path: Optional[str] = None,
+    block_rows: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Project the whole cube to (H, W, n_components) float32, written to a
+    memory-mapped .npy at out_path (or an in-memory array if None).
+    """
+    height, width, _ = cube.shape
+    k = projection.n_components
+    rows = block_rows or block_rows_for(width, len(projection.bands), k)
+    if out_path:
+        out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=(height, width, k))
+    else:
+        out = np.empty((height, width, k), dtype=np.float32)
+
+    def project(row: int, nrows: int) -> None:
+        pixels = cube.read(row, 0, nrows, width, projection.bands).reshape(-1, len(projection.bands))
+        out[row : row + nrows] = projection.apply(pixels).reshape(nrows, width, k)
+
+    for _ in _iter_strips(cube, rows, project):
+        pass
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Classification
+# ---------------------------------------------------------------------------
+
+
+class _SklearnClassifier:
+    """Gives a fitted scikit-learn estimator the Keras-style `predict` used elsewhere."""
+
+    def __init__(self, estimator) -> None:
+        self.estimator = estimator
+        self.classes = [str(c) for c in getattr(estimator, "classes_", [])]
+
+    def predict(self, x: np.ndarray, batch_size: Optional[int] = None, verbose: int = 0) -> np.ndarray:
+        return self.estimator.predict_proba(x).astype(np.float32, copy=False)
+
+
+def _load_model():
+    if onnx_backend.backend_for("hyperspectral") == "onnx":
+        return onnx_backend.OnnxClassifier(onnx_backend.onnx_path("hyperspectral"))
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"Hyperspectral model not found: {MODEL_PATH}")
+    if MODEL_PATH.endswith((".h5", ".keras")):
+        import tensorflow as tf
+
+        return tf.keras.models.load_model(MODEL_PATH)
+
+    import joblib
+
+    return _SklearnClassifier(joblib.load(MODEL_PATH))
+
+
+def get_model():
+    return registry.get("hyperspectral")
+
+
+def load_projection(path: str = PROJECTION_PATH) -> Projection:
+    """The projection the deployed model was trained on."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Hyperspectral projection not found: {path}")
+    return Projection.load(path)
+
+
+def _class_names(model, n: int) -> List[str]:
+    names = CLASSES or getattr(model, "classes", None) or []
+    return list(names) if len(names) == n else [f"class_{i}" for i in range(n)]
+
+
+def classify_pixels(
+    cube: HyperspectralCube,
+    projection: Optional[Projection] = None,
+    model=None,
+    output_dir: Optional[str] = None,
+    preview_size: int = 128,
+    block_rows: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Per-pixel classification. Strips are read and projected on the worker
+    pool while the model predicts the previous ones; only per-class counts,
+    mean confidence and a strided preview are kept in memory. output_dir
+    receives full-resolution classes.npy (uint8) and confidence.npy maps.
+    """
+    projection = projection or load_projection()
+    model = model or get_model()
+    height, width, _ = cube.shape
+    k = projection.n_components
+    rows = block_rows or block_rows_for(width, len(projection.bands), k)
+    step = max(1, -(-max(height, width) // preview_size)) if preview_size > 0 else 0
+    if step:
+        rows = max(step, rows - rows % step)
+
+    def features(row: int, nrows: int) -> np.ndarray:
+        pixels = cube.read(row, 0, nrows, width, projection.bands).reshape(-1, len(projection.bands))
+        return projection.apply(pixels)
+
+    counts = np.zeros(0, dtype=np.int64)
+    conf_sum = 0.0
+    previews: List[np.ndarray] = []
+    maps: Dict[str, np.memmap] = {}
+    for row, nrows, feats in _iter_strips(cube, rows, features):
+        probs = np.asarray(model.predict(feats, batch_size=PREDICT_BATCH_SIZE, verbose=0), dtype=np.float32)
+        idx = probs.argmax(axis=1)
+        conf = probs[np.arange(len(idx)), idx]
+        if not maps and output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            maps["classes"] = np.lib.format.open_memmap(
+                os.path.join(output_dir, "classes.npy"), mode="w+", dtype=np.uint8, shape=(height, width)
+            )
+            maps["confidence"] = np.lib.format.open_memmap(
+                os.path.join(output_dir, "confidence.npy"), mode="w+", dtype=np.float32, shape=(height, width)
+            )
+        if len(counts) < probs.shape[1]:
+            counts = np.zeros(probs.shape[1], dtype=np.int64)
+        counts += np.bincount(idx, minlength=probs.shape[1])
+        conf_sum += float(conf.sum(dtype=np.float64))
+        class_strip = idx.reshape(nrows, width)
+        if step:
+            previews.append(class_strip[(-row) % step :: step, ::step].astype(np.uint8))
+        if maps:
+            maps["classes"][row : row + nrows] = class_strip
+            maps["confidence"][row : row + nrows] = conf.reshape(nrows, width)
+
+    for mm in maps.values():
+        mm.flush()
+    names = _class_names(model, len(counts))
+    total = int(counts.sum())
+    result: Dict[str, Any] = {
+        "cube_shape": list(cube.shape),
+        "projection": projection.summary(),
+        "block_rows": rows,
+        "classes": names,
+        "class_counts": {name: int(c) for name, c in zip(names, counts)},
+        "class_fractions": {name: round(int(c) / total, 4) for name, c in zip(names, counts)} if total else {},
+        "mean_confidence": round(conf_sum / total, 4) if total else None,
+    }
+    if step:
+        result["preview_step"] = step
+        result["preview"] = np.concatenate(previews).tolist()
+    if output_dir:
+        result["outputs"] = {name: os.path.join(output_dir, f"{name}.npy") for name in maps}
+    return result
+
+
+def classify_patches(
+    cube: HyperspectralCube,
+    projection: Optional[Projection] = None,
+    model=None,
+    patch_size: int = 32,
+    overlap: int = 0,
+    batch_size: int = 64,
+) -> Dict[str, Any]:
+    """
+    Per-patch classification with a model taking (N, patch, patch, components).
+    The projected cube is written to a temporary memory-mapped .npy (it has
+    only `n_components` bands) and tiled like multispectral `predict_raster`.
+    """
+    projection = projection or load_projection()
+    model = model or get_model()
+    height, width, _ = cube.shape
+    k = projection.n_components
+
+    fd, path = tempfile.mkstemp(suffix=".npy", prefix="hsi_")
+    os.close(fd)
+    source = None
+    try:
+        projected = transform(cube, projection, out_path=path)
+        del projected  # release the writable memmap before re-opening it read-only
+        # transform() always writes HWC; the CHW guess would transpose a cube no taller than MAX_BANDS
+        source = rasters.NpyRaster(path, layout="hwc")
+
+        row_origins = rasters.window_origins(height, patch_size, overlap)
+        col_origins = rasters.window_origins(width, patch_size, overlap)
+        class_grid = np.zeros((len(row_origins), len(col_origins)), dtype=np.int64)
+        conf_grid = np.zeros((len(row_origins), len(col_origins)), dtype=np.float32)
+        buffer = np.zeros((batch_size, patch_size, patch_size, k), dtype=np.float32)
+        pending: List[Tuple[int, int]] = []
+        n_classes = [0]
+
+        def flush() -> None:
+            pred = np.asarray(model.predict(buffer[: len(pending)], batch_size=len(pending), verbose=0))
+            n_classes[0] = pred.shape[1]
+            idx = pred.argmax(axis=1)
+            for (gi, gj), c, p in zip(pending, idx, pred):
+                class_grid[gi, gj] = c
+                conf_grid[gi, gj] = p[c]
+            pending.clear()
+
+        for gi, gj, row, col in rasters.iter_windows(height, width, patch_size, overlap):
+            window = source.read(row, col, patch_size, patch_size)
+            slot = buffer[len(pending)]
+            if window.shape[:2] != (patch_size, patch_size):
+                slot[...] = 0
+            slot[: window.shape[0], : window.shape[1]] = window
+            pending.append((gi, gj))
+            if len(pending) == batch_size:
+                flush()
+        if pending:
+            flush()
+    finally:
+        if source is not None:
+            source.close()
+        os.remove(path)
+
+    names = _class_names(model, n_classes[0])
+    counts = np.bincount(class_grid.ravel(), minlength=len(names))
+    return {
+        "cube_shape": [height, width, cube.shape[2]],
+        "projection": projection.summary(),
+        "patch_size": patch_size,
+        "overlap": overlap,
+        "grid_shape": list(class_grid.shape),
+        "row_origins": row_origins,
+        "col_origins": col_origins,
+        "classes": names,
+        "class_grid": [[names[c] for c in row] for row in class_grid.tolist()],
+        "confidence_grid": np.round(conf_grid, 4).tolist(),
+        "class_counts": {name: int(n) for name, n in zip(names, counts)},
+    }
@@ -1,16 +1,43 @@
 import os
-import tensorflow as tf
 import numpy as np
 
+from . import onnx_backend, rasters, registry, workers
+
 # Build absolute path to models folder safely
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MODEL_PATH = os.path.join(BASE_DIR, "models", "multispectral_model.h5")
 
-print(" Loading multispectral model from:", MODEL_PATH)
 
-# Load the model
-model = tf.keras.models.load_model(MODEL_PATH)
-print("Multispectral model loaded successfully!")
+def _load_model():
+    if onnx_backend.backend_for("multispectral") == "onnx":
+        return onnx_backend.OnnxClassifier(onnx_backend.onnx_path("multispectral"))
+
+    import tensorflow as tf
+
+    print(" Loading multispectral model from:", MODEL_PATH)
+    model = tf.keras.models.load_model(MODEL_PATH)
+    print("Multispectral model loaded successfully!")
+    return model
+
+
+def get_model():
+    return registry.get("multispectral")
+
+
+CLASSES = ["Healthy", "Medium", "Stressed", "Diseased"]
+TILE_SIZE = 224
+BANDS = 4
+
+
+def predict_probabilities(batch):
+    """
+    (N, 224, 224, 4) float32 batch -> (N, 4) class probabilities, in a model
+    worker process when MODEL_WORKERS includes multispectral.
+    """
+    pool = workers.get_pool("multispectral")
+    if pool is not None:
+        return np.asarray(pool.predict(batch))
+    return get_model().predict(batch, batch_size=len(batch), verbose=0)
 
 
 # Main inference function
@@ -23,12 +50,66 @@ def predict_multispectral(ms_patch):
     ms_patch = ms_patch.astype("float32")
     ms_patch = np.expand_dims(ms_patch, axis=0)  # (1,224,224,4)
 
-    pred = model.predict(ms_patch)
+    pred = predict_probabilities(ms_patch)
     class_idx = int(np.argmax(pred))
 
-    classes = ["Healthy", "Medium", "Stressed", "Diseased"]
+    return {
+        "class": CLASSES[class_idx],
+        "confidence": float(pred[0][class_idx]),
+        "probabilities": [float(p) for p in pred[0]],
+    }
+
+
+def predict_raster(source, overlap=0, batch_size=32):
+    """
+    Classify every 224x224 window of a (H, W, 4) raster source (see
+    inference/rasters.py). Windows are read one batch at a time into a
+    preallocated buffer, so the raster itself is never loaded into memory.
+    Edge windows are flush with the raster border; rasters smaller than a
+    tile are zero-padded.
+    """
+    height, width, bands = source.shape
+    if bands != BANDS:
+        raise ValueError(f"Expected a {BANDS}-band raster, got {bands} bands")
+
+    row_origins = rasters.window_origins(height, TILE_SIZE, overlap)
+    col_origins = rasters.window_origins(width, TILE_SIZE, overlap)
+    class_grid = np.zeros((len(row_origins), len(col_origins)), dtype=np.int64)
+    conf_grid = np.zeros((len(row_origins), len(col_origins)), dtype=np.float32)
+
+    buffer = np.zeros((batch_size, TILE_SIZE, TILE_SIZE, BANDS), dtype=np.float32)
+    pending = []
+
+    def flush():
+        pred = predict_probabilities(buffer[: len(pending)])
+        idx = pred.argmax(axis=1)
+        for (gi, gj), k, p in zip(pending, idx, pred):
+            class_grid[gi, gj] = k
+            conf_grid[gi, gj] = p[k]
+        pending.clear()
+
+    for gi, gj, row, col in rasters.iter_windows(height, width, TILE_SIZE, overlap):
+        window = source.read(row, col, TILE_SIZE, TILE_SIZE)
+        slot = buffer[len(pending)]
+        if window.shape[:2] != (TILE_SIZE, TILE_SIZE):
+            slot[...] = 0
+        slot[: window.shape[0], : window.shape[1]] = window
+        pending.append((gi, gj))
+        if len(pending) == batch_size:
+            flush()
+    if pending:
+        flush()
 
+    counts = np.bincount(class_grid.ravel(), minlength=len(CLASSES))
     return {
-        "class": classes[class_idx],
-        "confidence": float(pred[0][class_idx])
+        "raster_shape": [height, width, bands],
+        "tile_size": TILE_SIZE,
+        "overlap": overlap,
+        "grid_shape": list(class_grid.shape),
+        "row_origins": row_origins,
+        "col_origins": col_origins,
+        "classes": CLASSES,
+        "class_grid": [[CLASSES[k] for k in row] for row in class_grid.tolist()],
+        "confidence_grid": np.round(conf_grid, 4).tolist(),
+        "class_counts": {name: int(n) for name, n in zip(CLASSES, counts)},
     }
@@ -0,0 +1,119 @@
+"""
+ONNX Runtime execution backend.
+
+Select per process with INFERENCE_BACKEND=onnx, or per model with
+PEST_BACKEND / CROP_BACKEND / MULTISPECTRAL_BACKEND. Models are exported to
+backend/models/onnx/<name>.onnx by `python -m backend.scripts.export_onnx`.
+With every model on ONNX, serving processes need neither Torch nor TensorFlow.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from . import preprocessing
+
+MODELS_DIR = Path(__file__).resolve().parent.parent / "models"
+ONNX_DIR = MODELS_DIR / "onnx"
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "native").lower()
+
+# 0 lets ONNX Runtime pick (one thread per physical core)
+INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "0"))
+EXECUTION_MODE = os.getenv("ORT_EXECUTION_MODE", "sequential").lower()
+
+
+def backend_for(name: str) -> str:
+    """'onnx' or 'native' for the given model name."""
+    return os.getenv(f"{name.upper()}_BACKEND", INFERENCE_BACKEND).lower()
+
+
+def onnx_path(name: str) -> Path:
+    return ONNX_DIR / f"{name}.onnx"
+
+
+def session_options():
+    import onnxruntime as ort
+
+    opts = ort.SessionOptions()
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    opts.intra_op_num_threads = INTRA_OP_THREADS
+    opts.inter_op_num_threads = INTER_OP_THREADS
+    opts.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL if EXECUTION_MODE == "parallel" else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    return opts
+
+
+class OnnxClassifier:
+    """
+    Thin wrapper around an InferenceSession whose `predict` mirrors
+    `keras.Model.predict`, so the Keras call sites work unchanged.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        import onnxruntime as ort
+
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(
+                f"ONNX model not found: {path} (run `python -m backend.scripts.export_onnx`)"
+            )
+        self.path = path
+        self.session = ort.InferenceSession(
+            str(path), sess_options=session_options(), providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        self.output_name = self.session.get_outputs()[0].name
+
+    def predict(self, x: np.ndarray, batch_size: Optional[int] = None, verbose: int = 0) -> np.ndarray:
+        x = np.ascontiguousarray(x, dtype=self.input_dtype)
+        if batch_size is None or batch_size >= len(x):
+            return self.session.run([self.output_name], {self.input_name: x})[0]
+        outputs = [
+            self.session.run([self.output_name], {self.input_name: x[i : i + batch_size]})[0]
+            for i in range(0, len(x), batch_size)
+        ]
+        return np.concatenate(outputs, axis=0)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    np.exp(shifted, out=shifted)
+    shifted /= shifted.sum(axis=1, keepdims=True)
+    return shifted
+
+
+class OnnxPestModel:
+    """Drop-in replacement for the Torch pest model (same public methods)."""
+
+    def __init__(self, path: Union[str, Path], classes: List[str]) -> None:
+        self.session = OnnxClassifier(path)
+        self.classes = classes
+
+    def preprocess(self, img: Union[Image.Image, bytes]) -> np.ndarray:
+        return preprocessing.pest_array(img)
+
+    def predict_tensors(self, tensors: Union[np.ndarray, Sequence[np.ndarray]]) -> List[Tuple[str, float, List[float]]]:
+        batch = tensors if isinstance(tensors, np.ndarray) else np.stack(tensors)
+        probs = _softmax(self.session.predict(batch).astype(np.float32))
+        idxs = probs.argmax(axis=1)
+        return [
+            (self.classes[int(idx)], float(row[idx]), row.tolist())
+            for idx, row in zip(idxs, probs)
+        ]
+
+    def predict_batch(self, images: Sequence[Union[Image.Image, bytes]]) -> List[Tuple[str, float, List[float]]]:
+        return self.predict_tensors(
+            preprocessing.preprocess_batch(images, preprocessing.pest_array, preprocessing.PEST_SHAPE)
+        )
+
+    def predict_image(self, img: Union[Image.Image, bytes]) -> Tuple[str, float, List[float]]:
+        return self.predict_batch([img])[0]
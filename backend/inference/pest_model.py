@@ -1,38 +1,59 @@
 from __future__ import annotations
 
-import io
+import os
+import threading
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from typing import List, Optional, Sequence, Tuple, Union
 
-import torch
+import numpy as np
 from PIL import Image
-from torchvision import models, transforms
+
+from . import onnx_backend, prediction_cache, preprocessing, registry, workers
+from .batching import MicroBatcher
+
+try:
+    import torch
+    from torchvision import models
+except ImportError:
+    # Serving with PEST_BACKEND=onnx does not need Torch installed
+    torch = None  # type: ignore
 
 MODELS_DIR = Path(__file__).resolve().parent.parent / "models"
 MODEL_PATH = next((p for p in [MODELS_DIR / "resnet50_0.497.pkl", MODELS_DIR / "resnet.pkl"] if p.exists()), None)
 CLASSES_PATH = MODELS_DIR / "classes.txt"
 
+# Micro-batching knobs: collect up to BATCH_MAX_SIZE images or BATCH_MAX_WAIT_MS per forward pass
+BATCHING_ENABLED = os.getenv("PEST_BATCHING", "1").lower() not in ("0", "false", "no")
+BATCH_MAX_SIZE = int(os.getenv("PEST_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("PEST_BATCH_MAX_WAIT_MS", "10"))
+
+# INT8 mode: none, dynamic or static. Static calibrates on PEST_CALIBRATION_DIR at load time,
+# or loads a pre-quantized TorchScript file from PEST_QUANTIZED_PATH if it exists.
+QUANTIZE = os.getenv("PEST_QUANTIZE", "none").lower()
+CALIBRATION_DIR = os.getenv("PEST_CALIBRATION_DIR")
+QUANTIZED_PATH = os.getenv("PEST_QUANTIZED_PATH")
+
 
-_transform = transforms.Compose(
-    [
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-    ]
-)
+def _transform(img: Union[Image.Image, bytes]) -> torch.Tensor:
+    return torch.from_numpy(preprocessing.pest_array(img))
 
 
 class _PestModelSingleton:
     _instance: Optional["_PestModelSingleton"] = None
 
-    def __init__(self) -> None:
+    def __init__(self, quantize: Optional[str] = None, calibration_dir: Optional[Path] = None) -> None:
         if MODEL_PATH is None:
             raise FileNotFoundError("No pest model file found in backend/models (expected resnet50_0.497.pkl or resnet.pkl)")
 
         self.device = torch.device("cpu")
+        self.quantize = (quantize or QUANTIZE).lower()
         self.classes: List[str] = self._load_classes(CLASSES_PATH)
-        self.model: torch.nn.Module = self._load_model(MODEL_PATH, num_classes=len(self.classes))
+        self.model: torch.nn.Module = self._load_model(
+            MODEL_PATH,
+            num_classes=len(self.classes),
+            quantize=self.quantize,
+            calibration_dir=calibration_dir or (Path(CALIBRATION_DIR) if CALIBRATION_DIR else None),
+        )
         self.model.eval()
         self.model.to(self.device)
 
@@ -59,7 +80,25 @@ class _PestModelSingleton:
         model.fc = torch.nn.Linear(in_features, num_classes)
         return model
 
-    def _load_model(self, path: Path, num_classes: int) -> torch.nn.Module:
+    def _load_model(
+        self,
+        path: Path,
+        num_classes: int,
+        quantize: str = "none",
+        calibration_dir: Optional[Path] = None,
+    ) -> torch.nn.Module:
+        if quantize == "static" and QUANTIZED_PATH and Path(QUANTIZED_PATH).exists():
+            return torch.jit.load(QUANTIZED_PATH, map_location=self.device)
+
+        model = self._load_fp32_model(path, num_classes)
+        if quantize == "none":
+            return model
+
+        from .quantization import quantize as quantize_model
+
+        return quantize_model(model, quantize, _transform, calibration_dir)
+
+    def _load_fp32_model(self, path: Path, num_classes: int) -> torch.nn.Module:
         # Try loading as a full Torch model first
         try:
             loaded = torch.load(path, map_location=self.device)
@@ -81,23 +120,101 @@ class _PestModelSingleton:
         except Exception as exc:
             raise RuntimeError(f"Failed to load model from {path}: {exc}") from exc
 
-    def predict_image(self, img: Union[Image.Image, bytes]) -> Tuple[str, float, List[float]]:
-        if isinstance(img, bytes):
-            img = Image.open(io.BytesIO(img)).convert("RGB")
-        else:
-            img = img.convert("RGB")
+    def preprocess(self, img: Union[Image.Image, bytes]) -> torch.Tensor:
+        return _transform(img)
 
-        tensor = _transform(img).unsqueeze(0).to(self.device)
+    def predict_tensors(
+        self, tensors: Union[np.ndarray, Sequence[torch.Tensor]]
+    ) -> List[Tuple[str, float, List[float]]]:
+        if isinstance(tensors, np.ndarray):
+            batch = torch.from_numpy(tensors).to(self.device)
+        else:
+            batch = torch.stack(list(tensors)).to(self.device)
         with torch.inference_mode():
-            logits = self.model(tensor)
-            probs = torch.softmax(logits, dim=1).squeeze(0)
+            logits = self.model(batch)
+            probs = torch.softmax(logits, dim=1)
 
-        conf, idx = torch.max(probs, dim=0)
-        class_name = self.classes[int(idx)]
-        return class_name, float(conf), probs.cpu().tolist()
+        confs, idxs = torch.max(probs, dim=1)
+        probs_list = probs.cpu().tolist()
+        return [
+            (self.classes[int(idx)], float(conf), row)
+            for conf, idx, row in zip(confs, idxs, probs_list)
+        ]
 
+    def predict_batch(self, images: Sequence[Union[Image.Image, bytes]]) -> List[Tuple[str, float, List[float]]]:
+        return self.predict_tensors(
+            preprocessing.preprocess_batch(images, preprocessing.pest_array, preprocessing.PEST_SHAPE)
+        )
 
-def get_model() -> _PestModelSingleton:
+    def predict_image(self, img: Union[Image.Image, bytes]) -> Tuple[str, float, List[float]]:
+        return self.predict_batch([img])[0]
+
+
+def load_model():
+    """Registry loader: the Torch model, or its ONNX Runtime export when PEST_BACKEND=onnx."""
+    if onnx_backend.backend_for("pest") == "onnx":
+        classes = _PestModelSingleton._load_classes(CLASSES_PATH)
+        return onnx_backend.OnnxPestModel(onnx_backend.onnx_path("pest"), classes)
+    if torch is None:
+        raise RuntimeError("Torch is not installed; set PEST_BACKEND=onnx to serve the exported model")
     return _PestModelSingleton.get()
 
 
+def get_model() -> _PestModelSingleton:
+    return registry.get("pest")
+
+
+_batcher: Optional[MicroBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    predict_arrays,
+                    max_batch_size=BATCH_MAX_SIZE,
+                    max_wait_ms=BATCH_MAX_WAIT_MS,
+                    name="pest",
+                )
+    return _batcher
+
+
+def batcher_stats() -> dict:
+    """Batching statistics, without forcing the model to load."""
+    if _batcher is None:
+        return {"started": False, "max_batch_size": BATCH_MAX_SIZE, "max_wait_ms": BATCH_MAX_WAIT_MS}
+    return {"started": True, **_batcher.stats()}
+
+
+def predict_arrays(batch: Union[np.ndarray, Sequence[np.ndarray]]) -> List[Tuple[str, float, List[float]]]:
+    """
+    Classify preprocessed (3, 224, 224) arrays, in a model worker process when
+    MODEL_WORKERS includes pest (see inference/workers.py), otherwise in-process.
+    """
+    pool = workers.get_pool("pest")
+    if pool is not None:
+        return pool.predict(batch)
+    return get_model().predict_tensors(batch if isinstance(batch, np.ndarray) else np.stack(batch))
+
+
+def _predict_uncached(img: Union[Image.Image, bytes]) -> Tuple[str, float, List[float]]:
+    sample = preprocessing.pest_array(img)
+    if not BATCHING_ENABLED:
+        return predict_arrays(sample[np.newaxis])[0]
+    return get_batcher().predict(sample)
+
+
+def predict(img: Union[Image.Image, bytes]) -> Tuple[str, float, List[float]]:
+    """
+    Predict a single image, sharing a forward pass with concurrent callers
+    when batching is enabled. Preprocessing runs on the caller's thread.
+    Raw upload bytes are served from the prediction cache when seen before.
+    """
+    if not isinstance(img, bytes):
+        return _predict_uncached(img)
+    version = prediction_cache.model_version("pest", MODEL_PATH, extra=f"q={QUANTIZE}")
+    label, confidence, probabilities = prediction_cache.cached_predict(img, version, lambda: _predict_uncached(img))
+    return label, confidence, probabilities
@@ -0,0 +1,67 @@
+"""
+Content-addressed prediction cache.
+
+Keys are a BLAKE2b hash of the uploaded image bytes plus the model
+version (backend, weights file size/mtime and any load-time options), so a
+retrained or re-exported model never serves stale results. The in-process
+LRU is always on; PREDICTION_CACHE_MONGO=1 adds a shared MongoDB tier whose
+entries expire after PREDICTION_CACHE_TTL seconds.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+from backend.cache import LRUCache, MongoCache, TieredCache
+
+from . import onnx_backend
+
+CACHE_ENABLED = os.getenv("PREDICTION_CACHE", "1").lower() not in ("0", "false", "no")
+CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+CACHE_MONGO = os.getenv("PREDICTION_CACHE_MONGO", "0").lower() in ("1", "true", "yes")
+CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", str(7 * 24 * 3600)))
+
+_cache = TieredCache(
+    LRUCache(maxsize=CACHE_SIZE),
+    MongoCache("prediction_cache", ttl=CACHE_TTL) if CACHE_MONGO else None,
+)
+_versions: Dict[str, str] = {}
+
+
+def model_version(name: str, native_path: Optional[Union[str, Path]], extra: str = "") -> str:
+    """Stable identifier for the weights that will serve `name` in this process."""
+    if name not in _versions:
+        backend = onnx_backend.backend_for(name)
+        path = onnx_backend.onnx_path(name) if backend == "onnx" else native_path
+        try:
+            stat = os.stat(path) if path else None
+            tag = f"{stat.st_size}-{int(stat.st_mtime)}" if stat else "missing"
+        except OSError:
+            tag = "missing"
+        _versions[name] = f"{name}:{backend}:{tag}:{extra}"
+    return _versions[name]
+
+
+def cache_key(img_bytes: bytes, version: str) -> str:
+    digest = hashlib.blake2b(img_bytes, digest_size=20).hexdigest()
+    return f"{version}:{digest}"
+
+
+def cached_predict(img_bytes: bytes, version: str, predict: Callable[[], Any]) -> Any:
+    """Return the cached result for these bytes under `version`, computing it with `predict` on a miss."""
+    if not CACHE_ENABLED:
+        return predict()
+    key = cache_key(img_bytes, version)
+    result = _cache.get(key)
+    if result is None:
+        result = predict()
+        _cache.set(key, result)
+    return result
+
+
+def stats() -> Dict[str, Any]:
+    if not CACHE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **_cache.stats()}
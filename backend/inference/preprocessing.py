@@ -0,0 +1,104 @@
+"""
+Shared image decode and preprocessing for crop and pest inference.
+
+Phone uploads are ~12 MP, but the models only need 224x224. JPEGs are
+decoded with PIL's draft mode, which lets libjpeg scale by 1/2, 1/4 or 1/8
+during the DCT, so most of the full-resolution decode is never done. Other
+formats use `reducing_gap` for the same effect at resize time. Everything
+after decode is float32 and can write straight into a caller-provided
+(preallocated) buffer.
+"""
+from __future__ import annotations
+
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+CROP_SIZE = 224
+PEST_RESIZE = 256
+PEST_CROP = 224
+
+CROP_SHAPE: Tuple[int, ...] = (CROP_SIZE, CROP_SIZE, 3)  # HWC, scaled to [0, 1]
+PEST_SHAPE: Tuple[int, ...] = (3, PEST_CROP, PEST_CROP)  # CHW, ImageNet-normalised
+
+_IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32).reshape(3, 1, 1)
+_IMAGENET_INV_STD = (1.0 / np.array([0.229, 0.224, 0.225], dtype=np.float32)).reshape(3, 1, 1)
+
+ImageInput = Union[bytes, Image.Image]
+
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_pool() -> ThreadPoolExecutor:
+    """Process-wide decode pool (PIL and NumPy release the GIL for the heavy parts)."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="preprocess")
+    return _pool
+
+
+def open_image(img: ImageInput, min_size: Tuple[int, int]) -> Image.Image:
+    """Decode to RGB at no less than `min_size` (w, h), letting JPEG skip the full-resolution decode."""
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        img = Image.open(io.BytesIO(img))
+    if img.format == "JPEG":
+        img.draft("RGB", min_size)
+    return img.convert("RGB")
+
+
+def crop_array(img: ImageInput, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """(224, 224, 3) float32 in [0, 1], as expected by the crop-health Keras model."""
+    img = open_image(img, (CROP_SIZE, CROP_SIZE))
+    img = img.resize((CROP_SIZE, CROP_SIZE), reducing_gap=3.0)
+
+    if out is None:
+        out = np.empty(CROP_SHAPE, dtype=np.float32)
+    out[...] = np.asarray(img)
+    out *= np.float32(1.0 / 255.0)
+    return out
+
+
+def pest_array(img: ImageInput, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Resize(256) + CenterCrop(224) + ToTensor + Normalize, as (3, 224, 224) float32."""
+    img = open_image(img, (PEST_RESIZE, PEST_RESIZE))
+
+    w, h = img.size
+    if w <= h:
+        size = (PEST_RESIZE, int(PEST_RESIZE * h / w))
+    else:
+        size = (int(PEST_RESIZE * w / h), PEST_RESIZE)
+    img = img.resize(size, Image.BILINEAR, reducing_gap=3.0)
+
+    w, h = img.size
+    left = int(round((w - PEST_CROP) / 2.0))
+    top = int(round((h - PEST_CROP) / 2.0))
+    img = img.crop((left, top, left + PEST_CROP, top + PEST_CROP))
+
+    if out is None:
+        out = np.empty(PEST_SHAPE, dtype=np.float32)
+    out[...] = np.asarray(img).transpose(2, 0, 1)
+    out *= np.float32(1.0 / 255.0)
+    out -= _IMAGENET_MEAN
+    out *= _IMAGENET_INV_STD
+    return out
+
+
+def preprocess_batch(
+    images: Sequence[ImageInput],
+    fn: Callable[..., np.ndarray],
+    shape: Tuple[int, ...],
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Run `fn` over `images` on the shared pool, each writing into its row of one float32 batch."""
+    if out is None:
+        out = np.empty((len(images),) + tuple(shape), dtype=np.float32)
+    futures = [get_pool().submit(fn, img, out=out[i]) for i, img in enumerate(images)]
+    for future in futures:
+        future.result()
+    return out[: len(images)]
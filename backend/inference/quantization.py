@@ -0,0 +1,91 @@
+"""
+INT8 post-training quantization for the pest ResNet-50.
+
+- dynamic: weights of Linear layers are stored in INT8 and activations are
+  quantized on the fly. No calibration needed, but only the final fc layer
+  is affected, so the speedup on ResNet-50 is small.
+- static: FX graph-mode quantization of every conv/linear, calibrated on a
+  folder of representative images. This is the mode that gives the 2-4x
+  CPU speedup.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import torch
+from PIL import Image
+
+QUANTIZE_MODES = ("none", "dynamic", "static")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def _engine() -> str:
+    supported = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in supported:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError(f"No quantized engine available (supported: {supported})")
+
+
+def list_images(folder: Path) -> List[Path]:
+    """Images under `folder`, recursively, in a stable order."""
+    return sorted(p for p in Path(folder).rglob("*") if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def iter_batches(
+    paths: Sequence[Path],
+    transform: Callable[[Image.Image], torch.Tensor],
+    batch_size: int = 32,
+) -> Iterator[Tuple[List[Path], torch.Tensor]]:
+    for i in range(0, len(paths), batch_size):
+        chunk = paths[i : i + batch_size]
+        tensors = [transform(Image.open(p).convert("RGB")) for p in chunk]
+        yield list(chunk), torch.stack(tensors)
+
+
+def quantize_dynamic(model: torch.nn.Module) -> torch.nn.Module:
+    _engine()
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(
+    model: torch.nn.Module,
+    calibration_paths: Sequence[Path],
+    transform: Callable[[Image.Image], torch.Tensor],
+    max_images: Optional[int] = 256,
+) -> torch.nn.Module:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    if not calibration_paths:
+        raise ValueError("Static quantization needs calibration images")
+    if max_images:
+        calibration_paths = calibration_paths[:max_images]
+
+    engine = _engine()
+    model = model.eval()
+    example = (torch.randn(1, 3, 224, 224),)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), example_inputs=example)
+    with torch.inference_mode():
+        for _, batch in iter_batches(calibration_paths, transform):
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+def quantize(
+    model: torch.nn.Module,
+    mode: str,
+    transform: Callable[[Image.Image], torch.Tensor],
+    calibration_dir: Optional[Path] = None,
+) -> torch.nn.Module:
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r} (expected one of {QUANTIZE_MODES})")
+    if mode == "dynamic":
+        return quantize_dynamic(model)
+    if mode == "static":
+        if calibration_dir is None:
+            raise ValueError("PEST_QUANTIZE=static requires PEST_CALIBRATION_DIR")
+        return quantize_static(model, list_images(calibration_dir), transform)
+    return model
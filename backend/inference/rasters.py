@@ -0,0 +1,116 @@
+"""
+Windowed access to multi-band rasters that may be far larger than RAM.
+
+Every source exposes `shape` as (height, width, bands) and
+`read(row, col, height, width)` returning an (h, w, bands) float32 window.
+Only the requested window is ever read:
+
+- .npy files are memory-mapped (HWC, or CHW which is viewed as HWC lazily);
+- GeoTIFF/JP2 files are read window-by-window through rasterio.
+"""
+from __future__ import annotations
+
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+except ImportError:
+    rasterio = None  # type: ignore
+
+NPY_EXTENSIONS = (".npy",)
+GEOTIFF_EXTENSIONS = (".tif", ".tiff", ".jp2")
+MAX_BANDS = 64
+
+
+class NpyRaster:
+    def __init__(self, path: str, bands: Optional[Sequence[int]] = None, layout: str = "auto") -> None:
+        data = np.load(path, mmap_mode="r")
+        if data.ndim == 2:
+            data = data[:, :, np.newaxis]
+        if data.ndim != 3:
+            raise ValueError(f"Expected a 2-D or 3-D array, got shape {data.shape}")
+        if layout == "auto":
+            # Band-first arrays (C, H, W) are common for satellite stacks; small rasters need an explicit layout
+            layout = "chw" if data.shape[0] <= MAX_BANDS < min(data.shape[1], data.shape[2]) else "hwc"
+        if layout == "chw":
+            # View as HWC without copying
+            data = data.transpose(1, 2, 0)
+        elif layout != "hwc":
+            raise ValueError("layout must be auto, hwc or chw")
+        self.data = data
+        # Optional 0-based band subset, applied per window so the memmap is never copied whole
+        self.bands: Optional[List[int]] = list(bands) if bands is not None else None
+        n_bands = len(self.bands) if self.bands is not None else data.shape[2]
+        self.shape: Tuple[int, int, int] = (data.shape[0], data.shape[1], n_bands)
+
+    def read(self, row: int, col: int, height: int, width: int) -> np.ndarray:
+        window = self.data[row : row + height, col : col + width, :]
+        if self.bands is not None:
+            window = window[:, :, self.bands]
+        # Always a writable copy: callers scale/normalise windows in place
+        return np.array(window, dtype=np.float32)
+
+    def close(self) -> None:
+        # Drop the memmap so the file can be removed (required on Windows)
+        self.data = None
+
+
+class GeoTiffRaster:
+    def __init__(self, path: str, bands: Optional[Sequence[int]] = None) -> None:
+        if rasterio is None:
+            raise RuntimeError("rasterio is required to read GeoTIFF/JP2 rasters")
+        self.src = rasterio.open(path)
+        self.bands: List[int] = list(bands) if bands else list(range(1, self.src.count + 1))
+        self.shape = (self.src.height, self.src.width, len(self.bands))
+        self.transform = self.src.transform
+        self.crs = self.src.crs
+
+    def read(self, row: int, col: int, height: int, width: int) -> np.ndarray:
+        window = Window(col, row, width, height)
+        data = self.src.read(self.bands, window=window, out_dtype="float32")
+        return np.ascontiguousarray(data.transpose(1, 2, 0))
+
+    def close(self) -> None:
+        self.src.close()
+
+
+def open_raster(path: str, bands: Optional[Sequence[int]] = None, layout: str = "auto"):
+    """Open a raster; `bands` selects 0-based bands (default: all), `layout` applies to .npy only."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in NPY_EXTENSIONS:
+        return NpyRaster(path, bands, layout)
+    if ext in GEOTIFF_EXTENSIONS:
+        return GeoTiffRaster(path, [b + 1 for b in bands] if bands is not None else None)
+    raise ValueError(f"Unsupported raster format: {ext} (expected .npy, .tif, .tiff or .jp2)")
+
+
+def window_origins(length: int, size: int, overlap: int = 0) -> List[int]:
+    """Start offsets covering [0, length) with windows of `size`; the last window is flush with the edge."""
+    if not 0 <= overlap < size:
+        raise ValueError("overlap must be in [0, size)")
+    if length <= size:
+        return [0]
+    stride = size - overlap
+    origins = list(range(0, length - size + 1, stride))
+    if origins[-1] != length - size:
+        origins.append(length - size)
+    return origins
+
+
+def iter_windows(
+    height: int, width: int, size: int, overlap: int = 0
+) -> Iterator[Tuple[int, int, int, int]]:
+    """Yield (grid_row, grid_col, row, col) in row-major order."""
+    for gi, row in enumerate(window_origins(height, size, overlap)):
+        for gj, col in enumerate(window_origins(width, size, overlap)):
+            yield gi, gj, row, col
+
+
+def iter_blocks(height: int, block_rows: int) -> Iterator[Tuple[int, int]]:
+    """Yield (row, nrows) strips covering `height`, for full-width chunked passes."""
+    for row in range(0, height, block_rows):
+        yield row, min(block_rows, height - row)
@@ -0,0 +1,138 @@
+"""
+Lazy model registry.
+
+Models are registered by name with a "module:attribute" loader path and are
+only imported and loaded the first time `get(name)` is called, so booting
+the app never pays for TensorFlow/Torch unless a request needs them.
+"""
+from __future__ import annotations
+
+import importlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+Loader = Union[str, Callable[[], Any]]
+
+_loaders: Dict[str, Loader] = {
+    "pest": ".pest_model:load_model",
+    "crop": ".crop_model:_load_model",
+    "multispectral": ".multispectral_model:_load_model",
+    "hyperspectral": ".hyperspectral_model:_load_model",
+    "chat_embedder": "backend.semantic_cache:load_embedder",
+}
+# Used only by offline scripts (scripts/classify_hyperspectral.py), never by a request;
+# "all" and automatic preloading skip them, naming one explicitly still loads it
+_offline = {"hyperspectral"}
+_models: Dict[str, Any] = {}
+_load_times: Dict[str, float] = {}
+_errors: Dict[str, str] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def register(name: str, loader: Loader) -> None:
+    with _registry_lock:
+        _loaders[name] = loader
+        _models.pop(name, None)
+
+
+def _resolve(loader: Loader) -> Callable[[], Any]:
+    if callable(loader):
+        return loader
+    module_path, _, attr_path = loader.partition(":")
+    obj: Any = importlib.import_module(module_path, __package__)
+    for attr in attr_path.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _lock_for(name: str) -> threading.Lock:
+    with _registry_lock:
+        if name not in _loaders:
+            raise KeyError(f"Unknown model: {name}")
+        return _locks.setdefault(name, threading.Lock())
+
+
+def get(name: str) -> Any:
+    """Return the loaded model, loading it on first use (once, even under concurrency)."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _lock_for(name):
+        model = _models.get(name)
+        if model is None:
+            start = time.perf_counter()
+            try:
+                model = _resolve(_loaders[name])()
+            except Exception as exc:
+                _errors[name] = str(exc)
+                raise
+            _models[name] = model
+            _load_times[name] = round(time.perf_counter() - start, 3)
+            _errors.pop(name, None)
+            print(f"Model '{name}' loaded in {_load_times[name]}s")
+    return model
+
+
+def reset_after_fork() -> None:
+    """Fresh locks in a forked child; models already loaded by the parent are kept (shared copy-on-write)."""
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    _locks.clear()
+
+
+def is_loaded(name: str) -> bool:
+    return name in _models
+
+
+def served() -> List[str]:
+    """Registered models that requests can use (everything but the offline ones)."""
+    return [name for name in _loaders if name not in _offline]
+
+
+def status() -> Dict[str, Dict[str, Any]]:
+    return {
+        name: {
+            "loaded": name in _models,
+            "load_seconds": _load_times.get(name),
+            "error": _errors.get(name),
+        }
+        for name in _loaders
+    }
+
+
+def warm_up(names: Optional[Iterable[str]] = None, background: bool = True) -> Optional[threading.Thread]:
+    """Load `names` (default: all registered models) now, optionally on a daemon thread."""
+    targets = list(names) if names is not None else list(_loaders)
+
+    def run() -> None:
+        for name in targets:
+            try:
+                get(name)
+            except Exception as exc:
+                print(f"Warm-up failed for model '{name}': {exc}")
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def warm_up_from_env(exclude: Iterable[str] = ()) -> Optional[threading.Thread]:
+    """
+    MODEL_WARMUP: comma-separated model names, or "all" (every served model). Empty disables warm-up.
+    MODEL_WARMUP_BACKGROUND: load on a background thread (default) or block startup.
+    `exclude` skips models that are loaded elsewhere (e.g. in worker processes).
+    """
+    spec = os.getenv("MODEL_WARMUP", "").strip()
+    if not spec:
+        return None
+    names = served() if spec.lower() == "all" else [n.strip() for n in spec.split(",") if n.strip()]
+    names = [n for n in names if n not in set(exclude)]
+    background = os.getenv("MODEL_WARMUP_BACKGROUND", "1").lower() not in ("0", "false", "no")
+    return warm_up(names, background=background)
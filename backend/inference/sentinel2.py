@@ -0,0 +1,256 @@
+"""
+Sentinel-2 .SAFE ingestion.
+
+Parses a local L1C or L2A product, reads only the requested bands over a
+farm's bounding box, resamples 20 m / 60 m bands onto the 10 m grid, and
+writes an (H, W, bands) float32 stack to a memory-mapped .npy file one
+row block at a time, so a full 10980x10980 tile is never held in memory.
+
+The default bands (B02, B03, B04, B08) give exactly the 4-band stack that
+`predict_multispectral` / `predict_raster` expect. Values stay as raw
+digital numbers, like the notebook the multispectral model was trained
+from; `harmonize=True` applies the L2A BOA_ADD_OFFSET of processing
+baseline 04.00+ so that DN / 10000 is surface reflectance, and
+`mask_clouds=True` sets pixels the L2A scene classification (SCL) marks as
+cloud, cloud shadow, cirrus, no-data or defective to NaN in every band.
+"""
+from __future__ import annotations
+
+import glob
+import os
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.errors import WindowError
+    from rasterio.warp import transform_bounds
+    from rasterio.windows import Window, from_bounds
+    from rasterio.windows import bounds as window_bounds
+except ImportError:
+    rasterio = None  # type: ignore
+
+DEFAULT_BANDS = ("B02", "B03", "B04", "B08")
+BLOCK_ROWS = int(os.getenv("SENTINEL2_BLOCK_ROWS", "1024"))
+
+_BAND_FILE = re.compile(r"_(B\d[\dA]|SCL|AOT|WVP|TCI)(?:_(\d+)m)?\.jp2$", re.IGNORECASE)
+
+# Band names understood by vegetation_indices
+BAND_ROLES = {"B02": "blue", "B03": "green", "B04": "red", "B05": "rededge", "B08": "nir"}
+
+# Native resolution of each band, used for L1C products whose file names carry no resolution
+NATIVE_RESOLUTION = {
+    "B01": 60, "B02": 10, "B03": 10, "B04": 10, "B05": 20, "B06": 20, "B07": 20,
+    "B08": 10, "B8A": 20, "B09": 60, "B10": 60, "B11": 20, "B12": 20,
+}
+
+# SCL classes masked by mask_clouds: no data, saturated/defective, cloud shadow,
+# cloud (medium and high probability) and thin cirrus
+MASKED_SCL_CLASSES = (0, 1, 3, 8, 9, 10)
+
+
+@dataclass
+class SafeProduct:
+    path: str
+    level: str
+    tile_id: Optional[str]
+    sensing_time: Optional[str]
+    # band -> {resolution_m: jp2 path}
+    bands: Dict[str, Dict[int, str]] = field(default_factory=dict)
+    # band -> BOA_ADD_OFFSET (L2A baseline >= 04.00)
+    offsets: Dict[str, float] = field(default_factory=dict)
+    # resolution_m -> scene classification (SCL) jp2 path, L2A only
+    scl: Dict[int, str] = field(default_factory=dict)
+
+    def band_path(self, band: str) -> Tuple[str, int]:
+        """Finest-resolution file for `band`."""
+        band = band.upper()
+        if band not in self.bands:
+            raise ValueError(f"Band {band} not found in {os.path.basename(self.path)}")
+        resolution = min(self.bands[band])
+        return self.bands[band][resolution], resolution
+
+
+def _normalize_band(name: str) -> str:
+    """'B1' -> 'B01', '8A' -> 'B8A'."""
+    name = name.upper().lstrip("B")
+    return f"B{name.zfill(2)}" if name.isdigit() else f"B{name}"
+
+
+def _parse_metadata(safe_path: str) -> Tuple[str, Dict[str, float], Optional[str]]:
+    for level in ("MSIL2A", "MSIL1C"):
+        mtd = os.path.join(safe_path, f"MTD_{level}.xml")
+        if os.path.exists(mtd):
+            break
+    else:
+        return ("L2A" if "MSIL2A" in safe_path.upper() else "L1C"), {}, None
+
+    root = ET.parse(mtd).getroot()
+    sensing = next((el.text for el in root.iter() if el.tag.endswith("PRODUCT_START_TIME")), None)
+
+    # BOA_ADD_OFFSET is keyed by band_id (0..12); Spectral_Information maps ids to names like "B1", "B8A"
+    band_names = {}
+    for el in root.iter():
+        if el.tag.endswith("Spectral_Information") and "bandId" in el.attrib:
+            band_names[el.attrib["bandId"]] = _normalize_band(el.attrib.get("physicalBand", ""))
+    offsets = {}
+    for el in root.iter():
+        if el.tag.endswith("BOA_ADD_OFFSET") and el.text:
+            name = band_names.get(el.attrib.get("band_id", ""))
+            if name:
+                offsets[name] = float(el.text)
+    return level[-3:], offsets, sensing
+
+
+def parse_safe(safe_path: str) -> SafeProduct:
+    """Index the band files of a local .SAFE product directory."""
+    if not os.path.isdir(safe_path):
+        raise FileNotFoundError(f"Not a .SAFE directory: {safe_path}")
+
+    level, offsets, sensing = _parse_metadata(safe_path)
+    jp2_files = glob.glob(os.path.join(safe_path, "GRANULE", "*", "IMG_DATA", "**", "*.jp2"), recursive=True)
+    if not jp2_files:
+        raise ValueError(f"No band images found under {safe_path}/GRANULE/*/IMG_DATA")
+
+    product = SafeProduct(path=safe_path, level=level, tile_id=None, sensing_time=sensing, offsets=offsets)
+    for path in jp2_files:
+        match = _BAND_FILE.search(os.path.basename(path))
+        if not match:
+            continue
+        band = match.group(1).upper()
+        if band == "SCL" and match.group(2):
+            product.scl[int(match.group(2))] = path
+            continue
+        if band in ("SCL", "AOT", "WVP", "TCI"):
+            continue
+        resolution = int(match.group(2)) if match.group(2) else NATIVE_RESOLUTION.get(band, 10)
+        product.bands.setdefault(band, {})[resolution] = path
+        if product.tile_id is None:
+            product.tile_id = os.path.basename(path).split("_")[0]
+    return product
+
+
+def _reference_grid(product: SafeProduct):
+    """Any 10 m band defines the output grid."""
+    for band in ("B02", "B03", "B04", "B08"):
+        if band in product.bands and 10 in product.bands[band]:
+            return rasterio.open(product.bands[band][10])
+    raise ValueError("Product has no 10 m band to use as the reference grid")
+
+
+def bbox_window(ref, bbox: Optional[Sequence[float]], bbox_crs: Optional[str]) -> "Window":
+    """Pixel window on the reference grid covering `bbox` (minx, miny, maxx, maxy), clipped to the tile."""
+    full = Window(0, 0, ref.width, ref.height)
+    if bbox is None:
+        return full
+    if bbox_crs and str(bbox_crs).upper() != str(ref.crs).upper():
+        bbox = transform_bounds(bbox_crs, ref.crs, *bbox, densify_pts=21)
+    window = from_bounds(*bbox, transform=ref.transform).round_offsets().round_lengths()
+    try:
+        window = window.intersection(full)
+    except WindowError:
+        window = None
+    if window is None or window.width <= 0 or window.height <= 0:
+        raise ValueError("Bounding box does not intersect the tile")
+    return window
+
+
+def ingest(
+    safe_path: str,
+    out_path: str,
+    bbox: Optional[Sequence[float]] = None,
+    bbox_crs: Optional[str] = None,
+    bands: Sequence[str] = DEFAULT_BANDS,
+    harmonize: bool = False,
+    block_rows: int = BLOCK_ROWS,
+    mask_clouds: bool = False,
+) -> Dict[str, object]:
+    """
+    Write the (H, W, len(bands)) float32 stack for `bbox` to `out_path` (.npy).
+
+    bbox is in the tile's CRS unless `bbox_crs` is given (e.g. "EPSG:4326"
+    for lon/lat). Returns metadata including the output geotransform.
+    """
+    if rasterio is None:
+        raise RuntimeError("rasterio is required to read Sentinel-2 .SAFE products")
+
+    product = parse_safe(safe_path)
+    if mask_clouds and not product.scl:
+        raise ValueError("mask_clouds needs the SCL band of an L2A product")
+    bands = [b.upper() for b in bands]
+    sources = []
+    masked = 0
+    try:
+        ref = _reference_grid(product)
+        sources.append(ref)
+        window = bbox_window(ref, bbox, bbox_crs)
+        height, width = int(window.height), int(window.width)
+        out_transform = ref.window_transform(window)
+
+        band_sources = []
+        for band in bands:
+            path, resolution = product.band_path(band)
+            src = rasterio.open(path)
+            sources.append(src)
+            band_sources.append((band, src, resolution))
+        scl = None
+        if mask_clouds:
+            scl = rasterio.open(product.scl[min(product.scl)])
+            sources.append(scl)
+
+        stack = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32, shape=(height, width, len(bands)))
+        for row in range(0, height, block_rows):
+            nrows = min(block_rows, height - row)
+            block = Window(window.col_off, window.row_off + row, width, nrows)
+            block_bounds = window_bounds(block, ref.transform)
+            for i, (band, src, resolution) in enumerate(band_sources):
+                if resolution == 10 and src.transform == ref.transform:
+                    data = src.read(1, window=block, out_dtype="float32")
+                else:
+                    # Coarser band: read the matching (fractional) window and resample onto the 10 m block
+                    src_window = from_bounds(*block_bounds, transform=src.transform)
+                    data = src.read(
+                        1,
+                        window=src_window,
+                        out_shape=(nrows, width),
+                        resampling=Resampling.bilinear,
+                        out_dtype="float32",
+                    )
+                if harmonize and band in product.offsets:
+                    data += np.float32(product.offsets[band])
+                stack[row : row + nrows, :, i] = data
+            if scl is not None:
+                # Class labels must not be interpolated, so the 20 m SCL is resampled nearest-neighbour
+                classes = scl.read(
+                    1,
+                    window=from_bounds(*block_bounds, transform=scl.transform),
+                    out_shape=(nrows, width),
+                    resampling=Resampling.nearest,
+                )
+                cloudy = np.isin(classes, MASKED_SCL_CLASSES)
+                stack[row : row + nrows][cloudy] = np.nan
+                masked += int(cloudy.sum())
+        stack.flush()
+        del stack
+    finally:
+        for src in sources:
+            src.close()
+
+    return {
+        "product": os.path.basename(os.path.normpath(safe_path)),
+        "level": product.level,
+        "tile_id": product.tile_id,
+        "sensing_time": product.sensing_time,
+        "bands": bands,
+        "shape": [height, width, len(bands)],
+        "crs": str(ref.crs),
+        "transform": list(out_transform)[:6],
+        "harmonized": bool(harmonize and product.offsets),
+        "masked_fraction": round(masked / (height * width), 4) if mask_clouds else None,
+        "output": out_path,
+    }
@@ -0,0 +1,294 @@
+"""
+Vegetation indices over multi-band rasters, computed in bounded memory.
+
+The raster is processed in full-width row strips sized from
+VEGETATION_MEMORY_MB, so a 10980x10980 Sentinel-2 tile never needs more
+than one strip of bands plus one strip per index in memory. All arithmetic
+is float32 with `out=` into buffers that are reused across strips; there is
+no per-pixel Python. Summary statistics (and optional per-field statistics
+from a label raster) are accumulated strip by strip.
+
+Default band order matches the notebook's stack: B02, B03, B04, B08
+(blue, green, red, nir). NDRE also needs a red-edge band (e.g. B05).
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import rasters
+
+DEFAULT_BANDS = ("blue", "green", "red", "nir")
+MEMORY_BUDGET_MB = float(os.getenv("VEGETATION_MEMORY_MB", "256"))
+
+# Sentinel-2 L2A digital numbers -> surface reflectance; SAVI and EVI need reflectance
+REFLECTANCE_SCALE = 1.0 / 10000.0
+SAVI_L = 0.5
+
+# Default percentile histogram range (an index may set its own); values outside it are clipped into the edge bins
+HIST_BINS = 400
+HIST_RANGE = (-1.0, 1.0)
+
+# Same thresholds the multispectral model's training labels were derived from
+NDVI_HEALTH = ((0.6, "Healthy"), (0.4, "Medium"), (0.2, "Stressed"))
+
+
+def _normalized_difference(a: np.ndarray, b: np.ndarray, out: np.ndarray, tmp: np.ndarray) -> np.ndarray:
+    np.subtract(a, b, out=out)
+    np.add(a, b, out=tmp)
+    return np.divide(out, tmp, out=out)
+
+
+def _ndvi(b, out, tmp):
+    return _normalized_difference(b["nir"], b["red"], out, tmp)
+
+
+def _ndre(b, out, tmp):
+    return _normalized_difference(b["nir"], b["rededge"], out, tmp)
+
+
+def _gndvi(b, out, tmp):
+    return _normalized_difference(b["nir"], b["green"], out, tmp)
+
+
+def _savi(b, out, tmp):
+    np.subtract(b["nir"], b["red"], out=out)
+    out *= np.float32(1.0 + SAVI_L)
+    np.add(b["nir"], b["red"], out=tmp)
+    tmp += np.float32(SAVI_L)
+    return np.divide(out, tmp, out=out)
+
+
+def _evi(b, out, tmp):
+    # 2.5 * (NIR - R) / (NIR + 6R - 7.5B + 1)
+    np.multiply(b["red"], np.float32(6.0), out=tmp)
+    tmp += b["nir"]
+    np.multiply(b["blue"], np.float32(7.5), out=out)
+    tmp -= out
+    tmp += np.float32(1.0)
+    np.subtract(b["nir"], b["red"], out=out)
+    out *= np.float32(2.5)
+    return np.divide(out, tmp, out=out)
+
+
+INDICES: Dict[str, Dict[str, Any]] = {
+    "ndvi": {"fn": _ndvi, "bands": ("nir", "red")},
+    "ndre": {"fn": _ndre, "bands": ("nir", "rededge")},
+    "gndvi": {"fn": _gndvi, "bands": ("nir", "green")},
+    "savi": {"fn": _savi, "bands": ("nir", "red"), "range": (-1.0 - SAVI_L, 1.0 + SAVI_L)},
+    # Unbounded where the denominator nears zero (bright bare soil, cloud edges)
+    "evi": {"fn": _evi, "bands": ("nir", "red", "blue"), "range": (-2.5, 2.5)},
+}
+
+
+class _Stats:
+    """Streaming count/mean/std/min/max plus a fixed-range histogram for percentiles."""
+
+    def __init__(self, hist_range: Tuple[float, float] = HIST_RANGE) -> None:
+        self.hist_range = hist_range
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.hist = np.zeros(HIST_BINS, dtype=np.int64)
+
+    def update(self, values: np.ndarray, square: np.ndarray) -> None:
+        """`values` is clipped in place; `square` is scratch of the same size."""
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.total += float(values.sum(dtype=np.float64))
+        self.total_sq += float(np.square(values, out=square).sum(dtype=np.float64))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        # Out-of-range values land in the edge bins rather than dropping out of the percentiles
+        lo, hi = self.hist_range
+        np.clip(values, lo, hi, out=values)
+        self.hist += np.histogram(values, bins=HIST_BINS, range=self.hist_range)[0]
+
+    def percentile(self, q: float) -> Optional[float]:
+        in_range = self.hist.sum()
+        if not in_range:
+            return None
+        cdf = np.cumsum(self.hist)
+        idx = int(np.searchsorted(cdf, q / 100.0 * in_range))
+        lo, hi = self.hist_range
+        return round(lo + (idx + 0.5) * (hi - lo) / HIST_BINS, 4)
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        mean = self.total / self.count
+        var = max(self.total_sq / self.count - mean * mean, 0.0)
+        return {
+            "count": self.count,
+            "mean": round(mean, 4),
+            "std": round(var ** 0.5, 4),
+            "min": round(self.min, 4),
+            "max": round(self.max, 4),
+            "p10": self.percentile(10),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+        }
+
+
+class _FieldStats:
+    """Per-field count/mean/std via bincount over an integer label raster (0 = no field)."""
+
+    def __init__(self) -> None:
+        self.count = np.zeros(0, dtype=np.int64)
+        self.total = np.zeros(0, dtype=np.float64)
+        self.total_sq = np.zeros(0, dtype=np.float64)
+
+    def update(self, labels: np.ndarray, values: np.ndarray) -> None:
+        if labels.size == 0:
+            return
+        n = int(labels.max()) + 1
+        if n > len(self.count):
+            grow = n - len(self.count)
+            self.count = np.concatenate([self.count, np.zeros(grow, dtype=np.int64)])
+            self.total = np.concatenate([self.total, np.zeros(grow)])
+            self.total_sq = np.concatenate([self.total_sq, np.zeros(grow)])
+        # One float64 copy, squared in place after the sums (bincount would convert float32 weights anyway)
+        weights = values.astype(np.float64)
+        self.count[:n] += np.bincount(labels, minlength=n)
+        self.total[:n] += np.bincount(labels, weights=weights, minlength=n)
+        self.total_sq[:n] += np.bincount(labels, weights=np.square(weights, out=weights), minlength=n)
+
+    def summary(self, health: bool = False) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for field_id in np.nonzero(self.count)[0]:
+            if field_id == 0:
+                continue
+            n = int(self.count[field_id])
+            mean = self.total[field_id] / n
+            var = max(self.total_sq[field_id] / n - mean * mean, 0.0)
+            entry: Dict[str, Any] = {"count": n, "mean": round(float(mean), 4), "std": round(float(var ** 0.5), 4)}
+            if health:
+                entry["health"] = ndvi_health(mean)
+            out[str(int(field_id))] = entry
+        return out
+
+
+def ndvi_health(mean_ndvi: float) -> str:
+    for threshold, label in NDVI_HEALTH:
+        if mean_ndvi > threshold:
+            return label
+    return "Diseased"
+
+
+def block_rows_for(width: int, n_bands: int, fields: bool = False, budget_mb: float = MEMORY_BUDGET_MB) -> int:
+    # Indices are computed one at a time into shared buffers, so per pixel: band strip + index
+    # output + scratch + validity mask + compacted valid values + their square
+    bytes_per_pixel = 4 * n_bands + 4 + 4 + 1 + 4 + 4
+    if fields:
+        # label read (float32) + int64 labels + their valid subset + float64 weights
+        bytes_per_pixel += 4 + 8 + 8 + 8
+    return max(1, int(budget_mb * 1024 * 1024 // (width * bytes_per_pixel)))
+
+
+def compute_indices(
+    source,
+    indices: Sequence[str] = ("ndvi", "savi", "evi", "gndvi"),
+    band_order: Sequence[str] = DEFAULT_BANDS,
+    scale: float = REFLECTANCE_SCALE,
+    fields=None,
+    preview_size: int = 0,
+    output_dir: Optional[str] = None,
+    budget_mb: float = MEMORY_BUDGET_MB,
+) -> Dict[str, Any]:
+    """
+    Compute `indices` over a raster source (see inference/rasters.py).
+
+    fields: optional single-band label raster of the same size; per-field
+        statistics are returned for every non-zero label.
+    preview_size: if > 0, include a strided preview of each index no larger
+        than preview_size on its longest side.
+    output_dir: if set, write full-resolution float32 <index>.npy maps there
+        (as memory-mapped files, one strip at a time).
+    """
+    indices = [name.lower() for name in indices]
+    band_order = [name.lower() for name in band_order]
+    unknown = [name for name in indices if name not in INDICES]
+    if unknown:
+        raise ValueError(f"Unknown indices: {', '.join(unknown)} (available: {', '.join(INDICES)})")
+
+    height, width, n_bands = source.shape
+    if len(band_order) != n_bands:
+        raise ValueError(f"band_order names {len(band_order)} bands but the raster has {n_bands}")
+    for name in indices:
+        missing = [b for b in INDICES[name]["bands"] if b not in band_order]
+        if missing:
+            raise ValueError(f"{name.upper()} needs band(s) {', '.join(missing)}; raster bands are {', '.join(band_order)}")
+    if fields is not None and fields.shape[:2] != (height, width):
+        raise ValueError("fields raster must have the same height and width as the band raster")
+
+    step = max(1, -(-max(height, width) // preview_size)) if preview_size > 0 else 0
+    rows = block_rows_for(width, n_bands, fields is not None, budget_mb)
+    if step:
+        rows = max(step, rows - rows % step)
+
+    stats = {name: _Stats(INDICES[name].get("range", HIST_RANGE)) for name in indices}
+    field_stats = {name: _FieldStats() for name in indices} if fields is not None else None
+    previews = {name: [] for name in indices} if step else None
+    maps = {}
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        for name in indices:
+            maps[name] = np.lib.format.open_memmap(
+                os.path.join(output_dir, f"{name}.npy"), mode="w+", dtype=np.float32, shape=(height, width)
+            )
+
+    out = np.empty((rows, width), dtype=np.float32)
+    tmp = np.empty((rows, width), dtype=np.float32)
+    square = np.empty(rows * width, dtype=np.float32)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for row, nrows in rasters.iter_blocks(height, rows):
+            strip = source.read(row, 0, nrows, width)
+            if scale != 1.0:
+                strip *= np.float32(scale)
+            bands = {name: strip[:, :, i] for i, name in enumerate(band_order)}
+            labels = None
+            if fields is not None:
+                labels = fields.read(row, 0, nrows, width)[:, :, 0].astype(np.int64)
+
+            for name in indices:
+                values = INDICES[name]["fn"](bands, out[:nrows], tmp[:nrows])
+                valid = np.isfinite(values)
+                flat = values[valid]
+                if field_stats is not None:
+                    field_stats[name].update(labels[valid], flat)
+                # Last: clips `flat` in place
+                stats[name].update(flat, square[: flat.size])
+                if previews is not None:
+                    first = (-row) % step
+                    previews[name].append(values[first::step, ::step].copy())
+                if name in maps:
+                    maps[name][row : row + nrows] = values
+
+    for mm in maps.values():
+        mm.flush()
+
+    result: Dict[str, Any] = {
+        "raster_shape": [height, width, n_bands],
+        "band_order": band_order,
+        "block_rows": rows,
+        "indices": {name: stats[name].summary() for name in indices},
+    }
+    if "ndvi" in stats and stats["ndvi"].count:
+        result["ndvi_health"] = ndvi_health(result["indices"]["ndvi"]["mean"])
+    if field_stats is not None:
+        result["fields"] = {name: field_stats[name].summary(health=(name == "ndvi")) for name in indices}
+    if previews is not None:
+        result["preview_step"] = step
+        result["previews"] = {
+            name: np.round(np.nan_to_num(np.concatenate(parts), nan=0.0), 3).tolist()
+            for name, parts in previews.items()
+        }
+    if output_dir:
+        result["outputs"] = {name: os.path.join(output_dir, f"{name}.npy") for name in indices}
+    return result
@@ -0,0 +1,15 @@
+"""
+Entry point of a spawned model worker (see workers.py).
+
+This module must not import numpy, Torch or TensorFlow: the child applies
+its thread limits here, before workers.py (and numpy) is imported, because
+OpenBLAS/MKL read them only once, at load time.
+"""
+import os
+
+
+def main(env, *args) -> None:
+    os.environ.update(env)
+    from .workers import _worker_main
+
+    _worker_main(*args)
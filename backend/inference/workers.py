@@ -0,0 +1,355 @@
+"""
+Process-pool model workers.
+
+With MODEL_WORKERS set (e.g. "pest=4,crop=2,multispectral=1"), each listed
+model is served by dedicated worker processes instead of the Flask process.
+The counts are for the whole server: under gunicorn each worker process
+starts its share (at least one per model) and, with affinity, its own
+block of cores. Every model worker:
+
+- is started with the "spawn" method, so it never inherits a half-initialised
+  Torch/TensorFlow runtime from the parent;
+- pins its framework thread pools to MODEL_WORKER_THREADS (OMP/MKL/OpenBLAS,
+  TF intra-op, ONNX Runtime, Torch): the child sets the variables in
+  worker_boot.py before it imports numpy, leaving the parent's environment
+  untouched.
+  With MODEL_WORKER_AFFINITY=1 it is bound to its own block of cores, so
+  Torch and TensorFlow no longer oversubscribe the machine;
+- owns a shared-memory input buffer of MODEL_WORKER_MAX_BATCH samples.
+  Handlers write preprocessed float32 arrays straight into it and send only
+  the batch size over a pipe; only the (small) results are pickled back.
+
+Handler threads check a worker out of an idle queue, so a pool of N
+workers serves N batches at once. A worker that dies, or does not answer
+within MODEL_WORKER_TIMEOUT (MODEL_WORKER_LOAD_TIMEOUT while loading), is
+killed and respawned.
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import get_context
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from . import preprocessing, worker_boot
+
+WORKER_SPEC = os.getenv("MODEL_WORKERS", "").strip()
+THREADS = int(os.getenv("MODEL_WORKER_THREADS", "0"))  # 0: split the cores evenly across all workers
+AFFINITY = os.getenv("MODEL_WORKER_AFFINITY", "0").lower() in ("1", "true", "yes")
+MAX_BATCH = int(os.getenv("MODEL_WORKER_MAX_BATCH", "64"))
+TIMEOUT = float(os.getenv("MODEL_WORKER_TIMEOUT", "60"))
+LOAD_TIMEOUT = float(os.getenv("MODEL_WORKER_LOAD_TIMEOUT", "300"))
+
+# name -> (batch function run inside the worker, per-sample shape)
+TARGETS: Dict[str, Tuple[str, Tuple[int, ...]]] = {
+    "pest": (".pest_model:predict_arrays", preprocessing.PEST_SHAPE),
+    "crop": (".crop_model:predict_crop_health_batch", preprocessing.CROP_SHAPE),
+    "multispectral": (".multispectral_model:predict_probabilities", (224, 224, 4)),
+}
+
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "ORT_INTRA_OP_THREADS")
+
+_pools: Dict[str, "ModelWorkerPool"] = {}
+_pools_lock = threading.Lock()
+_in_worker = False
+# (this server process's slot, number of slots); see set_slot
+_slot = (0, 1)
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def parse_spec(spec: str) -> Dict[str, int]:
+    """'pest=4,crop=2' -> {'pest': 4, 'crop': 2}."""
+    counts: Dict[str, int] = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, count = part.partition("=")
+        name = name.strip().lower()
+        if name not in TARGETS:
+            raise ValueError(f"MODEL_WORKERS: unknown model '{name}' (available: {', '.join(TARGETS)})")
+        counts[name] = max(1, int(count or 1))
+    return counts
+
+
+def _thread_env(threads: int) -> Dict[str, str]:
+    env = {var: str(threads) for var in _THREAD_ENV_VARS}
+    env.update(TF_NUM_INTEROP_THREADS="1", ORT_INTER_OP_THREADS="1")
+    return env
+
+
+def _worker_main(name: str, target: str, shm_name: str, shape: Tuple[int, ...], max_batch: int,
+                 threads: int, cpus: Optional[List[int]], conn) -> None:
+    global _in_worker
+    _in_worker = True
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    inputs = np.ndarray((max_batch,) + tuple(shape), dtype=np.float32, buffer=shm.buf)
+    try:
+        from . import registry
+
+        start = time.perf_counter()
+        fn = registry._resolve(target)
+        registry.get(name)
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(threads)
+        conn.send(("ready", round(time.perf_counter() - start, 3)))
+    except Exception as exc:
+        conn.send(("error", f"{type(exc).__name__}: {exc}"))
+        del inputs
+        shm.close()
+        return
+
+    while True:
+        try:
+            command, n = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if command == "stop":
+            break
+        try:
+            conn.send(("ok", fn(inputs[:n])))
+        except Exception as exc:
+            conn.send(("error", f"{type(exc).__name__}: {exc}"))
+    del inputs
+    shm.close()
+
+
+class _Worker:
+    def __init__(self, pool: "ModelWorkerPool", index: int) -> None:
+        self.pool = pool
+        self.index = index
+        self.cpus = pool.cpu_sets[index] if pool.cpu_sets else None
+        size = pool.max_batch * int(np.prod(pool.shape)) * 4
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.inputs = np.ndarray((pool.max_batch,) + pool.shape, dtype=np.float32, buffer=self.shm.buf)
+        self.conn, child_conn = pool.ctx.Pipe()
+        self.process = pool.ctx.Process(
+            target=worker_boot.main,
+            args=(
+                _thread_env(pool.threads),
+                pool.name, pool.target, self.shm.name, pool.shape, pool.max_batch, pool.threads, self.cpus, child_conn,
+            ),
+            name=f"{pool.name}-worker-{index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        self.hung = False
+        self.load_seconds: Optional[float] = None
+
+    def _recv(self, timeout: float) -> Tuple[str, Any]:
+        try:
+            # A dead child closes its end, so poll returns at once and recv raises EOFError
+            if not self.conn.poll(timeout):
+                # A late reply would be read as the answer to the next batch; the worker must go
+                self.hung = True
+                self.process.kill()
+                raise WorkerError(f"{self.process.name} did not answer within {timeout:g}s")
+            return self.conn.recv()
+        except (EOFError, OSError) as exc:
+            raise WorkerError(f"{self.process.name} exited (code {self.process.exitcode})") from exc
+
+    def wait_ready(self) -> None:
+        if self.ready:
+            return
+        status, payload = self._recv(self.pool.load_timeout)
+        if status != "ready":
+            raise WorkerError(f"{self.process.name} failed to load '{self.pool.name}': {payload}")
+        self.ready = True
+        self.load_seconds = payload
+
+    def call(self, batch: Union[np.ndarray, Sequence[np.ndarray]]) -> Any:
+        self.wait_ready()
+        n = len(batch)
+        if isinstance(batch, np.ndarray):
+            self.inputs[:n] = batch
+        else:
+            for i, sample in enumerate(batch):
+                self.inputs[i] = sample
+        try:
+            self.conn.send(("predict", n))
+        except OSError as exc:
+            raise WorkerError(f"{self.process.name} exited (code {self.process.exitcode})") from exc
+        status, payload = self._recv(self.pool.timeout)
+        if status != "ok":
+            raise WorkerError(payload)
+        return payload
+
+    def stop(self) -> None:
+        try:
+            if self.process.is_alive():
+                self.conn.send(("stop", 0))
+                self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        except (OSError, ValueError):
+            pass
+        self.conn.close()
+        del self.inputs
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class ModelWorkerPool:
+    def __init__(self, name: str, n_workers: int, threads: int, cpu_sets: Optional[List[List[int]]] = None,
+                 max_batch: int = MAX_BATCH, timeout: float = TIMEOUT, load_timeout: float = LOAD_TIMEOUT) -> None:
+        self.name = name
+        self.target, shape = TARGETS[name]
+        self.shape = tuple(shape)
+        self.threads = threads
+        self.cpu_sets = cpu_sets
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.load_timeout = load_timeout
+        self.ctx = get_context("spawn")
+        self.calls = 0
+        self.errors = 0
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._workers = [_Worker(self, i) for i in range(n_workers)]
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        for worker in self._workers:
+            self._idle.put(worker)
+
+    def predict(self, batch: Union[np.ndarray, Sequence[np.ndarray]]) -> List[Any]:
+        """Run the model's batch function on `batch` in a worker; larger batches are split."""
+        results: List[Any] = []
+        for start in range(0, len(batch), self.max_batch):
+            results.extend(self._call(batch[start : start + self.max_batch]))
+        return results
+
+    def _call(self, chunk) -> Any:
+        worker = self._idle.get()
+        try:
+            result = worker.call(chunk)
+            with self._lock:
+                self.calls += 1
+            return result
+        except WorkerError:
+            with self._lock:
+                self.errors += 1
+            if worker.hung or not worker.process.is_alive():
+                worker = self._respawn(worker)
+            raise
+        finally:
+            self._idle.put(worker)
+
+    def _respawn(self, worker: _Worker) -> _Worker:
+        worker.stop()
+        replacement = _Worker(self, worker.index)
+        self._workers[worker.index] = replacement
+        with self._lock:
+            self.restarts += 1
+        return replacement
+
+    def wait_ready(self) -> None:
+        for worker in self._workers:
+            worker.wait_ready()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "alive": sum(w.process.is_alive() for w in self._workers),
+            "idle": self._idle.qsize(),
+            "threads_per_worker": self.threads,
+            "cpus": [w.cpus for w in self._workers] if self.cpu_sets else None,
+            "load_seconds": [w.load_seconds for w in self._workers],
+            "max_batch": self.max_batch,
+            "calls": self.calls,
+            "errors": self.errors,
+            "restarts": self.restarts,
+        }
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.stop()
+
+
+def _share(counts: Dict[str, int], slot: int, slots: int) -> Dict[str, int]:
+    """Slot `slot`'s part of the server-wide counts; every slot gets at least one worker per model."""
+    return {name: max(1, n // slots + (1 if slot < n % slots else 0)) for name, n in counts.items()}
+
+
+def _plan(counts: Dict[str, int], slot: int = 0, slots: int = 1) -> Dict[str, Tuple[int, int, Optional[List[List[int]]]]]:
+    """
+    Workers, threads per worker and, with MODEL_WORKER_AFFINITY, a disjoint
+    core block per worker for this slot. Threads and core offsets account
+    for the workers of every slot, so server processes do not share cores.
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    shares = [_share(counts, s, slots) for s in range(slots)]
+    total = sum(sum(share.values()) for share in shares)
+    threads = THREADS or max(1, len(cores) // total)
+    plan: Dict[str, Tuple[int, int, Optional[List[List[int]]]]] = {}
+    offset = threads * sum(sum(share.values()) for share in shares[:slot])
+    for name, n in shares[slot].items():
+        cpu_sets = None
+        if AFFINITY:
+            cpu_sets = []
+            for _ in range(n):
+                block = [cores[(offset + i) % len(cores)] for i in range(threads)]
+                cpu_sets.append(sorted(set(block)))
+                offset += threads
+        plan[name] = (n, threads, cpu_sets)
+    return plan
+
+
+def configured() -> Dict[str, int]:
+    return {} if _in_worker else parse_spec(WORKER_SPEC)
+
+
+def set_slot(slot: int, slots: int) -> None:
+    """Tell this server process which of `slots` pre-forked processes it is (before any pool starts)."""
+    global _slot
+    _slot = (slot, max(slots, slot + 1))
+
+
+def get_pool(name: str) -> Optional[ModelWorkerPool]:
+    """The worker pool serving `name`, started on first use, or None to run in-process."""
+    pool = _pools.get(name)
+    if pool is not None or _in_worker or not WORKER_SPEC:
+        return pool
+    counts = configured()
+    if name not in counts:
+        return None
+    with _pools_lock:
+        if not _pools:
+            for pool_name, (n, threads, cpu_sets) in _plan(counts, *_slot).items():
+                _pools[pool_name] = ModelWorkerPool(pool_name, n, threads, cpu_sets)
+    return _pools.get(name)
+
+
+def start_from_env() -> None:
+    """Spawn every configured pool now so models load before the first request."""
+    for name in configured():
+        get_pool(name)
+
+
+def status() -> Dict[str, Any]:
+    return {name: pool.stats() for name, pool in _pools.items()}
+
+
+def shutdown() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,212 @@
+"""
+Durable background jobs stored in MongoDB.
+
+Request handlers `enqueue(name, payload)` slow follow-up work (e.g. cascade
+deletes) and return immediately. Each process runs JOBS_WORKERS runner
+threads that claim queued jobs with `find_one_and_update`, so any number of
+gunicorn workers can share the queue and a job is only run by one of them.
+
+- A claim is a lease: if the process dies mid-job, the job becomes claimable
+  again after JOBS_LEASE_SECONDS. Handlers must therefore be idempotent.
+- Failures are retried with exponential backoff up to JOBS_MAX_ATTEMPTS,
+  then left as "failed" with the last error for inspection.
+- Finished jobs are removed by a TTL index after JOBS_RETENTION seconds.
+
+Handlers are registered with `@jobs.handler("name")` and called as
+`fn(db, payload)`.
+"""
+from __future__ import annotations
+
+import datetime
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+
+from backend import database
+
+ENABLED = os.getenv("JOBS_ENABLED", "1").lower() in ("1", "true", "yes")
+WORKERS = int(os.getenv("JOBS_WORKERS", "1"))
+POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "5"))
+LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+RETENTION = int(os.getenv("JOBS_RETENTION", str(24 * 3600)))
+BACKOFF_BASE = float(os.getenv("JOBS_BACKOFF_BASE", "5"))
+
+_handlers: Dict[str, Callable[[Any, Dict[str, Any]], None]] = {}
+_threads: List[threading.Thread] = []
+_wake = threading.Event()
+_stop = threading.Event()
+_lock = threading.Lock()
+_stats: Dict[str, int] = {"enqueued": 0, "succeeded": 0, "retried": 0, "failed": 0}
+
+
+def _reset_after_fork() -> None:
+    # Runner threads do not survive fork; the child starts its own
+    global _threads, _wake, _stop, _lock
+    _threads = []
+    _wake = threading.Event()
+    _stop = threading.Event()
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@database.on_connect
+def ensure_indexes(db) -> None:
+    db.jobs.create_indexes([
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="claim"),
+        IndexModel([("finished_at", ASCENDING)], name="retention", expireAfterSeconds=RETENTION),
+    ])
+
+
+def handler(name: str):
+    def register(fn):
+        _handlers[name] = fn
+        return fn
+
+    return register
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def _count(key: str) -> None:
+    with _lock:
+        _stats[key] += 1
+
+
+def enqueue(name: str, payload: Dict[str, Any], session=None) -> Any:
+    """
+    Queue a job and wake this process's runner. Pass `session` to enqueue
+    inside the caller's transaction, then call `wake()` once it commits
+    (otherwise the job is picked up on the next poll). Returns the job id.
+    """
+    if name not in _handlers:
+        raise KeyError(f"Unknown job: {name}")
+    db = database.get_db()
+    if db is None:
+        raise RuntimeError("Database connection failed")
+    now = _now()
+    result = db.jobs.insert_one(
+        {"name": name, "payload": payload, "status": "queued", "attempts": 0, "run_at": now, "created_at": now},
+        session=session,
+    )
+    _count("enqueued")
+    if session is None:
+        wake()
+    return result.inserted_id
+
+
+def wake() -> None:
+    start()
+    _wake.set()
+
+
+def _claim(db) -> Optional[Dict[str, Any]]:
+    now = _now()
+    return db.jobs.find_one_and_update(
+        # For a running job run_at is its lease expiry: past it, the runner that claimed it died
+        {"status": {"$in": ["queued", "running"]}, "run_at": {"$lte": now}},
+        {
+            "$set": {"status": "running", "run_at": now + datetime.timedelta(seconds=LEASE_SECONDS), "worker": os.getpid()},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def _finish(db, job: Dict[str, Any], error: Optional[Exception]) -> None:
+    if error is None:
+        db.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "done", "finished_at": _now()}, "$unset": {"error": ""}})
+        _count("succeeded")
+        return
+    if job["attempts"] >= MAX_ATTEMPTS:
+        db.jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "failed", "error": str(error)}})
+        _count("failed")
+        print(f"Job {job['name']} {job['_id']} failed permanently: {error}")
+        return
+    delay = BACKOFF_BASE * 2 ** (job["attempts"] - 1)
+    db.jobs.update_one(
+        {"_id": job["_id"]},
+        {"$set": {"status": "queued", "run_at": _now() + datetime.timedelta(seconds=delay), "error": str(error)}},
+    )
+    _count("retried")
+
+
+def run_pending(limit: Optional[int] = None) -> int:
+    """Run claimable jobs until none are left (or `limit` ran); returns how many ran."""
+    db = database.get_db()
+    if db is None:
+        return 0
+    ran = 0
+    while limit is None or ran < limit:
+        if _stop.is_set():
+            break
+        job = _claim(db)
+        if job is None:
+            break
+        fn = _handlers.get(job["name"])
+        error = None
+        try:
+            if fn is None:
+                raise KeyError(f"No handler for job {job['name']}")
+            fn(db, job.get("payload") or {})
+        except Exception as exc:
+            error = exc
+        _finish(db, job, error)
+        ran += 1
+    return ran
+
+
+def _runner() -> None:
+    while not _stop.is_set():
+        try:
+            run_pending()
+        except Exception as exc:
+            print(f"Job runner error: {exc}")
+        _wake.wait(POLL_INTERVAL)
+        _wake.clear()
+
+
+def start() -> None:
+    """Start this process's runner threads (idempotent)."""
+    if not ENABLED or WORKERS <= 0 or not database.MONGO_URI:
+        return
+    with _lock:
+        if _threads:
+            return
+        _stop.clear()
+        for index in range(WORKERS):
+            thread = threading.Thread(target=_runner, name=f"jobs-{index}", daemon=True)
+            thread.start()
+            _threads.append(thread)
+
+
+def stop(timeout: float = 5.0) -> None:
+    _stop.set()
+    _wake.set()
+    for thread in list(_threads):
+        thread.join(timeout)
+    _threads.clear()
+
+
+def status() -> Dict[str, Any]:
+    info: Dict[str, Any] = {"enabled": ENABLED, "runners": len(_threads), "handlers": sorted(_handlers)}
+    with _lock:
+        info["process"] = dict(_stats)
+    db = database.get_db()
+    if db is not None:
+        try:
+            info["queue"] = {
+                row["_id"]: row["count"]
+                for row in db.jobs.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+            }
+        except Exception as exc:
+            info["queue_error"] = str(exc)
+    return info
@@ -0,0 +1,417 @@
+"""
+Shared OpenAI chat-completions client for chat, tips and consult.
+
+- One pooled keep-alive `requests.Session` per process (no TLS handshake per call).
+- At most LLM_MAX_CONCURRENCY completions in flight, run on a dedicated
+  executor; LLM_MAX_PENDING more may wait. Anything beyond that fails fast
+  with LLMBusy (HTTP 503) instead of tying up more request threads, so a
+  burst of slow completions cannot starve prediction traffic.
+- 429/5xx and connection errors are retried on the executor with
+  exponential backoff and full jitter (honouring Retry-After), within an
+  overall LLM_DEADLINE.
+
+OPENAI_BASE_URL points the client at a local stub server for testing.
+"""
+from __future__ import annotations
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1").rstrip("/")
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+MAX_PENDING = int(os.getenv("LLM_MAX_PENDING", "32"))
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "8.0"))
+# Streaming: chunks buffered between upstream and a slow client, and how long a stalled client is tolerated
+STREAM_BUFFER = int(os.getenv("LLM_STREAM_BUFFER", "64"))
+STREAM_STALL_TIMEOUT = float(os.getenv("LLM_STREAM_STALL_TIMEOUT", "30"))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class LLMError(Exception):
+    """A failed completion; `status` is the HTTP status to return to the client."""
+
+    def __init__(self, message: str, status: int = 502, details: Any = None) -> None:
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.details = details
+
+
+class LLMBusy(LLMError):
+    def __init__(self, message: str = "AI assistant is busy, please retry shortly") -> None:
+        super().__init__(message, status=503)
+
+
+class LLMNotConfigured(LLMError):
+    def __init__(self) -> None:
+        super().__init__("OPENAI_API_KEY not found", status=503)
+
+
+_session: Optional[requests.Session] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_init_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_CONCURRENCY + MAX_PENDING)
+_stats_lock = threading.Lock()
+_stats: Dict[str, float] = {"requests": 0, "completed": 0, "failed": 0, "rejected": 0, "retries": 0, "cancelled": 0, "latency_total": 0.0}
+_in_flight = 0
+
+
+def _reset_after_fork() -> None:
+    global _session, _executor, _init_lock, _slots, _stats_lock, _in_flight
+    _session = None
+    _executor = None
+    _init_lock = threading.Lock()
+    _slots = threading.BoundedSemaphore(MAX_CONCURRENCY + MAX_PENDING)
+    _stats_lock = threading.Lock()
+    _in_flight = 0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _init_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENCY, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _init_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="llm")
+    return _executor
+
+
+def api_key() -> Optional[str]:
+    return os.getenv("OPENAI_API_KEY")
+
+
+def _count(key: str, value: float = 1) -> None:
+    with _stats_lock:
+        _stats[key] += value
+
+
+def _error_message(response: requests.Response) -> str:
+    try:
+        return response.json().get("error", {}).get("message", response.text)
+    except Exception:
+        return response.text
+
+
+def _backoff(attempt: int, response: Optional[requests.Response]) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_CAP)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _post(path: str, payload: Dict[str, Any], deadline: float, stream: bool = False) -> requests.Response:
+    """POST with retries; runs on the LLM executor, never on a request thread."""
+    key = api_key()
+    if not key:
+        raise LLMNotConfigured()
+    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {key}"}
+    session = get_session()
+
+    for attempt in range(MAX_ATTEMPTS):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMError("AI request timed out", status=504)
+        response = None
+        try:
+            response = session.post(
+                f"{BASE_URL}{path}",
+                headers=headers,
+                json=payload,
+                timeout=(CONNECT_TIMEOUT, min(READ_TIMEOUT, remaining)),
+                stream=stream,
+            )
+            if response.status_code == 200:
+                return response
+            if response.status_code not in RETRY_STATUSES:
+                raise LLMError(f"AI API Error: {_error_message(response)}", status=response.status_code, details=response.text)
+            delay = _backoff(attempt, response)
+            if attempt == MAX_ATTEMPTS - 1 or time.monotonic() + delay >= deadline:
+                raise LLMError(f"AI API Error: {_error_message(response)}", status=response.status_code, details=response.text)
+            print(f"OpenAI rate/overload ({response.status_code}). Retrying in {delay:.1f}s...")
+        except requests.Timeout as exc:
+            raise LLMError("AI request timed out", status=504) from exc
+        except requests.ConnectionError as exc:
+            delay = _backoff(attempt, None)
+            if attempt == MAX_ATTEMPTS - 1 or time.monotonic() + delay >= deadline:
+                raise LLMError(f"AI service unreachable: {exc}", status=502) from exc
+        finally:
+            # Anything but the returned 200 is ours to close, including on every error path
+            if response is not None and response.status_code != 200:
+                response.close()
+        _count("retries")
+        time.sleep(delay)
+    raise LLMError("AI API Error: retries exhausted")
+
+
+def _release_slot(_future=None) -> None:
+    global _in_flight
+    with _stats_lock:
+        _in_flight -= 1
+    _slots.release()
+
+
+def _run(fn, *args) -> Any:
+    """Run fn on the LLM executor, bounded by the concurrency + pending slots and the deadline."""
+    global _in_flight
+    if not api_key():
+        raise LLMNotConfigured()
+    if not _slots.acquire(blocking=False):
+        _count("rejected")
+        raise LLMBusy()
+    _count("requests")
+    start = time.monotonic()
+    deadline = start + DEADLINE
+    with _stats_lock:
+        _in_flight += 1
+    try:
+        future = _get_executor().submit(fn, *args, deadline)
+    except Exception:
+        _count("failed")
+        _release_slot()
+        raise
+    # The slot belongs to the task, not the caller: a request that gives up on
+    # a timeout must not admit another call while this one still runs
+    future.add_done_callback(_release_slot)
+    try:
+        try:
+            result = future.result(timeout=DEADLINE + CONNECT_TIMEOUT)
+        except FutureTimeout as exc:
+            future.cancel()
+            raise LLMError("AI request timed out", status=504) from exc
+        _count("completed")
+        _count("latency_total", time.monotonic() - start)
+        return result
+    except Exception:
+        _count("failed")
+        raise
+
+
+def _completion(payload: Dict[str, Any], deadline: float) -> str:
+    response = _post("/chat/completions", payload, deadline)
+    body = response.json()
+    try:
+        return body["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError) as exc:
+        raise LLMError("AI response was empty or malformed.", status=502, details=body.get("error", body)) from exc
+
+
+def chat_completion(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    max_tokens: int = 500,
+    model: Optional[str] = None,
+) -> str:
+    """Return the assistant message text. Raises LLMError (with an HTTP status) on failure."""
+    payload = {
+        "model": model or DEFAULT_MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    return _run(_completion, payload)
+
+
+class CompletionStream:
+    """
+    Iterator over completion text deltas, produced on the LLM executor.
+
+    The upstream response is read into a bounded queue; when the client
+    reads slowly the queue fills and the producer stops reading, so the
+    backpressure reaches the upstream socket instead of growing memory.
+    Deltas that pile up are coalesced into one chunk per read. `close()`
+    (or abandoning the iterator) cancels the upstream request.
+    """
+
+    def __init__(self, payload: Dict[str, Any]) -> None:
+        self.finish_reason: Optional[str] = None
+        self.chunks = 0
+        self._queue: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=STREAM_BUFFER)
+        self._cancelled = threading.Event()
+        self._done = False
+        self._start = time.monotonic()
+        self.first_chunk_ms: Optional[float] = None
+        _get_executor().submit(self._produce, payload, self._start + DEADLINE)
+
+    def _put(self, item: Tuple[str, Any]) -> bool:
+        stalled_since = time.monotonic()
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                if time.monotonic() - stalled_since > STREAM_STALL_TIMEOUT:
+                    self._cancelled.set()
+        return False
+
+    def _produce(self, payload: Dict[str, Any], deadline: float) -> None:
+        response = None
+        try:
+            response = _post("/chat/completions", payload, deadline, stream=True)
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if self._cancelled.is_set():
+                    break
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choice = (json.loads(data).get("choices") or [{}])[0]
+                if choice.get("finish_reason"):
+                    self.finish_reason = choice["finish_reason"]
+                text = (choice.get("delta") or {}).get("content")
+                if text and not self._put(("delta", text)):
+                    break
+            if self._cancelled.is_set():
+                _count("cancelled")
+            else:
+                self._put(("done", None))
+                _count("completed")
+                _count("latency_total", time.monotonic() - self._start)
+        except LLMError as exc:
+            _count("failed")
+            self._put(("error", exc))
+        except Exception as exc:
+            _count("failed")
+            self._put(("error", LLMError(f"AI stream failed: {exc}")))
+        finally:
+            if response is not None:
+                response.close()
+            _release_slot()
+
+    def __iter__(self) -> Iterator[str]:
+        return self
+
+    def __next__(self) -> str:
+        if self._done:
+            raise StopIteration
+        try:
+            kind, value = self._queue.get(timeout=max(0.0, self._start + DEADLINE - time.monotonic()) + CONNECT_TIMEOUT)
+        except queue.Empty:
+            self.close()
+            raise LLMError("AI request timed out", status=504)
+        if kind == "error":
+            self._done = True
+            raise value
+        if kind == "done":
+            self._done = True
+            raise StopIteration
+
+        parts = [value]
+        while True:
+            try:
+                kind, more = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind != "delta":
+                # Put the terminal item back for the next call
+                self._queue.put((kind, more))
+                break
+            parts.append(more)
+        self.chunks += len(parts)
+        if self.first_chunk_ms is None:
+            self.first_chunk_ms = round((time.monotonic() - self._start) * 1000.0, 1)
+        return "".join(parts)
+
+    def close(self) -> None:
+        self._done = True
+        self._cancelled.set()
+
+
+def stream_chat_completion(
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    max_tokens: int = 500,
+    model: Optional[str] = None,
+) -> CompletionStream:
+    """
+    Start a streamed completion and return an iterator of text deltas.
+    Admission (LLMNotConfigured / LLMBusy) is decided here, before any bytes are sent.
+    """
+    global _in_flight
+    if not api_key():
+        raise LLMNotConfigured()
+    if not _slots.acquire(blocking=False):
+        _count("rejected")
+        raise LLMBusy()
+    _count("requests")
+    with _stats_lock:
+        _in_flight += 1
+    payload = {
+        "model": model or DEFAULT_MODEL,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": True,
+    }
+    try:
+        return CompletionStream(payload)
+    except Exception:
+        _release_slot()
+        raise
+
+
+def strip_code_fences(text: str) -> str:
+    """Remove a ```json ... ``` wrapper if the model added one."""
+    clean_text = text.strip()
+    if clean_text.startswith("```"):
+        parts = clean_text.split("```", 2)
+        if len(parts) > 1:
+            clean_text = parts[1]
+            if clean_text.startswith("json"):
+                clean_text = clean_text[4:]
+        clean_text = clean_text.strip()
+    return clean_text
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        completed = _stats["completed"]
+        return {
+            "max_concurrency": MAX_CONCURRENCY,
+            "max_pending": MAX_PENDING,
+            "in_flight": _in_flight,
+            "requests": int(_stats["requests"]),
+            "completed": int(completed),
+            "failed": int(_stats["failed"]),
+            "rejected": int(_stats["rejected"]),
+            "retries": int(_stats["retries"]),
+            "cancelled_streams": int(_stats["cancelled"]),
+            "mean_latency_ms": round(_stats["latency_total"] / completed * 1000.0, 1) if completed else None,
+        }
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from backend.database import db
+from backend.database import get_db
 import datetime
 from bson.objectid import ObjectId
 
@@ -7,6 +7,7 @@ auth_bp = Blueprint("auth", __name__)
 
 @auth_bp.route("/api/auth/register", methods=["POST"])
 def register():
+    db = get_db()
     if db is None:
         return jsonify({"error": "Database connection failed"}), 500
 
@@ -41,6 +42,7 @@ def register():
 
 @auth_bp.route("/api/auth/login", methods=["POST"])
 def login():
+    db = get_db()
     if db is None:
         return jsonify({"error": "Database connection failed"}), 500
 
@@ -0,0 +1,139 @@
+"""
+Shared helpers for the multi-image batch endpoints.
+
+Uploads can be any number of `files` parts and/or zip/tar archives. Images
+are decoded on the shared preprocessing pool, grouped into fixed-size
+batches for a single forward pass each, and written back one NDJSON line
+per image as soon as its batch finishes.
+"""
+from __future__ import annotations
+
+import json
+import os
+import tarfile
+import zipfile
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+from flask import Response, stream_with_context
+
+from backend.inference import preprocessing
+
+BATCH_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", "32"))
+MAX_IMAGES = int(os.getenv("PREDICT_BATCH_MAX_IMAGES", "5000"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def _is_image(name: str) -> bool:
+    base = os.path.basename(name)
+    return not base.startswith(".") and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _iter_archive(filename: str, stream) -> Iterator[Tuple[str, bytes]]:
+    if filename.lower().endswith(".zip"):
+        with zipfile.ZipFile(stream) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and _is_image(info.filename):
+                    yield info.filename, zf.read(info)
+    else:
+        with tarfile.open(fileobj=stream, mode="r|*") as tf:
+            for member in tf:
+                if member.isfile() and _is_image(member.name):
+                    fh = tf.extractfile(member)
+                    if fh is not None:
+                        yield member.name, fh.read()
+
+
+def iter_uploaded_images(files) -> Iterator[Tuple[str, bytes]]:
+    """Yield (name, bytes) for every image in a multipart upload, expanding archives lazily."""
+    count = 0
+    for field in ("files", "file", "archive"):
+        for storage in files.getlist(field):
+            filename = storage.filename or ""
+            if filename.lower().endswith(ARCHIVE_EXTENSIONS):
+                entries: Iterable[Tuple[str, bytes]] = _iter_archive(filename, storage.stream)
+            else:
+                entries = [(filename, storage.read())]
+            for name, data in entries:
+                count += 1
+                if count > MAX_IMAGES:
+                    raise ValueError(f"Batch exceeds {MAX_IMAGES} images")
+                yield name, data
+
+
+def stream_predictions(
+    images: Iterable[Tuple[str, bytes]],
+    preprocess: Callable[..., np.ndarray],
+    predict_batch: Callable[[np.ndarray], Sequence[Dict[str, Any]]],
+    sample_shape: Tuple[int, ...],
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Decode `images` on the shared preprocessing pool straight into one of two
+    preallocated float32 batch buffers, and run `predict_batch` on each full
+    buffer. The next batch decodes into the other buffer while the model runs,
+    so memory stays at two batches however large the upload is.
+
+    `preprocess(data, out=row)` must write one sample into `row`.
+    """
+    pool = preprocessing.get_pool()
+    buffers = [np.empty((batch_size,) + tuple(sample_shape), dtype=np.float32) for _ in range(2)]
+    source = iter(images)
+    next_index = 0
+
+    def submit(buffer: np.ndarray):
+        nonlocal next_index
+        chunk = list(islice(source, batch_size))
+        entries = [(next_index + i, name) for i, (name, _) in enumerate(chunk)]
+        futures = [pool.submit(preprocess, data, out=buffer[i]) for i, (_, data) in enumerate(chunk)]
+        next_index += len(chunk)
+        return entries, futures, buffer
+
+    current = submit(buffers[0])
+    turn = 1
+    while current[0]:
+        entries, futures, buffer = current
+        valid: List[bool] = []
+        for (idx, name), future in zip(entries, futures):
+            try:
+                future.result()
+                valid.append(True)
+            except Exception as exc:
+                valid.append(False)
+                yield {"index": idx, "filename": name, "error": f"Could not decode image: {exc}"}
+
+        # Keep the decode pool busy while the model runs on this batch
+        upcoming = submit(buffers[turn])
+        turn ^= 1
+
+        ready = [entry for entry, ok in zip(entries, valid) if ok]
+        if ready:
+            batch = buffer[: len(entries)]
+            if len(ready) != len(entries):
+                batch = batch[np.array(valid)]
+            try:
+                results = predict_batch(batch)
+            except Exception as exc:
+                results = [{"error": str(exc)}] * len(ready)
+            for (idx, name), result in zip(ready, results):
+                yield {"index": idx, "filename": name, **result}
+
+        current = upcoming
+
+
+def ndjson_response(records: Iterator[Dict[str, Any]]) -> Response:
+    def generate() -> Iterator[str]:
+        total = errors = 0
+        try:
+            for record in records:
+                total += 1
+                errors += "error" in record
+                yield json.dumps(record) + "\n"
+        except Exception as exc:
+            yield json.dumps({"error": str(exc), "fatal": True}) + "\n"
+        yield json.dumps({"done": True, "total": total, "errors": errors}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
@@ -1,17 +1,93 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 import os
-import requests
 import json
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
 from dotenv import load_dotenv
 
+from backend import llm_client, semantic_cache
+from backend.database import get_db
+
 load_dotenv()
 
 chat_bp = Blueprint('chat', __name__)
 
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _stream_cached(hit):
+    """A semantic-cache hit in the same event shape as a live stream."""
+    def generate():
+        yield _sse("token", {"delta": hit["reply"]})
+        yield _sse("done", {
+            "reply": hit["reply"],
+            "finish_reason": "stop",
+            "cached": True,
+            "cache_id": hit["id"],
+            "similarity": hit["similarity"],
+        })
+
+    return _sse_response(generate())
+
+
+def _stream_reply(messages, on_complete=None):
+    """
+    Relay the completion as server-sent events: `token` events with
+    {"delta": ...} as text arrives, then one `done` event with the full
+    reply and timings (or an `error` event).
+    `on_complete(reply)` may return a cache id to include in the `done` event.
+    """
+    start = time.monotonic()
+    stream = llm_client.stream_chat_completion(messages, temperature=0.7, max_tokens=500)
+
+    def generate():
+        parts = []
+        # Sent before the upstream replies so the client sees the first byte immediately
+        yield ": stream open\n\n"
+        try:
+            for delta in stream:
+                parts.append(delta)
+                yield _sse("token", {"delta": delta})
+            reply = "".join(parts)
+            done = {
+                "reply": reply,
+                "finish_reason": stream.finish_reason,
+                "chunks": stream.chunks,
+                "first_token_ms": stream.first_chunk_ms,
+                "total_ms": round((time.monotonic() - start) * 1000.0, 1),
+            }
+            # Truncated replies (finish_reason "length") are not worth reusing
+            if on_complete is not None and stream.finish_reason == "stop":
+                done["cache_id"] = on_complete(reply)
+            yield _sse("done", done)
+        except llm_client.LLMError as e:
+            yield _sse("error", {"error": e.message, "status": e.status, "partial": "".join(parts)})
+        finally:
+            # Client went away (GeneratorExit) or we finished: stop reading upstream
+            stream.close()
+
+    return _sse_response(generate())
+
+
 @chat_bp.route('/api/chat', methods=['POST'])
 def chat_assistant():
     """
     General AI Assistant endpoint using OpenAI.
+    Set "stream": true for a server-sent event stream of tokens.
+    Standalone questions (no history) are answered from the semantic cache
+    when a near-identical one was answered before; the reply then carries
+    "cached": true and a "cache_id" for /api/chat/feedback.
     """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
@@ -50,28 +126,72 @@ def chat_assistant():
         
         messages.append({"role": "user", "content": user_message})
 
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
-        payload = {
-            "model": "gpt-4o-mini",
-            "messages": messages,
-            "temperature": 0.7,
-            "max_tokens": 500,
-        }
-
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code != 200:
-            return jsonify({"error": f"AI Error: {response.text}"}), response.status_code
+        streaming = data.get('stream') or 'text/event-stream' in request.headers.get('Accept', '')
+
+        # Follow-up questions depend on the conversation, so only standalone ones are cached
+        on_complete = None
+        if not history:
+            hit = semantic_cache.lookup(user_message, language)
+            if hit is not None:
+                if streaming:
+                    return _stream_cached(hit)
+                return jsonify({
+                    "reply": hit["reply"],
+                    "cached": True,
+                    "cache_id": hit["id"],
+                    "similarity": hit["similarity"],
+                })
+
+            def on_complete(reply):
+                return semantic_cache.store(user_message, language, reply)
 
-        response_json = response.json()
-        ai_reply = response_json["choices"][0]["message"]["content"]
+        # Streaming mode: {"stream": true} or Accept: text/event-stream
+        if streaming:
+            return _stream_reply(messages, on_complete)
 
-        return jsonify({"reply": ai_reply})
+        ai_reply = llm_client.chat_completion(messages, temperature=0.7, max_tokens=500)
 
+        body = {"reply": ai_reply}
+        if on_complete is not None:
+            body["cache_id"] = on_complete(ai_reply)
+        return jsonify(body)
+
+    except llm_client.LLMError as e:
+        return jsonify({"error": e.message}), e.status
     except Exception as e:
         print(f"Chat API Error: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@chat_bp.route('/api/chat/feedback', methods=['POST'])
+def chat_feedback():
+    """
+    {"cache_id": ..., "user_id": ..., "helpful": false} flags a bad cached answer.
+    Only registered users count, once each per answer, so one anonymous
+    request cannot evict an entry.
+    """
+    data = request.get_json(silent=True) or {}
+    cache_id = data.get('cache_id')
+    user_id = data.get('user_id')
+    if not cache_id or not user_id:
+        return jsonify({"error": "cache_id and user_id are required"}), 400
+
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "Database connection failed"}), 500
+    try:
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'_id': 1})
+    except (InvalidId, TypeError):
+        user = None
+    if user is None:
+        return jsonify({"error": "Unknown user"}), 401
+
+    removed = semantic_cache.feedback(cache_id, bool(data.get('helpful', False)), str(user['_id']))
+    if removed is None:
+        return jsonify({"error": "Unknown cache_id"}), 404
+    return jsonify({"success": True, "removed": removed})
+
+
+@chat_bp.route('/api/chat/stats', methods=['GET'])
+def chat_stats():
+    return jsonify({"semantic_cache": semantic_cache.stats(), "llm": llm_client.stats()})
@@ -1,15 +1,99 @@
+import json
+import os
+import time
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
-from datetime import datetime
+from bson.errors import InvalidId
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, DESCENDING, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from backend import database, jobs
+from backend.cache import LRUCache
 from backend.database import get_db
 
 community_bp = Blueprint('community', __name__, url_prefix='/api/community')
 
+FEED_MAX_LIMIT = int(os.getenv("COMMUNITY_FEED_MAX_LIMIT", "100"))
+# Feed totals are approximate: cached per category for this many seconds
+COUNT_CACHE_TTL = float(os.getenv("COMMUNITY_COUNT_CACHE_TTL", "60"))
+# Bulk comment import (old forum migration); disabled unless a token is set
+IMPORT_TOKEN = os.getenv("COMMUNITY_IMPORT_TOKEN")
+IMPORT_BATCH_SIZE = int(os.getenv("COMMUNITY_IMPORT_BATCH_SIZE", "1000"))
+
+_EPOCH = datetime(1970, 1, 1)
+FEED_SORT = [('created_at', DESCENDING), ('_id', DESCENDING)]
+
+# Fields shipped to clients. Likes live in `post_likes` with a counter on the post;
+# posts not yet migrated by scripts/migrate_post_likes.py fall back to their legacy array size.
+POST_PROJECTION = {
+    'user_id': 1,
+    'user_name': 1,
+    'content': 1,
+    'images': 1,
+    'category': 1,
+    'comment_count': 1,
+    'created_at': 1,
+    'updated_at': 1,
+    'likes_count': {'$ifNull': ['$likes_count', {'$size': {'$ifNull': ['$likes', []]}}]},
+}
+
+_counts = LRUCache(maxsize=64, ttl=COUNT_CACHE_TTL)
+
+
+@database.on_connect
+def ensure_indexes(db):
+    """Keyset feed (optionally per category), per-post comments, like and import uniqueness."""
+    db.posts.create_indexes([
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)], name='feed'),
+        IndexModel([('category', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)], name='feed_by_category'),
+    ])
+    db.comments.create_indexes([
+        IndexModel([('post_id', ASCENDING), ('created_at', ASCENDING)], name='comments_by_post'),
+        # Makes re-running an import idempotent
+        IndexModel([('legacy_id', ASCENDING)], name='legacy_id', unique=True,
+                   partialFilterExpression={'legacy_id': {'$exists': True}}),
+    ])
+    # One like per user per post; also serves the cascade delete by post_id
+    db.post_likes.create_indexes([
+        IndexModel([('post_id', ASCENDING), ('user_id', ASCENDING)], name='post_user', unique=True),
+    ])
+
+
+def encode_cursor(post):
+    """Opaque '<created_at ms>_<id>' position of the last post on a page."""
+    millis = (post['created_at'].replace(tzinfo=None) - _EPOCH) // timedelta(milliseconds=1)
+    return f"{millis}_{post['_id']}"
+
+
+def decode_cursor(cursor):
+    """(created_at, ObjectId); raises ValueError for a malformed cursor."""
+    millis, _, post_id = cursor.partition('_')
+    try:
+        return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(post_id)
+    except (InvalidId, TypeError) as e:
+        raise ValueError(str(e))
+
+
+def count_posts(db, query):
+    """Approximate total for the feed, cached briefly per category."""
+    key = query.get('category', '*')
+    total = _counts.get(key)
+    if total is None:
+        if query:
+            total = db.posts.count_documents(query)
+        else:
+            # Collection metadata, no scan
+            total = db.posts.estimated_document_count()
+        _counts.set(key, total)
+    return total
+
+
 # Helper to serialize MongoDB documents
 def serialize_post(post):
     """Convert MongoDB post document to JSON-serializable dict"""
     post['_id'] = str(post['_id'])
-    post['likes_count'] = len(post.get('likes', []))
+    if 'likes_count' not in post:
+        post['likes_count'] = len(post.get('likes', []))
     return post
 
 def serialize_comment(comment):
@@ -23,30 +107,57 @@ def serialize_comment(comment):
 
 @community_bp.route('/posts', methods=['GET'])
 def get_posts():
-    """Get all posts with optional category filter"""
+    """
+    Get posts, newest first, with optional category filter.
+    Pass the returned `next_cursor` as `cursor` for the next page
+    (`skip` is still accepted for older clients but scans every skipped post).
+    """
     try:
         db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
         category = request.args.get('category')
-        limit = int(request.args.get('limit', 20))
-        skip = int(request.args.get('skip', 0))
+        try:
+            limit = min(max(int(request.args.get('limit', 20)), 1), FEED_MAX_LIMIT)
+            skip = int(request.args.get('skip', 0))
+        except ValueError:
+            return jsonify({"error": "limit and skip must be integers"}), 400
+        cursor = request.args.get('cursor')
         
         # Build query
         query = {}
         if category and category != 'all':
             query['category'] = category
-        
-        # Get posts sorted by newest first
-        posts = list(db.posts.find(query)
-                    .sort('created_at', -1)
-                    .limit(limit)
-                    .skip(skip))
+
+        page_query = dict(query)
+        if cursor:
+            try:
+                created_at, last_id = decode_cursor(cursor)
+            except ValueError:
+                return jsonify({"error": "Invalid cursor"}), 400
+            # Strictly after the last post seen, in (created_at, _id) order
+            page_query['$or'] = [
+                {'created_at': {'$lt': created_at}},
+                {'created_at': created_at, '_id': {'$lt': last_id}},
+            ]
+        
+        # One extra document tells us whether another page exists
+        find = db.posts.find(page_query, POST_PROJECTION).sort(FEED_SORT)
+        if skip and not cursor:
+            find = find.skip(skip)
+        posts = list(find.limit(limit + 1))
+        has_more = len(posts) > limit
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1]) if has_more else None
         
         # Serialize posts
         posts = [serialize_post(post) for post in posts]
         
         return jsonify({
             'posts': posts,
-            'total': db.posts.count_documents(query)
+            'total': count_posts(db, query),
+            'next_cursor': next_cursor,
+            'has_more': has_more
         }), 200
         
     except Exception as e:
@@ -58,6 +169,8 @@ def create_post():
     """Create a new post"""
     try:
         db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
         data = request.json
         
         # Validate required fields
@@ -71,7 +184,7 @@ def create_post():
             'content': data['content'],
             'images': data.get('images', []),
             'category': data.get('category', 'general'),
-            'likes': [],
+            'likes_count': 0,
             'comment_count': 0,
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
@@ -79,8 +192,8 @@ def create_post():
         
         # Insert into database
         result = db.posts.insert_one(post)
+        _counts.clear()
         post['_id'] = str(result.inserted_id)
-        post['likes_count'] = 0
         
         return jsonify(serialize_post(post)), 201
         
@@ -93,9 +206,11 @@ def get_post(post_id):
     """Get a single post by ID"""
     try:
         db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
         
         # Find post
-        post = db.posts.find_one({'_id': ObjectId(post_id)})
+        post = db.posts.find_one({'_id': ObjectId(post_id)}, POST_PROJECTION)
         if not post:
             return jsonify({"error": "Post not found"}), 404
         
@@ -110,25 +225,42 @@ def delete_post(post_id):
     """Delete a post (owner only)"""
     try:
         db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
         data = request.json
         user_id = data.get('user_id')
         
         if not user_id:
             return jsonify({"error": "user_id required"}), 400
         
-        # Find post and verify ownership
-        post = db.posts.find_one({'_id': ObjectId(post_id)})
-        if not post:
-            return jsonify({"error": "Post not found"}), 404
-        
-        if post['user_id'] != user_id:
+        post_oid = ObjectId(post_id)
+        
+        cascade = {'post_id': post_id, 'user_id': user_id}
+        
+        def delete(session):
+            if session is None:
+                # No transaction: queue the cascade (which also deletes the post) before deleting,
+                # so a failure after this point still leaves a job that finishes the delete
+                post = db.posts.find_one({'_id': post_oid}, {'user_id': 1})
+                if not post or post.get('user_id') != user_id:
+                    return 0
+                jobs.enqueue('community.cascade_post', cascade)
+                db.posts.delete_one({'_id': post_oid, 'user_id': user_id})
+                return 1
+            # Ownership is part of the filter, so the check and the delete are one operation
+            result = db.posts.delete_one({'_id': post_oid, 'user_id': user_id}, session=session)
+            if result.deleted_count:
+                # Comments and likes are removed in the background; the post is gone from reads now
+                jobs.enqueue('community.cascade_post', cascade, session=session)
+            return result.deleted_count
+        
+        if not database.run_in_transaction(delete):
+            if not db.posts.find_one({'_id': post_oid}, {'_id': 1}):
+                return jsonify({"error": "Post not found"}), 404
             return jsonify({"error": "Unauthorized: Can only delete your own posts"}), 403
         
-        # Delete post
-        db.posts.delete_one({'_id': ObjectId(post_id)})
-        
-        # Delete associated comments
-        db.comments.delete_many({'post_id': post_id})
+        jobs.wake()
+        _counts.clear()
         
         return jsonify({"message": "Post deleted successfully"}), 200
         
@@ -136,50 +268,68 @@ def delete_post(post_id):
         print(f"Error deleting post: {e}")
         return jsonify({"error": str(e)}), 500
 
+@jobs.handler('community.cascade_post')
+def cascade_post(db, payload):
+    """Delete a post (if its owner's) and then its comments and likes (safe to re-run)."""
+    post_oid = ObjectId(payload['post_id'])
+    if 'user_id' in payload:
+        db.posts.delete_one({'_id': post_oid, 'user_id': payload['user_id']})
+    if db.posts.find_one({'_id': post_oid}, {'_id': 1}):
+        return
+    db.comments.delete_many({'post_id': payload['post_id']})
+    db.post_likes.delete_many({'post_id': payload['post_id']})
+
 # ============================================
 # LIKES ENDPOINTS
 # ============================================
 
 @community_bp.route('/posts/<post_id>/like', methods=['POST'])
 def toggle_like(post_id):
-    """Toggle like on a post"""
+    """
+    Toggle like on a post.
+    The (post_id, user_id) unique index decides like vs. unlike, and the
+    counter update returns the new count, so concurrent toggles stay exact.
+    Posts must have been migrated off the legacy `likes` array first
+    (scripts/migrate_post_likes.py).
+    """
     try:
         db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
         data = request.json
         user_id = data.get('user_id')
         
         if not user_id:
             return jsonify({"error": "user_id required"}), 400
         
-        # Find post
-        post = db.posts.find_one({'_id': ObjectId(post_id)})
-        if not post:
-            return jsonify({"error": "Post not found"}), 404
-        
-        likes = post.get('likes', [])
+        post_oid = ObjectId(post_id)
+        like = {'post_id': post_id, 'user_id': user_id}
         
         # Toggle like
-        if user_id in likes:
-            # Unlike
-            db.posts.update_one(
-                {'_id': ObjectId(post_id)},
-                {'$pull': {'likes': user_id}}
-            )
-            liked = False
-        else:
+        try:
             # Like
-            db.posts.update_one(
-                {'_id': ObjectId(post_id)},
-                {'$addToSet': {'likes': user_id}}
-            )
-            liked = True
-        
-        # Get updated post
-        updated_post = db.posts.find_one({'_id': ObjectId(post_id)})
+            db.post_likes.insert_one({**like, 'created_at': datetime.utcnow()})
+            liked, delta = True, 1
+        except DuplicateKeyError:
+            # Unlike (a concurrent unlike may already have removed it)
+            liked = False
+            delta = -db.post_likes.delete_one(like).deleted_count
+        
+        # Adjust the counter and read it back in the same round trip
+        post = db.posts.find_one_and_update(
+            {'_id': post_oid},
+            {'$inc': {'likes_count': delta}},
+            projection={'likes_count': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if not post:
+            if liked:
+                db.post_likes.delete_one(like)
+            return jsonify({"error": "Post not found"}), 404
         
         return jsonify({
             'liked': liked,
-            'likes_count': len(updated_post.get('likes', []))
+            'likes_count': post['likes_count']
         }), 200
         
     except Exception as e:
@@ -195,6 +345,8 @@ def get_comments(post_id):
     """Get all comments for a post"""
     try:
         db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
         
         # Get comments sorted by oldest first
         comments = list(db.comments.find({'post_id': post_id})
@@ -214,16 +366,15 @@ def create_comment(post_id):
     """Add a comment to a post"""
     try:
         db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
         data = request.json
         
         # Validate required fields
         if not data.get('user_id') or not data.get('user_name') or not data.get('content'):
             return jsonify({"error": "Missing required fields: user_id, user_name, content"}), 400
         
-        # Verify post exists
-        post = db.posts.find_one({'_id': ObjectId(post_id)})
-        if not post:
-            return jsonify({"error": "Post not found"}), 404
+        post_oid = ObjectId(post_id)
         
         # Create comment document
         comment = {
@@ -234,15 +385,22 @@ def create_comment(post_id):
             'created_at': datetime.utcnow()
         }
         
-        # Insert comment
-        result = db.comments.insert_one(comment)
-        comment['_id'] = str(result.inserted_id)
-        
-        # Update comment count on post
-        db.posts.update_one(
-            {'_id': ObjectId(post_id)},
-            {'$inc': {'comment_count': 1}}
-        )
+        def create(session):
+            # Bumping the post's comment count doubles as the existence check
+            updated = db.posts.update_one({'_id': post_oid}, {'$inc': {'comment_count': 1}}, session=session)
+            if not updated.matched_count:
+                return None
+            try:
+                return db.comments.insert_one(comment, session=session).inserted_id
+            except Exception:
+                if session is None:
+                    db.posts.update_one({'_id': post_oid}, {'$inc': {'comment_count': -1}})
+                raise
+        
+        comment_id = database.run_in_transaction(create)
+        if comment_id is None:
+            return jsonify({"error": "Post not found"}), 404
+        comment['_id'] = str(comment_id)
         
         return jsonify(serialize_comment(comment)), 201
         
@@ -255,33 +413,195 @@ def delete_comment(comment_id):
     """Delete a comment (owner only)"""
     try:
         db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
         data = request.json
         user_id = data.get('user_id')
         
         if not user_id:
             return jsonify({"error": "user_id required"}), 400
         
-        # Find comment and verify ownership
-        comment = db.comments.find_one({'_id': ObjectId(comment_id)})
-        if not comment:
-            return jsonify({"error": "Comment not found"}), 404
+        comment_oid = ObjectId(comment_id)
         
-        if comment['user_id'] != user_id:
+        def delete(session):
+            # Ownership is part of the filter; the count follows in the same transaction
+            comment = db.comments.find_one_and_delete(
+                {'_id': comment_oid, 'user_id': user_id},
+                projection={'post_id': 1},
+                session=session
+            )
+            if comment:
+                db.posts.update_one(
+                    {'_id': ObjectId(comment['post_id'])},
+                    {'$inc': {'comment_count': -1}},
+                    session=session
+                )
+            return comment
+        
+        if not database.run_in_transaction(delete):
+            if not db.comments.find_one({'_id': comment_oid}, {'_id': 1}):
+                return jsonify({"error": "Comment not found"}), 404
             return jsonify({"error": "Unauthorized: Can only delete your own comments"}), 403
         
-        post_id = comment['post_id']
-        
-        # Delete comment
-        db.comments.delete_one({'_id': ObjectId(comment_id)})
-        
-        # Update comment count on post
-        db.posts.update_one(
-            {'_id': ObjectId(post_id)},
-            {'$inc': {'comment_count': -1}}
-        )
-        
         return jsonify({"message": "Comment deleted successfully"}), 200
         
     except Exception as e:
         print(f"Error deleting comment: {e}")
         return jsonify({"error": str(e)}), 500
+
+# ============================================
+# BULK IMPORT
+# ============================================
+
+def _parse_created_at(value):
+    """ISO 8601 string or epoch milliseconds -> naive UTC datetime."""
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, (int, float)):
+        return _EPOCH + timedelta(milliseconds=value)
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _import_record(record):
+    """Comment document for an import record; raises ValueError if invalid."""
+    if not isinstance(record, dict):
+        raise ValueError("record must be an object")
+    missing = [f for f in ('post_id', 'user_id', 'user_name', 'content') if not record.get(f)]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    if not ObjectId.is_valid(str(record['post_id'])):
+        raise ValueError("invalid post_id")
+    comment = {
+        'post_id': str(record['post_id']),
+        'user_id': str(record['user_id']),
+        'user_name': str(record['user_name']),
+        'content': str(record['content']),
+        'created_at': _parse_created_at(record.get('created_at')),
+    }
+    if record.get('legacy_id') is not None:
+        comment['legacy_id'] = str(record['legacy_id'])
+    return comment
+
+
+def _iter_import_records():
+    """Records from a JSON array / {"comments": [...]} body, or streamed NDJSON."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield e
+        return
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('comments')
+    if not isinstance(data, list):
+        raise ValueError("Body must be a JSON array of comments, {\"comments\": [...]}, or NDJSON")
+    yield from data
+
+
+def _write_import_batch(db, batch, known_posts, report):
+    """Insert one batch with an unordered bulk write; returns the post_ids that gained comments."""
+    post_ids = {comment['post_id'] for _, comment in batch} - known_posts
+    if post_ids:
+        found = db.posts.find({'_id': {'$in': [ObjectId(p) for p in post_ids]}}, {'_id': 1})
+        known_posts.update(str(post['_id']) for post in found)
+
+    ops, indexes = [], []
+    for index, comment in batch:
+        if comment['post_id'] not in known_posts:
+            report['rejected'] += 1
+            report['errors'].append({'index': index, 'error': 'post not found'})
+            continue
+        if 'legacy_id' in comment:
+            # Re-importing the same thread is a no-op
+            ops.append(UpdateOne({'legacy_id': comment['legacy_id']}, {'$setOnInsert': comment}, upsert=True))
+        else:
+            ops.append(InsertOne(comment))
+        indexes.append(index)
+    if not ops:
+        return set()
+
+    try:
+        result = db.comments.bulk_write(ops, ordered=False)
+        inserted, matched = result.inserted_count + result.upserted_count, result.matched_count
+    except BulkWriteError as e:
+        details = e.details
+        inserted, matched = details.get('nInserted', 0) + details.get('nUpserted', 0), details.get('nMatched', 0)
+        for error in details.get('writeErrors', []):
+            if error.get('code') == 11000:
+                # Concurrent import of the same legacy_id
+                matched += 1
+                continue
+            report['rejected'] += 1
+            report['errors'].append({'index': indexes[error['index']], 'error': error.get('errmsg')})
+    report['inserted'] += inserted
+    report['duplicates'] += matched
+    return {comment['post_id'] for _, comment in batch if comment['post_id'] in known_posts}
+
+
+@community_bp.route('/comments/import', methods=['POST'])
+def import_comments():
+    """
+    Bulk-import comment threads (e.g. from the old forum).
+    Requires the X-Import-Token header to match COMMUNITY_IMPORT_TOKEN.
+    Accepts a JSON array, {"comments": [...]}, or an application/x-ndjson
+    stream of {post_id, user_id, user_name, content, created_at?, legacy_id?}.
+    Records with a legacy_id are imported at most once. comment_count is
+    recomputed for every post that received comments.
+    """
+    if not IMPORT_TOKEN:
+        return jsonify({"error": "Bulk import is disabled (COMMUNITY_IMPORT_TOKEN not set)"}), 403
+    if request.headers.get('X-Import-Token') != IMPORT_TOKEN:
+        return jsonify({"error": "Invalid import token"}), 403
+
+    try:
+        db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        start = time.perf_counter()
+        report = {'received': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0, 'errors': []}
+        known_posts, touched, batch = set(), set(), []
+        try:
+            for index, record in enumerate(_iter_import_records()):
+                report['received'] += 1
+                try:
+                    if isinstance(record, Exception):
+                        raise ValueError(f"invalid JSON: {record}")
+                    batch.append((index, _import_record(record)))
+                except ValueError as e:
+                    report['rejected'] += 1
+                    report['errors'].append({'index': index, 'error': str(e)})
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    touched |= _write_import_batch(db, batch, known_posts, report)
+                    batch = []
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if batch:
+            touched |= _write_import_batch(db, batch, known_posts, report)
+
+        # Recount rather than increment, so duplicates and partial failures cannot skew the totals
+        counts = db.comments.aggregate([
+            {'$match': {'post_id': {'$in': list(touched)}}},
+            {'$group': {'_id': '$post_id', 'count': {'$sum': 1}}},
+        ])
+        updates = [UpdateOne({'_id': ObjectId(row['_id'])}, {'$set': {'comment_count': row['count']}}) for row in counts]
+        if updates:
+            db.posts.bulk_write(updates, ordered=False)
+
+        elapsed = time.perf_counter() - start
+        report['errors'] = report['errors'][:100]
+        report['posts_updated'] = len(updates)
+        report['elapsed_ms'] = round(elapsed * 1000.0, 1)
+        report['per_second'] = round(report['received'] / elapsed) if elapsed else None
+        return jsonify(report), 200
+
+    except Exception as e:
+        print(f"Error importing comments: {e}")
+        return jsonify({"error": str(e)}), 500
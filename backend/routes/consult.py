@@ -1,48 +1,58 @@
-import os
-import requests
 import json
+import os
+import threading
+import time
 from flask import Blueprint, request, jsonify
 from dotenv import load_dotenv
 
+from backend import llm_client
+from backend.cache import LRUCache, MongoCache, SingleFlight, TieredCache
+
 load_dotenv()
 
 consult_bp = Blueprint('consult', __name__)
 
-
-@consult_bp.route('/api/consult', methods=['POST'])
-def consult_expert():
-    """
-    AI consultation endpoint using OpenAI Chat Completions API.
-    - Uses only pest detection result (label + confidence) as requested.
-    - Accepts optional `diagnosis_text` (plain text summary from frontend).
-    """
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return jsonify({"error": "OPENAI_API_KEY not found in environment"}), 503
-
+# Bump whenever the prompt below changes so old reports stop being served
+PROMPT_VERSION = 1
+
+# Reports for one (label, confidence bucket, language) are interchangeable, so
+# they are cached. Past CONSULT_CACHE_FRESH seconds an entry is still served
+# but regenerated in the background; after CONSULT_CACHE_TTL it is dropped.
+CONSULT_CACHE_SIZE = int(os.getenv("CONSULT_CACHE_SIZE", "2048"))
+CONSULT_CACHE_FRESH = float(os.getenv("CONSULT_CACHE_FRESH", str(7 * 24 * 3600)))
+CONSULT_CACHE_TTL = float(os.getenv("CONSULT_CACHE_TTL", str(30 * 24 * 3600)))
+CONSULT_CACHE_MONGO = os.getenv("CONSULT_CACHE_MONGO", "1").lower() in ("1", "true", "yes")
+# Upper edges of the confidence buckets, e.g. 0.5,0.7,0.9 -> <50%, 50-70%, 70-90%, 90-100%
+CONFIDENCE_BUCKETS = sorted(
+    float(edge) for edge in os.getenv("CONSULT_CONFIDENCE_BUCKETS", "0.5,0.7,0.9").split(",") if edge.strip()
+)
+
+_cache = TieredCache(
+    LRUCache(maxsize=CONSULT_CACHE_SIZE, ttl=CONSULT_CACHE_TTL),
+    MongoCache("consult_cache", ttl=CONSULT_CACHE_TTL) if CONSULT_CACHE_MONGO else None,
+)
+_flights = SingleFlight()
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+
+def confidence_bucket(confidence):
+    """0.87 -> '70-90%' with the default edges."""
     try:
-        data = request.get_json(force=True, silent=True) or {}
-
-        # Preferred: plain text from frontend (already extracted after diagnosis)
-        diagnosis_text = data.get("diagnosis_text")
-
-        # Also accept raw pest_data for backward compatibility
-        pest_data = data.get("pest_data", {}) or {}
-        pest_label = pest_data.get("label", "Unknown")
-        pest_conf = pest_data.get("confidence", 0)
-
-        if diagnosis_text:
-            # Use the provided text, but keep it focused on pest result
-            prompt_body = diagnosis_text
-        else:
-            # Construct a simple text description from pest_data only
-            prompt_body = f"Pest Detection: {pest_label} (Confidence: {pest_conf:.2%})"
-
-        # Language Preference
-        language = data.get("language", "English")
-
-        # Final prompt sent to OpenAI
-        prompt_text = f"""You are an expert agricultural scientist and plant pathologist.
+        confidence = min(max(float(confidence), 0.0), 1.0)
+    except (TypeError, ValueError):
+        confidence = 0.0
+    low = 0.0
+    for edge in CONFIDENCE_BUCKETS:
+        if confidence < edge:
+            return f"{low:.0%}-{edge:.0%}" if low else f"<{edge:.0%}"
+        low = edge
+    return f"{low:.0%}-100%"
+
+
+def build_messages(prompt_body, language):
+    # Final prompt sent to OpenAI
+    prompt_text = f"""You are an expert agricultural scientist and plant pathologist.
         
 The system has scanned a crop image and detected:
 {prompt_body}
@@ -73,98 +83,152 @@ Use simple, encouraging language for farmers.
 Return ONLY valid JSON.
 """
 
-        url = "https://api.openai.com/v1/chat/completions"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        }
-        payload = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are an expert agricultural scientist. Respond only with valid JSON.",
-                },
-                {"role": "user", "content": prompt_text},
-            ],
-            "temperature": 0.7,
-            "max_tokens": 800,
-        }
-
-        print("Sending request to OpenAI API (gpt-4o-mini)...")
-
-        # Simple retry for 429 / 503
-        import time
-
-        max_retries = 3
-        for attempt in range(max_retries):
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-
-            if response.status_code == 200:
-                break
-
-            if response.status_code in (429, 503) and attempt < max_retries - 1:
-                sleep_time = 2 * (attempt + 1)
-                print(
-                    f"OpenAI rate/overload ({response.status_code}). "
-                    f"Retrying in {sleep_time}s..."
-                )
-                time.sleep(sleep_time)
-                continue
-
-            # Non‑retriable or final failure
-            print(f"OpenAI API Error ({response.status_code}): {response.text}")
-            try:
-                err_json = response.json()
-                err_msg = err_json.get("error", {}).get("message", response.text)
-            except Exception:
-                err_msg = response.text
-
-            return (
-                jsonify(
-                    {
-                        "error": f"AI API Error: {err_msg}",
-                        "status": response.status_code,
-                    }
-                ),
-                response.status_code,
-            )
-
-        response_json = response.json()
-
-        # Extract text from OpenAI response
+    return [
+        {
+            "role": "system",
+            "content": "You are an expert agricultural scientist. Respond only with valid JSON.",
+        },
+        {"role": "user", "content": prompt_text},
+    ]
+
+
+def generate_report(prompt_body, language):
+    """
+    One LLM call. Returns {"raw", "clean", "report", "generated_at"};
+    "report" is the parsed JSON, or None if the model did not return valid JSON.
+    """
+    print(f"Sending request to OpenAI API ({llm_client.DEFAULT_MODEL})...")
+    # Backoff/retry for 429 / 5xx and the concurrency limit live in the shared client
+    raw_text = llm_client.chat_completion(build_messages(prompt_body, language), temperature=0.7, max_tokens=800)
+    clean_text = llm_client.strip_code_fences(raw_text)
+    try:
+        report = json.loads(clean_text)
+    except ValueError:
+        report = None
+    return {"raw": raw_text, "clean": clean_text, "report": report, "generated_at": time.time()}
+
+
+def _normalize(text):
+    return " ".join(str(text).split()).casefold()
+
+
+def cache_key(label, bucket, language):
+    return f"consult:v{PROMPT_VERSION}:{llm_client.DEFAULT_MODEL}:{_normalize(label)}:{bucket}:{_normalize(language)}"
+
+
+def _generate_and_store(key, prompt_body, language):
+    entry = generate_report(prompt_body, language)
+    if entry["report"] is not None:
+        _cache.set(key, entry)
+    return entry
+
+
+def _refresh_in_background(key, prompt_body, language):
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
         try:
-            raw_text = response_json["choices"][0]["message"]["content"]
-        except (KeyError, IndexError) as e:
-            print(f"Failed to extract text from OpenAI response: {e}")
-            print(f"Full response: {json.dumps(response_json, indent=2)}")
-            return (
-                jsonify(
-                    {
-                        "error": "AI response was empty or malformed.",
-                        "details": response_json.get("error", response_json),
-                    }
-                ),
-                400,
-            )
-
-        # Clean up markdown code fences if present
-        clean_text = raw_text.strip()
-        if clean_text.startswith("```"):
-            parts = clean_text.split("```", 2)
-            if len(parts) > 1:
-                clean_text = parts[1]
-                if clean_text.startswith("json"):
-                    clean_text = clean_text[4:]
-            clean_text = clean_text.strip()
-
-        return jsonify({"raw": raw_text, "clean": clean_text})
+            _flights.do(key, lambda: _generate_and_store(key, prompt_body, language))
+        except Exception as e:
+            # Keep serving the stale report; the next request will try again
+            print(f"Consult cache refresh failed for {key}: {e}")
+        finally:
+            with _refresh_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=run, name="consult-refresh", daemon=True).start()
+
+
+def get_report(label, confidence, language):
+    """
+    (entry, cache_state) for a pest label, with cache_state one of
+    "HIT", "STALE" (served, refresh started) or "MISS".
+    """
+    bucket = confidence_bucket(confidence)
+    key = cache_key(label, bucket, language)
+    prompt_body = f"Pest Detection: {label} (Confidence: {bucket})"
+
+    entry = _cache.get(key)
+    if entry is not None:
+        if time.time() - entry["generated_at"] > CONSULT_CACHE_FRESH:
+            _refresh_in_background(key, prompt_body, language)
+            return entry, "STALE"
+        return entry, "HIT"
+
+    def fill():
+        # Filled by whoever led the previous flight for this key
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached
+        return _generate_and_store(key, prompt_body, language)
+
+    return _flights.do(key, fill), "MISS"
+
+
+@consult_bp.route('/api/consult', methods=['POST'])
+def consult_expert():
+    """
+    AI consultation endpoint using OpenAI Chat Completions API.
+    - Uses only pest detection result (label + confidence) as requested.
+    - Accepts optional `diagnosis_text` (plain text summary from frontend).
+    - When `pest_data` carries a label, the report is built from the label and
+      a confidence bucket and served from cache (X-Cache: HIT/STALE/MISS).
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return jsonify({"error": "OPENAI_API_KEY not found in environment"}), 503
+
+    try:
+        data = request.get_json(force=True, silent=True) or {}
+
+        # Preferred: plain text from frontend (already extracted after diagnosis)
+        diagnosis_text = data.get("diagnosis_text")
+
+        # Also accept raw pest_data for backward compatibility
+        pest_data = data.get("pest_data", {}) or {}
+        pest_label = pest_data.get("label")
+        pest_conf = pest_data.get("confidence", 0)
+
+        # Language Preference
+        language = data.get("language", "English")
+
+        try:
+            if pest_label:
+                # The frontend's diagnosis_text is rendered from pest_data, so the
+                # structured fields give the same prompt in a cacheable form
+                entry, cache_state = get_report(pest_label, pest_conf, language)
+            else:
+                # Free text (or nothing at all) is not worth caching
+                prompt_body = diagnosis_text or f"Pest Detection: Unknown (Confidence: {pest_conf:.2%})"
+                entry, cache_state = generate_report(prompt_body, language), "BYPASS"
+        except llm_client.LLMError as e:
+            print(f"OpenAI API Error ({e.status}): {e.message}")
+            body = {"error": e.message, "status": e.status}
+            if e.details is not None and e.status == 502:
+                body["details"] = e.details
+            return jsonify(body), e.status
+
+        response = jsonify({"raw": entry["raw"], "clean": entry["clean"], "report": entry["report"]})
+        response.headers["X-Cache"] = cache_state
+        return response
 
     except Exception as e:
         print(f"Server Error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@consult_bp.route("/api/consult/stats", methods=["GET"])
+def consult_stats():
+    return jsonify({
+        "cache": _cache.stats(),
+        "coalescing": _flights.stats(),
+        "refreshing": len(_refreshing),
+    })
+
+
 @consult_bp.route("/api/consult/test", methods=["GET"])
 def test_consult_env():
     import sys
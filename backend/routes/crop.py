@@ -1,6 +1,8 @@
 # routes/crop.py
 from flask import Blueprint, request, jsonify
-from backend.inference.crop_model import predict_crop_health
+from backend.inference.crop_model import decode_image, predict_crop_health, predict_crop_health_batch
+from backend.inference import prediction_cache, preprocessing
+from backend.routes.batch_stream import iter_uploaded_images, ndjson_response, stream_predictions
 
 crop_bp = Blueprint("crop", __name__, url_prefix="/api/predict")
 
@@ -17,3 +19,21 @@ def crop_predict():
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+@crop_bp.route("/crop/batch", methods=["POST"])
+def crop_predict_batch():
+    """Many `files` and/or zip/tar archives in; one NDJSON line per image out."""
+    if not request.files:
+        return jsonify({"error": "No files uploaded"}), 400
+
+    records = stream_predictions(
+        iter_uploaded_images(request.files),
+        preprocess=decode_image,
+        predict_batch=predict_crop_health_batch,
+        sample_shape=preprocessing.CROP_SHAPE,
+    )
+    return ndjson_response(records)
+
+@crop_bp.route("/crop/stats", methods=["GET"])
+def crop_stats():
+    return jsonify({"cache": prediction_cache.stats()})
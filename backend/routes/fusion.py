@@ -0,0 +1,47 @@
+import io
+
+import numpy as np
+from flask import Blueprint, jsonify, request
+
+from backend.inference import fusion
+
+fusion_bp = Blueprint("fusion", __name__, url_prefix="/api/predict")
+
+MS_SHAPE = (224, 224, 4)
+
+
+def load_ms_patch(file):
+    """(224, 224, 4) float32 patch from an uploaded .npy (HWC or CHW)."""
+    patch = np.load(io.BytesIO(file.read()), allow_pickle=False)
+    if patch.shape == (MS_SHAPE[2],) + MS_SHAPE[:2]:
+        patch = patch.transpose(1, 2, 0)
+    if patch.shape != MS_SHAPE:
+        raise ValueError(f"multispectral patch must have shape {MS_SHAPE} (or channels-first), got {patch.shape}")
+    return patch.astype(np.float32)
+
+
+@fusion_bp.route("/fusion", methods=["POST"])
+def fusion_predict():
+    """
+    One diagnosis from all models, run concurrently. Form fields: `file`
+    (RGB image), optional `multispectral` (.npy 224x224x4 patch) and
+    `weights` (e.g. "pest=0.5,crop=0.3,multispectral=0.2").
+    """
+    if "file" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    try:
+        weights = fusion.parse_weights(request.form.get("weights"))
+        ms_patch = None
+        if "multispectral" in request.files:
+            ms_patch = load_ms_patch(request.files["multispectral"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        result = fusion.diagnose(request.files["file"].read(), ms_patch, weights)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if result["diagnosis"] is None:
+        return jsonify(result), 500
+    return jsonify(result), 200
@@ -1,39 +1,220 @@
-from flask import Blueprint, request, jsonify
-from backend.database import db
+import hashlib
+import os
+import re
+import threading
+import time
+from flask import Blueprint, Response, request, jsonify
+from werkzeug.http import http_date
+from backend import database
+from backend.cache import LRUCache
+from backend.database import get_db
 from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, ReturnDocument
 import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
 market_bp = Blueprint("market", __name__)
 
+PAGE_SIZE = int(os.getenv("MARKET_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MARKET_MAX_PAGE_SIZE", "200"))
+
+# Fields a client may ask for with ?fields=name,price,...; search_terms stays internal
+ITEM_FIELDS = ("name", "company", "price", "category", "image", "description", "created_at")
+BROWSE_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+# Listing responses are cached as serialized bytes per catalogue version. create_item and
+# delete_item bump the version in MongoDB; other processes notice within MARKET_VERSION_TTL.
+CACHE_SIZE = int(os.getenv("MARKET_CACHE_SIZE", "512"))
+# A page body grows with limit, descriptions and image URLs, so the cache is also bounded by bytes
+CACHE_MB = float(os.getenv("MARKET_CACHE_MB", "64"))
+VERSION_TTL = float(os.getenv("MARKET_VERSION_TTL", "1"))
+CLIENT_MAX_AGE = int(os.getenv("MARKET_CLIENT_MAX_AGE", "0"))
+
+_pages = LRUCache(maxsize=CACHE_SIZE, maxbytes=int(CACHE_MB * 1024 * 1024), sizeof=lambda entry: len(entry["body"]))
+_version = {"value": None, "checked": 0.0}
+_version_lock = threading.Lock()
+
+
+@database.on_connect
+def ensure_indexes(db):
+    db.market.create_indexes([
+        # Ranked full-text search; a match in the name counts most
+        IndexModel(
+            [("name", TEXT), ("company", TEXT), ("description", TEXT)],
+            weights={"name": 10, "company": 4, "description": 1},
+            name="market_text",
+        ),
+        # Word-prefix search while the user is still typing ("ure" -> "Urea")
+        IndexModel([("search_terms", ASCENDING)], name="market_terms"),
+        IndexModel([("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="market_by_category"),
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="market_newest"),
+    ])
+
+
+def search_terms(*texts):
+    """Lower-cased words of the given texts, for the prefix index."""
+    return sorted({word for text in texts if text for word in re.findall(r"\w+", str(text).casefold())})
+
+
+def projection_for(fields=None):
+    if not fields:
+        return {"search_terms": 0}
+    wanted = [f for f in fields if f in ITEM_FIELDS]
+    return {f: 1 for f in wanted} or {"search_terms": 0}
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        # Same format Flask's jsonify uses
+        return http_date(value)
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(items):
+    if orjson is not None:
+        return orjson.dumps(items, default=_json_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    import json
+
+    return json.dumps(items, default=_json_default).encode()
+
+
+def catalogue_version(db):
+    """Current catalogue version, re-read from MongoDB at most every MARKET_VERSION_TTL seconds."""
+    now = time.monotonic()
+    if _version["value"] is not None and now - _version["checked"] < VERSION_TTL:
+        return _version["value"]
+    doc = db.market_meta.find_one({"_id": "catalogue"}, {"version": 1})
+    with _version_lock:
+        _version.update(value=doc["version"] if doc else 0, checked=now)
+    return _version["value"]
+
+
+def invalidate(db):
+    """Call after any catalogue write: new version for every process, local cache dropped."""
+    doc = db.market_meta.find_one_and_update(
+        {"_id": "catalogue"},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    with _version_lock:
+        _version.update(value=doc["version"], checked=time.monotonic())
+    _pages.clear()
+
+
+def search_items(db, search=None, category=None, page=1, limit=PAGE_SIZE, mode="auto", fields=None):
+    """
+    One page of marketplace items -> (items, mode_used, has_more).
+
+    mode "text" ranks by MongoDB text score over name/company/description;
+    "prefix" matches items having a word starting with every query word;
+    "auto" tries text and falls back to prefix when text matches no item at
+    all, on every page, so paging an auto search stays on one mode.
+    Without a search the newest items come first.
+    """
+    query = {}
+    if category and category != "All":
+        query["category"] = category
+    projection = projection_for(fields)
+    skip = (page - 1) * limit
+
+    def run(filters, sort, extra_projection=None):
+        cursor = db.market.find({**query, **filters}, {**projection, **(extra_projection or {})})
+        return list(cursor.sort(sort).skip(skip).limit(limit + 1))
+
+    items, used = None, "browse"
+    if search:
+        fallback = mode == "prefix"
+        if mode in ("auto", "text"):
+            used = "text"
+            text = {"$text": {"$search": search}}
+            score = {"score": {"$meta": "textScore"}}
+            items = run(text, [("score", {"$meta": "textScore"}), ("_id", ASCENDING)], score)
+            for item in items:
+                item.pop("score", None)
+            if mode == "auto" and not items:
+                # An empty later page only means text results ran out; fall back only if there were none
+                fallback = page == 1 or db.market.find_one({**query, **text}, {"_id": 1}) is None
+        if fallback:
+            words = search_terms(search)
+            if words:
+                used = "prefix"
+                prefixes = [{"search_terms": {"$regex": f"^{re.escape(word)}"}} for word in words]
+                items = run({"$and": prefixes}, [("name", ASCENDING), ("_id", ASCENDING)])
+        if items is None:
+            items = []
+    else:
+        items = run({}, BROWSE_SORT)
+
+    has_more = len(items) > limit
+    return items[:limit], used, has_more
+
+
 @market_bp.route("/api/market", methods=["GET"])
 def get_items():
+    """
+    List or search items: ?category=&search=&page=1&limit=50&mode=auto|text|prefix&fields=name,price
+    The body stays a plain list; paging info is in X-Page, X-Limit, X-Has-More and X-Search-Mode.
+    Responses are cached per catalogue version and carry an ETag for If-None-Match.
+    """
+    db = get_db()
     if db is None:
         return jsonify({"error": "Database connection failed"}), 500
 
     try:
         # Filter by category if provided
         category = request.args.get("category")
-        search_query = request.args.get("search")
+        search_query = (request.args.get("search") or "").strip()
+        mode = request.args.get("mode", "auto")
+        if mode not in ("auto", "text", "prefix"):
+            return jsonify({"error": "mode must be auto, text or prefix"}), 400
+        try:
+            page = max(int(request.args.get("page", 1)), 1)
+            limit = min(max(int(request.args.get("limit", PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({"error": "page and limit must be integers"}), 400
+        fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
 
-        query = {}
-        if category and category != "All":
-            query["category"] = category
-        
-        if search_query:
-            query["name"] = {"$regex": search_query, "$options": "i"}
-        
-        items = list(db.market.find(query))
-        
-        # Convert ObjectId to string for JSON serialization
-        for item in items:
-            item["_id"] = str(item["_id"])
-            
-        return jsonify(items), 200
+        key = (catalogue_version(db), category, search_query, page, limit, mode, tuple(fields))
+        entry = _pages.get(key)
+        if entry is None:
+            items, used, has_more = search_items(db, search_query, category, page, limit, mode, fields)
+            body = dumps(items)
+            entry = {
+                "body": body,
+                "etag": hashlib.blake2b(body, digest_size=12).hexdigest(),
+                "headers": {
+                    "X-Page": str(page),
+                    "X-Limit": str(limit),
+                    "X-Has-More": "true" if has_more else "false",
+                    "X-Search-Mode": used,
+                },
+            }
+            _pages.set(key, entry)
+
+        # Clients revalidate with If-None-Match and get an empty 304 if nothing changed
+        status = 304 if request.if_none_match.contains(entry["etag"]) else 200
+        response = Response(
+            entry["body"] if status == 200 else b"",
+            status=status,
+            mimetype="application/json",
+            headers=entry["headers"],
+        )
+        response.set_etag(entry["etag"])
+        response.headers["Cache-Control"] = f"public, max-age={CLIENT_MAX_AGE}"
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @market_bp.route("/api/market", methods=["POST"])
 def create_item():
+    db = get_db()
     if db is None:
         return jsonify({"error": "Database connection failed"}), 500
 
@@ -56,9 +237,12 @@ def create_item():
             "description": data.get("description", ""),
             "created_at": datetime.datetime.utcnow()
         }
+        new_item["search_terms"] = search_terms(new_item["name"], new_item["company"])
         
         result = db.market.insert_one(new_item)
+        invalidate(db)
         new_item["_id"] = str(result.inserted_id)
+        new_item.pop("search_terms")
         
         return jsonify(new_item), 201
     except Exception as e:
@@ -66,14 +250,21 @@ def create_item():
 
 @market_bp.route("/api/market/<id>", methods=["DELETE"])
 def delete_item(id):
+    db = get_db()
     if db is None:
         return jsonify({"error": "Database connection failed"}), 500
 
     try:
         result = db.market.delete_one({"_id": ObjectId(id)})
         if result.deleted_count == 1:
+            invalidate(db)
             return jsonify({"message": "Item deleted"}), 200
         else:
             return jsonify({"error": "Item not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@market_bp.route("/api/market/stats", methods=["GET"])
+def market_stats():
+    return jsonify({"version": _version["value"], "cache": _pages.stats()}), 200
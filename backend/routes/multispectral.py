@@ -1,7 +1,179 @@
-from flask import Blueprint, jsonify
+import os
+import tempfile
+
+from flask import Blueprint, jsonify, request
+
+from backend.inference import rasters, sentinel2, vegetation_indices
+from backend.inference.multispectral_model import predict_raster
 
 multispec_bp = Blueprint("multispec", __name__, url_prefix="/api/predict")
 
-@multispec_bp.route("/multispectral", methods=["GET","POST"]) # only get added for testing purpose
+RASTER_EXTENSIONS = rasters.NPY_EXTENSIONS + rasters.GEOTIFF_EXTENSIONS
+SENTINEL2_DATA_DIR = os.getenv("SENTINEL2_DATA_DIR", "datasets")
+
+
+def save_upload(file):
+    """Stream an uploaded raster to a temp file so it can be memory-mapped / window-read."""
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    if ext not in RASTER_EXTENSIONS:
+        raise ValueError(f"Unsupported raster format '{ext}' (expected one of {', '.join(RASTER_EXTENSIONS)})")
+    fd, path = tempfile.mkstemp(suffix=ext, prefix="raster_")
+    os.close(fd)
+    file.save(path)
+    return path
+
+
+@multispec_bp.route("/multispectral", methods=["GET"]) # only get added for testing purpose
 def multispectral_route():
     return jsonify({"message": "Multispectral model active!"}), 200
+
+
+@multispec_bp.route("/multispectral", methods=["POST"])
+def multispectral_predict():
+    """
+    Tile a 4-band raster (.npy HWC/CHW, or GeoTIFF) into 224x224 windows and
+    classify each one. Form fields: `file`, optional `overlap` (pixels) and
+    `batch_size`.
+    """
+    if "file" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    try:
+        overlap = int(request.form.get("overlap", 0))
+        batch_size = max(1, int(request.form.get("batch_size", 32)))
+    except ValueError:
+        return jsonify({"error": "overlap and batch_size must be integers"}), 400
+
+    path = None
+    source = None
+    try:
+        path = save_upload(request.files["file"])
+        source = rasters.open_raster(path)
+        result = predict_raster(source, overlap=overlap, batch_size=batch_size)
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        if source is not None:
+            source.close()
+        if path is not None:
+            os.remove(path)
+
+
+@multispec_bp.route("/multispectral/indices", methods=["POST"])
+def multispectral_indices():
+    """
+    Vegetation indices with summary statistics over a band raster.
+    Form fields: `file`, optional `fields` (label raster for per-field stats),
+    `bands` (comma-separated band order, default blue,green,red,nir),
+    `indices` (default ndvi,savi,evi,gndvi), `scale` (DN -> reflectance,
+    default 0.0001) and `preview_size` (longest side of the returned maps, 0 = none).
+    """
+    if "file" not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    try:
+        band_order = [b.strip() for b in request.form.get("bands", ",".join(vegetation_indices.DEFAULT_BANDS)).split(",")]
+        indices = [i.strip() for i in request.form.get("indices", "ndvi,savi,evi,gndvi").split(",") if i.strip()]
+        scale = float(request.form.get("scale", vegetation_indices.REFLECTANCE_SCALE))
+        preview_size = int(request.form.get("preview_size", 128))
+    except ValueError:
+        return jsonify({"error": "scale must be a number and preview_size an integer"}), 400
+
+    paths = []
+    sources = []
+    try:
+        paths.append(save_upload(request.files["file"]))
+        sources.append(rasters.open_raster(paths[-1]))
+        fields = None
+        if "fields" in request.files:
+            paths.append(save_upload(request.files["fields"]))
+            fields = rasters.open_raster(paths[-1])
+            sources.append(fields)
+
+        result = vegetation_indices.compute_indices(
+            sources[0],
+            indices=indices,
+            band_order=band_order,
+            scale=scale,
+            fields=fields,
+            preview_size=preview_size,
+        )
+        return jsonify(result), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        for source in sources:
+            source.close()
+        for path in paths:
+            os.remove(path)
+
+
+@multispec_bp.route("/multispectral/sentinel2", methods=["POST"])
+def multispectral_sentinel2():
+    """
+    Ingest a farm's bounding box from a local Sentinel-2 .SAFE product and
+    analyse it. JSON body:
+      product: .SAFE directory, relative to SENTINEL2_DATA_DIR
+      bbox: [minx, miny, maxx, maxy], bbox_crs: e.g. "EPSG:4326" (default: tile CRS)
+      bands: extra bands beyond B02,B03,B04,B08 (e.g. ["B05"] for NDRE)
+      analysis: "predict", "indices" or "both" (default "both")
+      harmonize: apply the L2A BOA_ADD_OFFSET (default false, matching model training)
+    """
+    data = request.get_json(silent=True) or {}
+    product = data.get("product")
+    if not product:
+        return jsonify({"error": "product is required"}), 400
+    analysis = data.get("analysis", "both")
+    if analysis not in ("predict", "indices", "both"):
+        return jsonify({"error": "analysis must be predict, indices or both"}), 400
+
+    root = os.path.realpath(SENTINEL2_DATA_DIR)
+    safe_path = os.path.realpath(os.path.join(root, product))
+    if not safe_path.startswith(root + os.sep):
+        return jsonify({"error": "product must be inside the Sentinel-2 data directory"}), 400
+
+    bands = list(sentinel2.DEFAULT_BANDS) + [
+        b.upper() for b in data.get("bands", []) if b.upper() not in sentinel2.DEFAULT_BANDS
+    ]
+    fd, path = tempfile.mkstemp(suffix=".npy", prefix="s2_")
+    os.close(fd)
+    sources = []
+    try:
+        meta = sentinel2.ingest(
+            safe_path,
+            path,
+            bbox=data.get("bbox"),
+            bbox_crs=data.get("bbox_crs"),
+            bands=bands,
+            harmonize=bool(data.get("harmonize", False)),
+        )
+        meta.pop("output", None)
+        result = {"ingest": meta}
+
+        if analysis in ("predict", "both"):
+            sources.append(rasters.open_raster(path, bands=range(len(sentinel2.DEFAULT_BANDS))))
+            result["prediction"] = predict_raster(sources[-1], overlap=int(data.get("overlap", 0)))
+        if analysis in ("indices", "both"):
+            sources.append(rasters.open_raster(path))
+            band_order = [sentinel2.BAND_ROLES.get(b, b.lower()) for b in bands]
+            indices = ["ndvi", "savi", "evi", "gndvi"] + (["ndre"] if "rededge" in band_order else [])
+            result["indices"] = vegetation_indices.compute_indices(
+                sources[-1],
+                indices=data.get("indices", indices),
+                band_order=band_order,
+                preview_size=int(data.get("preview_size", 128)),
+            )
+        return jsonify(result), 200
+    except (ValueError, FileNotFoundError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        for source in sources:
+            source.close()
+        os.remove(path)
@@ -4,11 +4,19 @@ from http import HTTPStatus
 
 from flask import Blueprint, jsonify, request
 
-from ..inference.pest_model import get_model
+from ..inference import prediction_cache, preprocessing, workers
+from .batch_stream import iter_uploaded_images, ndjson_response, stream_predictions
 
 pest_bp = Blueprint("pest", __name__, url_prefix="/api/predict")
 
 
+def _pest_model():
+    # Imported on first use so that booting the app does not import Torch
+    from ..inference import pest_model
+
+    return pest_model
+
+
 @pest_bp.post("/pest")
 def predict_pest():
     if "file" not in request.files:
@@ -19,8 +27,7 @@ def predict_pest():
         return jsonify(error="Empty filename"), HTTPStatus.BAD_REQUEST
 
     image_bytes = file.read()
-    model = get_model()
-    label, confidence, probabilities = model.predict_image(image_bytes)
+    label, confidence, probabilities = _pest_model().predict(image_bytes)
 
     return jsonify(
         {
@@ -32,3 +39,34 @@ def predict_pest():
     )
 
 
+@pest_bp.post("/pest/batch")
+def predict_pest_batch():
+    """Many `files` and/or zip/tar archives in; one NDJSON line per image out."""
+    if not request.files:
+        return jsonify(error="Missing 'files' in multipart form-data"), HTTPStatus.BAD_REQUEST
+
+    pest_model = _pest_model()
+
+    def predict_batch(tensors):
+        return [
+            {"label": label, "confidence": confidence}
+            for label, confidence, _ in pest_model.predict_arrays(tensors)
+        ]
+
+    records = stream_predictions(
+        iter_uploaded_images(request.files),
+        preprocess=preprocessing.pest_array,
+        predict_batch=predict_batch,
+        sample_shape=preprocessing.PEST_SHAPE,
+    )
+    return ndjson_response(records)
+
+
+@pest_bp.get("/pest/stats")
+def pest_stats():
+    """Achieved batch sizes, queue latency and prediction-cache hit rate."""
+    pest_model = _pest_model()
+    batching = {"enabled": False}
+    if pest_model.BATCHING_ENABLED:
+        batching = {"enabled": True, **pest_model.batcher_stats()}
+    return jsonify(batching=batching, cache=prediction_cache.stats(), workers=workers.status().get("pest"))
@@ -1,30 +1,47 @@
-import os
-import requests
 import json
+import os
 from flask import Blueprint, request, jsonify
 from dotenv import load_dotenv
 
+from backend import llm_client
+from backend.cache import LRUCache, MongoCache, SingleFlight, TieredCache
+
 load_dotenv()
 
 tips_bp = Blueprint('tips', __name__)
 
-@tips_bp.route('/api/tips', methods=['POST'])
-def get_cultivation_tips():
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-         return jsonify({"error": "OPENAI_API_KEY not configured"}), 500
+# Tips for a (crop, language) pair are effectively static, so they are cached
+# in-process and in MongoDB; concurrent misses for one pair share a single LLM call.
+TIPS_CACHE_SIZE = int(os.getenv("TIPS_CACHE_SIZE", "1024"))
+TIPS_CACHE_TTL = float(os.getenv("TIPS_CACHE_TTL", str(30 * 24 * 3600)))
+TIPS_CACHE_MONGO = os.getenv("TIPS_CACHE_MONGO", "1").lower() in ("1", "true", "yes")
 
-    data = request.json
-    crop_name = data.get('crop_name')
-    language = data.get('language', 'English')
+# Pre-warmed by `python -m backend.scripts.prewarm_tips` (same names the UI sends)
+TOP_CROPS = ["Rice (Paddy)", "Wheat", "Tomato", "Potato", "Cotton", "Sugarcane", "Maize (Corn)", "Chilli"]
+SUPPORTED_LANGUAGES = ["English", "Hindi"]
+
+_cache = TieredCache(
+    LRUCache(maxsize=TIPS_CACHE_SIZE, ttl=TIPS_CACHE_TTL),
+    MongoCache("tips_cache", ttl=TIPS_CACHE_TTL) if TIPS_CACHE_MONGO else None,
+)
+_flights = SingleFlight()
+
+
+def normalize(text):
+    """'  Wheat ' / 'WHEAT' -> 'wheat'."""
+    return " ".join(str(text).split()).casefold()
 
-    if not crop_name:
-        return jsonify({"error": "Crop name is required"}), 400
 
+def cache_key(crop_name, language):
+    return f"tips:{llm_client.DEFAULT_MODEL}:{normalize(crop_name)}:{normalize(language)}"
+
+
+def generate_tips(crop_name, language):
+    """Ask the LLM for tips; returns the JSON text with any code fences removed."""
     # Prompt adapted for OpenAI
     prompt_text = f"""You are an expert agricultural scientist.
     Provide detailed cultivation tips for the crop: '{crop_name}'.
-    
+
     RETURN ONLY JSON in the following format. Ensure all values are in {language} language.
     If {language} is Hindi, use Devanagari script.
 
@@ -38,49 +55,75 @@ def get_cultivation_tips():
     }}
     """
 
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
-    payload = {
-        "model": "gpt-4o-mini",
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are an expert agricultural scientist. Respond only with valid JSON.",
-            },
-            {"role": "user", "content": prompt_text},
-        ],
-        "temperature": 0.5,
-        "max_tokens": 800,
-    }
+    messages = [
+        {
+            "role": "system",
+            "content": "You are an expert agricultural scientist. Respond only with valid JSON.",
+        },
+        {"role": "user", "content": prompt_text},
+    ]
+
+    raw_text = llm_client.chat_completion(messages, temperature=0.5, max_tokens=800)
+    return llm_client.strip_code_fences(raw_text)
+
+
+def get_tips(crop_name, language, refresh=False):
+    """(tips_text, cached) for the pair, generating and caching on a miss."""
+    key = cache_key(crop_name, language)
+    if not refresh:
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached, True
+
+    def fill():
+        # Another request may have filled the cache while this one waited to lead
+        if not refresh:
+            cached = _cache.get(key)
+            if cached is not None:
+                return cached
+        text = generate_tips(crop_name, language)
+        try:
+            json.loads(text)
+        except ValueError:
+            # Serve it, but don't pin a malformed answer for a month
+            return text
+        _cache.set(key, text)
+        return text
+
+    return _flights.do(key, fill), False
+
+
+@tips_bp.route('/api/tips', methods=['POST'])
+def get_cultivation_tips():
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+         return jsonify({"error": "OPENAI_API_KEY not configured"}), 500
+
+    data = request.json
+    crop_name = data.get('crop_name')
+    language = data.get('language', 'English')
+
+    if not crop_name:
+        return jsonify({"error": "Crop name is required"}), 400
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code != 200:
-             return jsonify({"error": f"OpenAI API Error: {response.text}"}), response.status_code
-
-        response_json = response.json()
-        raw_text = response_json["choices"][0]["message"]["content"]
-
-        # Clean up markdown code fences if present (Standard robust parsing)
-        clean_text = raw_text.strip()
-        if clean_text.startswith("```"):
-            parts = clean_text.split("```", 2)
-            if len(parts) > 1:
-                clean_text = parts[1]
-                if clean_text.startswith("json"):
-                    clean_text = clean_text[4:]
-            clean_text = clean_text.strip()
-        
-        return jsonify({
-            "success": True, 
+        clean_text, cached = get_tips(crop_name, language)
+
+        response = jsonify({
+            "success": True,
             "crop": crop_name,
-            "data": clean_text 
+            "data": clean_text
         })
+        response.headers["X-Cache"] = "HIT" if cached else "MISS"
+        return response
 
+    except llm_client.LLMError as e:
+        return jsonify({"error": e.message}), e.status
     except Exception as e:
         print(f"OpenAI API Error: {e}")
         return jsonify({"error": "Failed to generate tips"}), 500
+
+
+@tips_bp.route('/api/tips/stats', methods=['GET'])
+def tips_stats():
+    return jsonify({"cache": _cache.stats(), "coalescing": _flights.stats()})
@@ -0,0 +1,94 @@
+"""
+Fit a projection for, or classify, a hyperspectral cube (ENVI .hdr or .npy).
+
+Run from the repository root:
+
+    # Fit PCA/MNF on the usable bands and save it next to the model
+    python -m backend.scripts.classify_hyperspectral fit field.hdr --kind mnf --components 20 \\
+        --out backend/models/hyperspectral_projection.npz
+
+    # Classify every pixel with HYPERSPECTRAL_MODEL_PATH, writing classes.npy / confidence.npy
+    python -m backend.scripts.classify_hyperspectral pixels field.hdr --output-dir out/
+
+    # Classify 32x32 patches with a patch model
+    python -m backend.scripts.classify_hyperspectral patches field.hdr --patch-size 32
+
+The summary (class counts, confidence, projection) is printed as JSON. The
+hyperspectral model is only ever loaded here, not by the web app.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+from backend.inference import hyperspectral_model
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("cube", help="ENVI .hdr (or its data file) or .npy cube")
+    common.add_argument("--layout", default="auto", choices=["auto", "hwc", "chw"], help=".npy cubes only")
+    common.add_argument("--block-rows", type=int, default=None)
+
+    fit = sub.add_parser("fit", parents=[common], help="fit a PCA/MNF projection")
+    fit.add_argument("--kind", default="pca", choices=["none", "pca", "mnf"])
+    fit.add_argument("--components", type=int, default=20)
+    fit.add_argument("--bands", type=int, nargs="+", help="0-based bands (default: drop bad/water bands)")
+    fit.add_argument("--wavelength-range", type=float, nargs=2, metavar=("MIN_NM", "MAX_NM"))
+    fit.add_argument("--keep-water", action="store_true", help="keep the water-absorption bands")
+    fit.add_argument("--sample-step", type=int, default=1)
+    fit.add_argument("--out", default=hyperspectral_model.PROJECTION_PATH)
+
+    pixels = sub.add_parser("pixels", parents=[common], help="per-pixel classification")
+    pixels.add_argument("--projection", default=hyperspectral_model.PROJECTION_PATH)
+    pixels.add_argument("--output-dir", help="write full-resolution classes.npy and confidence.npy here")
+    pixels.add_argument("--preview-size", type=int, default=0)
+
+    patches = sub.add_parser("patches", parents=[common], help="per-patch classification")
+    patches.add_argument("--projection", default=hyperspectral_model.PROJECTION_PATH)
+    patches.add_argument("--patch-size", type=int, default=32)
+    patches.add_argument("--overlap", type=int, default=0)
+    patches.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    kwargs = {"layout": args.layout} if args.cube.lower().endswith(".npy") else {}
+    try:
+        cube = hyperspectral_model.open_cube(args.cube, **kwargs)
+        if args.command == "fit":
+            bands = hyperspectral_model.select_bands(
+                cube, args.bands, tuple(args.wavelength_range) if args.wavelength_range else None, not args.keep_water
+            )
+            projection = hyperspectral_model.fit_projection(
+                cube, bands, args.kind, args.components, args.sample_step, args.block_rows
+            )
+            projection.save(args.out)
+            result = {"projection": projection.summary(), "bands": projection.bands, "out": args.out}
+        elif args.command == "pixels":
+            result = hyperspectral_model.classify_pixels(
+                cube,
+                hyperspectral_model.load_projection(args.projection),
+                output_dir=args.output_dir,
+                preview_size=args.preview_size,
+                block_rows=args.block_rows,
+            )
+        else:
+            result = hyperspectral_model.classify_patches(
+                cube,
+                hyperspectral_model.load_projection(args.projection),
+                patch_size=args.patch_size,
+                overlap=args.overlap,
+                batch_size=args.batch_size,
+            )
+    except (ValueError, FileNotFoundError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Compare the INT8 pest model against FP32 on a held-out image folder.
+
+Run from the repository root:
+
+    python -m backend.scripts.evaluate_pest_quantization \\
+        --images datasets/pest/val --calibration datasets/pest/calib --mode static \\
+        --save backend/models/resnet50_int8.pt --report quant_report.json
+
+Reports top-1 agreement with the FP32 labels (overall and per FP32 class),
+confidence drift, accuracy against folder names when the images are laid
+out as <class>/<image>, and batch-1 / batch-32 latency for both models.
+Exits non-zero when agreement falls below --min-agreement, so it can gate
+a deployment of PEST_QUANTIZE. `--save` writes a TorchScript artifact that
+PEST_QUANTIZED_PATH loads without recalibrating.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import torch
+
+from backend.inference.pest_model import _PestModelSingleton, _transform
+from backend.inference.quantization import QUANTIZE_MODES, iter_batches, list_images
+
+
+def _predict_all(model: _PestModelSingleton, paths: List[Path], batch_size: int):
+    labels: List[int] = []
+    confs: List[float] = []
+    with torch.inference_mode():
+        for _, batch in iter_batches(paths, _transform, batch_size):
+            probs = torch.softmax(model.model(batch), dim=1)
+            conf, idx = torch.max(probs, dim=1)
+            labels.extend(int(i) for i in idx)
+            confs.extend(float(c) for c in conf)
+    return labels, confs
+
+
+def _latency_ms(model: _PestModelSingleton, batch_size: int, repeats: int = 20) -> float:
+    batch = torch.randn(batch_size, 3, 224, 224)
+    with torch.inference_mode():
+        for _ in range(3):
+            model.model(batch)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model.model(batch)
+    return (time.perf_counter() - start) * 1000.0 / (repeats * batch_size)
+
+
+def _true_label(path: Path, root: Path, classes: List[str]) -> Optional[int]:
+    rel = path.relative_to(root)
+    if len(rel.parts) > 1 and rel.parts[0] in classes:
+        return classes.index(rel.parts[0])
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, type=Path, help="held-out evaluation image folder")
+    parser.add_argument("--calibration", type=Path, help="calibration image folder (static mode)")
+    parser.add_argument("--mode", choices=[m for m in QUANTIZE_MODES if m != "none"], default="static")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    parser.add_argument("--save", type=Path, help="write the quantized model as TorchScript")
+    parser.add_argument("--report", type=Path, help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    paths = list_images(args.images)
+    if not paths:
+        parser.error(f"No images found under {args.images}")
+    if args.mode == "static" and args.calibration is None:
+        parser.error("--calibration is required for static mode (keep it disjoint from --images)")
+
+    print(f"Loading FP32 and {args.mode} INT8 models...")
+    fp32 = _PestModelSingleton(quantize="none")
+    int8 = _PestModelSingleton(quantize=args.mode, calibration_dir=args.calibration)
+    classes = fp32.classes
+
+    print(f"Evaluating {len(paths)} images...")
+    fp32_labels, fp32_confs = _predict_all(fp32, paths, args.batch_size)
+    int8_labels, int8_confs = _predict_all(int8, paths, args.batch_size)
+
+    agree = [a == b for a, b in zip(fp32_labels, int8_labels)]
+    drift = [q - f for f, q in zip(fp32_confs, int8_confs)]
+    per_class: Dict[str, List[bool]] = defaultdict(list)
+    for label, same in zip(fp32_labels, agree):
+        per_class[classes[label]].append(same)
+
+    truth = [_true_label(p, args.images, classes) for p in paths]
+    labelled = [(t, f, q) for t, f, q in zip(truth, fp32_labels, int8_labels) if t is not None]
+
+    report = {
+        "mode": args.mode,
+        "images": len(paths),
+        "top1_agreement": sum(agree) / len(agree),
+        "confidence_drift": {
+            "mean": sum(drift) / len(drift),
+            "mean_abs": sum(abs(d) for d in drift) / len(drift),
+            "max_abs": max(abs(d) for d in drift),
+        },
+        "per_class_agreement": {
+            name: {"images": len(v), "agreement": sum(v) / len(v)} for name, v in sorted(per_class.items())
+        },
+        "disagreements": [
+            {"image": str(p), "fp32": classes[f], "int8": classes[q]}
+            for p, f, q, same in zip(paths, fp32_labels, int8_labels, agree)
+            if not same
+        ],
+        "latency_ms_per_image": {
+            f"fp32_batch{bs}": _latency_ms(fp32, bs) for bs in (1, args.batch_size)
+        },
+    }
+    report["latency_ms_per_image"].update(
+        {f"int8_batch{bs}": _latency_ms(int8, bs) for bs in (1, args.batch_size)}
+    )
+    report["speedup_batch1"] = (
+        report["latency_ms_per_image"]["fp32_batch1"] / report["latency_ms_per_image"]["int8_batch1"]
+    )
+    if labelled:
+        report["accuracy"] = {
+            "labelled_images": len(labelled),
+            "fp32": sum(t == f for t, f, _ in labelled) / len(labelled),
+            "int8": sum(t == q for t, _, q in labelled) / len(labelled),
+        }
+
+    print(json.dumps({k: v for k, v in report.items() if k != "disagreements"}, indent=2))
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.report}")
+
+    if args.save:
+        scripted = torch.jit.trace(int8.model, torch.randn(1, 3, 224, 224))
+        torch.jit.save(scripted, str(args.save))
+        print(f"Quantized model saved to {args.save} (set PEST_QUANTIZED_PATH to use it)")
+
+    if report["top1_agreement"] < args.min_agreement:
+        print(f"FAIL: top-1 agreement {report['top1_agreement']:.4f} < {args.min_agreement}")
+        return 1
+    print("PASS")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Export the serving models to ONNX for the onnxruntime backend.
+
+Run from the repository root:
+
+    python -m backend.scripts.export_onnx                 # all models
+    python -m backend.scripts.export_onnx pest crop       # a subset
+
+The pest ResNet-50 is exported with torch.onnx; the Keras models use
+`Model.export(format="onnx")`, which needs `tf2onnx` installed in the export
+environment only. Each export is checked against the native model on a
+random batch before it is written to backend/models/onnx/.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+# Exports always start from the native models
+for _name in ("INFERENCE_BACKEND", "PEST_BACKEND", "CROP_BACKEND", "MULTISPECTRAL_BACKEND"):
+    os.environ.pop(_name, None)
+
+from backend.inference import onnx_backend, registry  # noqa: E402
+
+OPSET = 17
+CHECK_BATCH = 4
+
+
+def export_pest(path: str):
+    import torch
+
+    model = registry.get("pest").model
+    dummy = torch.randn(CHECK_BATCH, 3, 224, 224)
+    torch.onnx.export(
+        model,
+        dummy,
+        path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=OPSET,
+    )
+    with torch.inference_mode():
+        return dummy.numpy(), model(dummy).numpy()
+
+
+def _export_keras(name: str, path: str, channels: int):
+    model = registry.get(name)
+    dummy = np.random.rand(CHECK_BATCH, 224, 224, channels).astype(np.float32)
+    try:
+        model.export(path, format="onnx")
+    except (TypeError, ValueError):
+        # Older Keras without ONNX export support
+        import tensorflow as tf
+        import tf2onnx
+
+        spec = (tf.TensorSpec((None, 224, 224, channels), tf.float32, name="input"),)
+        tf2onnx.convert.from_keras(model, input_signature=spec, opset=OPSET, output_path=path)
+    return dummy, model.predict(dummy, verbose=0)
+
+
+def export_crop(path: str):
+    return _export_keras("crop", path, channels=3)
+
+
+def export_multispectral(path: str):
+    return _export_keras("multispectral", path, channels=4)
+
+
+EXPORTERS = {
+    "pest": export_pest,
+    "crop": export_crop,
+    "multispectral": export_multispectral,
+}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", nargs="*", help=f"subset of {', '.join(EXPORTERS)} (default: all)")
+    parser.add_argument("--atol", type=float, default=1e-3, help="max allowed |native - onnx| on the check batch")
+    args = parser.parse_args(argv)
+    unknown = set(args.models) - set(EXPORTERS)
+    if unknown:
+        parser.error(f"unknown model(s): {', '.join(sorted(unknown))}")
+
+    onnx_backend.ONNX_DIR.mkdir(parents=True, exist_ok=True)
+    failed = False
+    for name in args.models or list(EXPORTERS):
+        path = str(onnx_backend.onnx_path(name))
+        print(f"Exporting {name} -> {path}")
+        inputs, expected = EXPORTERS[name](path)
+
+        actual = onnx_backend.OnnxClassifier(path).predict(inputs)
+        diff = float(np.max(np.abs(actual - expected)))
+        status = "OK" if diff <= args.atol else "MISMATCH"
+        failed |= status != "OK"
+        print(f"  {status}: max |native - onnx| = {diff:.2e}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
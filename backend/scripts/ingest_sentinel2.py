@@ -0,0 +1,55 @@
+"""
+Cut a farm's bounding box out of a local Sentinel-2 .SAFE product.
+
+Run from the repository root:
+
+    python -m backend.scripts.ingest_sentinel2 datasets/S2B_MSIL2A_....SAFE \\
+        --bbox 77.10 13.20 77.14 13.24 --bbox-crs EPSG:4326 --out farm.npy
+
+Writes an (H, W, bands) float32 .npy on the 10 m grid (B02, B03, B04, B08
+by default, the multispectral model's input) and prints the product
+metadata and output geotransform as JSON. Add `--bands B02 B03 B04 B08 B05`
+for NDRE, `--harmonize` to apply the L2A BOA_ADD_OFFSET and `--mask-clouds`
+to set SCL cloud/shadow pixels to NaN.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+
+from backend.inference import sentinel2
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("product", help="path to the .SAFE directory")
+    parser.add_argument("--out", required=True, help="output .npy path")
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("MINX", "MINY", "MAXX", "MAXY"))
+    parser.add_argument("--bbox-crs", default=None, help="CRS of --bbox (default: the tile's UTM CRS)")
+    parser.add_argument("--bands", nargs="+", default=list(sentinel2.DEFAULT_BANDS))
+    parser.add_argument("--harmonize", action="store_true", help="apply BOA_ADD_OFFSET (L2A baseline 04.00+)")
+    parser.add_argument("--mask-clouds", action="store_true", help="NaN out SCL cloud/shadow pixels (L2A only)")
+    parser.add_argument("--block-rows", type=int, default=sentinel2.BLOCK_ROWS)
+    args = parser.parse_args(argv)
+
+    try:
+        meta = sentinel2.ingest(
+            args.product,
+            args.out,
+            bbox=args.bbox,
+            bbox_crs=args.bbox_crs,
+            bands=args.bands,
+            harmonize=args.harmonize,
+            block_rows=args.block_rows,
+            mask_clouds=args.mask_clouds,
+        )
+    except (ValueError, FileNotFoundError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(meta, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Marketplace search maintenance and benchmark.
+
+Run from the repository root (needs MONGO_URI):
+
+    # Add search_terms to items created before prefix search existed
+    python -m backend.scripts.market_search backfill
+
+    # Seed a synthetic 1M-item catalogue in a separate database and time queries
+    python -m backend.scripts.market_search benchmark --items 1000000 --db-name agri4_bench
+
+The benchmark runs the same `search_items` the API uses (text, prefix,
+category browse, deep page) next to the old unanchored `$regex` scan, and
+prints latency percentiles with the winning plan and documents examined
+from `explain()`.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from backend import database
+from backend.routes import market
+
+PRODUCTS = [
+    "Urea", "DAP", "NPK 19:19:19", "Potash", "Zinc Sulphate", "Neem Oil", "Imidacloprid", "Mancozeb",
+    "Chlorpyrifos", "Glyphosate", "Vermicompost", "Bio Fertilizer", "Drip Kit", "Sprayer", "Mulch Film",
+    "Hybrid Tomato Seeds", "Paddy Seeds", "Wheat Seeds", "Cotton Seeds", "Chilli Seeds", "Soil Test Kit",
+]
+COMPANIES = ["IFFCO", "Coromandel", "UPL", "Bayer", "Syngenta", "Dhanuka", "Mahyco", "Jain Irrigation", "Tata Rallis"]
+CATEGORIES = ["Fertilizers", "Pesticides", "Seeds", "Tools", "Organic"]
+WORDS = (
+    "effective fast acting organic granular liquid soluble high yield pest control crop protection "
+    "nitrogen phosphorus potassium micronutrient kharif rabi paddy wheat cotton vegetable orchard "
+    "aphids whitefly blight rust mildew borer thrips weeds germination irrigation spray dose acre"
+).split()
+
+
+def backfill(db, batch_size: int = 1000) -> int:
+    """Set search_terms on items that lack it; returns how many were updated."""
+    updated = 0
+    ops = []
+    cursor = db.market.find({"search_terms": {"$exists": False}}, {"name": 1, "company": 1}).batch_size(batch_size)
+    for item in cursor:
+        terms = market.search_terms(item.get("name"), item.get("company"))
+        ops.append(UpdateOne({"_id": item["_id"]}, {"$set": {"search_terms": terms}}))
+        if len(ops) >= batch_size:
+            updated += db.market.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += db.market.bulk_write(ops, ordered=False).modified_count
+    return updated
+
+
+def seed(db, count: int, batch_size: int = 10000, rng_seed: int = 7) -> None:
+    rng = random.Random(rng_seed)
+    start = datetime.utcnow()
+    for offset in range(0, count, batch_size):
+        batch = []
+        for i in range(offset, min(offset + batch_size, count)):
+            product = rng.choice(PRODUCTS)
+            company = rng.choice(COMPANIES)
+            name = f"{company} {product} {rng.choice(['500g', '1kg', '5kg', '25kg', '1L', '5L'])}"
+            batch.append({
+                "name": name,
+                "company": company,
+                "price": round(rng.uniform(50, 5000), 2),
+                "category": rng.choice(CATEGORIES),
+                "image": f"https://example.com/items/{i}.jpg",
+                "description": " ".join(rng.choices(WORDS, k=20)),
+                "created_at": start - timedelta(seconds=i),
+                "search_terms": market.search_terms(name, company),
+            })
+        db.market.insert_many(batch, ordered=False)
+        print(f"  seeded {min(offset + batch_size, count)}/{count}", end="\r")
+    print()
+
+
+def _explain(db, filters, sort=None, limit=None):
+    cursor = db.market.find(filters)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    plan = cursor.explain()
+    stats = plan.get("executionStats", {})
+    stages = []
+    node = plan.get("queryPlanner", {}).get("winningPlan", {})
+    while node:
+        stages.append(node.get("stage"))
+        node = node.get("inputStage") or (node.get("inputStages") or [None])[0]
+    return " <- ".join(s for s in stages if s), stats.get("totalDocsExamined"), stats.get("totalKeysExamined")
+
+
+def _time(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 2),
+        "p99_ms": round(samples[int(0.99 * (len(samples) - 1))], 2),
+    }
+
+
+def benchmark(db, repeat: int, limit: int, legacy_repeat: int) -> list:
+    cases = [
+        ("text 'neem oil'", dict(search="neem oil", mode="text"), {"$text": {"$search": "neem oil"}}),
+        ("text 'iffco urea' + category", dict(search="iffco urea", category="Fertilizers", mode="text"),
+         {"$text": {"$search": "iffco urea"}, "category": "Fertilizers"}),
+        ("prefix 'imida'", dict(search="imida", mode="prefix"), {"search_terms": {"$regex": "^imida"}}),
+        ("auto 'ure' (prefix fallback)", dict(search="ure"), {"search_terms": {"$regex": "^ure"}}),
+        ("browse category page 1", dict(category="Seeds"), {"category": "Seeds"}),
+        ("browse newest page 50", dict(page=50), {}),
+    ]
+    results = []
+    for label, kwargs, filters in cases:
+        kwargs = {"limit": limit, **kwargs}
+        timing = _time(lambda: market.search_items(db, **kwargs), repeat)
+        plan, docs, keys = _explain(db, filters, limit=limit + 1)
+        results.append({"query": label, **timing, "plan": plan, "docs_examined": docs, "keys_examined": keys})
+
+    # What GET /api/market?search=neem did before: unanchored regex, whole result set
+    legacy = {"name": {"$regex": "neem", "$options": "i"}}
+    timing = _time(lambda: list(db.market.find(legacy)), legacy_repeat)
+    plan, docs, keys = _explain(db, legacy)
+    results.append({"query": "legacy $regex 'neem' (unbounded)", **timing, "plan": plan, "docs_examined": docs, "keys_examined": keys})
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fill = sub.add_parser("backfill", help="add search_terms to existing items")
+    fill.add_argument("--batch-size", type=int, default=1000)
+
+    bench = sub.add_parser("benchmark", help="seed a synthetic catalogue and time searches")
+    bench.add_argument("--items", type=int, default=1_000_000)
+    bench.add_argument("--db-name", default="agri4_bench", help="database to seed (never the app database)")
+    bench.add_argument("--repeat", type=int, default=50)
+    bench.add_argument("--legacy-repeat", type=int, default=3)
+    bench.add_argument("--limit", type=int, default=market.PAGE_SIZE)
+    bench.add_argument("--reseed", action="store_true", help="drop and re-create the benchmark collection")
+    bench.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    client = database.get_client()
+    if client is None:
+        print("error: could not connect to MongoDB (check MONGO_URI)", file=sys.stderr)
+        return 1
+
+    if args.command == "backfill":
+        db = database.get_db()
+        print(f"backfilled search_terms on {backfill(db, args.batch_size)} items")
+        return 0
+
+    if args.db_name == database.get_db().name:
+        print("error: --db-name must not be the application database", file=sys.stderr)
+        return 1
+    db = client[args.db_name]
+    if args.reseed:
+        db.market.drop()
+    existing = db.market.estimated_document_count()
+    if existing < args.items:
+        print(f"Seeding {args.items - existing} items into {args.db_name}.market ...")
+        seed(db, args.items - existing)
+    market.ensure_indexes(db)
+
+    results = benchmark(db, args.repeat, args.limit, args.legacy_repeat)
+    if args.json:
+        print(json.dumps({"items": db.market.estimated_document_count(), "results": results}, indent=2))
+        return 0
+    print(f"\n{db.market.estimated_document_count()} items, limit {args.limit}\n")
+    print(f"{'query':38} {'p50':>9} {'p95':>9} {'p99':>9} {'docs':>9} {'keys':>9}  plan")
+    for row in results:
+        print(
+            f"{row['query']:38} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} "
+            f"{str(row['docs_examined']):>9} {str(row['keys_examined']):>9}  {row['plan']}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
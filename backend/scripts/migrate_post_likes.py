@@ -0,0 +1,107 @@
+"""
+Move community likes from the per-post `likes` array into the `post_likes`
+collection and store the count on each post as `likes_count`.
+
+Run once from the repository root before the counter-based toggle_like
+serves traffic (needs MONGO_URI); toggle_like does not read the legacy
+arrays, so a like toggled on an unmigrated post is miscounted:
+
+    python -m backend.scripts.migrate_post_likes --dry-run
+    python -m backend.scripts.migrate_post_likes
+    python -m backend.scripts.migrate_post_likes --recount   # repair counters later
+
+The migration is idempotent: like records are upserted, and a post's array
+is only removed after its counter has been set from `post_likes`.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from backend import database
+# Registers the on-connect index hook, so the unique (post_id, user_id) index exists before upserting
+from backend.routes import community  # noqa: F401
+
+
+def recount(db, post_id) -> int:
+    return db.post_likes.count_documents({"post_id": str(post_id)})
+
+
+def migrate(db, batch_size: int = 500, dry_run: bool = False, keep_arrays: bool = False) -> dict:
+    totals = {"posts": 0, "likes": 0}
+    cursor = db.posts.find({"likes": {"$exists": True}}, {"likes": 1, "created_at": 1}).batch_size(batch_size)
+    for post in cursor:
+        post_id = str(post["_id"])
+        user_ids = list(dict.fromkeys(post.get("likes") or []))
+        totals["posts"] += 1
+        totals["likes"] += len(user_ids)
+        if dry_run:
+            continue
+
+        liked_at = post.get("created_at") or datetime.utcnow()
+        for start in range(0, len(user_ids), batch_size):
+            db.post_likes.bulk_write(
+                [
+                    UpdateOne(
+                        {"post_id": post_id, "user_id": user_id},
+                        {"$setOnInsert": {"created_at": liked_at}},
+                        upsert=True,
+                    )
+                    for user_id in user_ids[start:start + batch_size]
+                ],
+                ordered=False,
+            )
+
+        update = {"$set": {"likes_count": recount(db, post_id)}}
+        if not keep_arrays:
+            update["$unset"] = {"likes": ""}
+        db.posts.update_one({"_id": post["_id"]}, update)
+    return totals
+
+
+def recount_all(db, batch_size: int = 500) -> int:
+    """Reset every post's likes_count from post_likes (e.g. after a crash mid-toggle)."""
+    counts = {row["_id"]: row["count"] for row in db.post_likes.aggregate([
+        {"$group": {"_id": "$post_id", "count": {"$sum": 1}}},
+    ])}
+    fixed = 0
+    batch = []
+    for post in db.posts.find({}, {"likes_count": 1}).batch_size(batch_size):
+        count = counts.get(str(post["_id"]), 0)
+        if post.get("likes_count") != count:
+            batch.append(UpdateOne({"_id": post["_id"]}, {"$set": {"likes_count": count}}))
+        if len(batch) >= batch_size:
+            fixed += db.posts.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        fixed += db.posts.bulk_write(batch, ordered=False).modified_count
+    return fixed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be migrated")
+    parser.add_argument("--keep-arrays", action="store_true", help="leave the legacy likes arrays in place")
+    parser.add_argument("--recount", action="store_true", help="recompute likes_count for all posts from post_likes")
+    args = parser.parse_args(argv)
+
+    db = database.get_db()
+    if db is None:
+        print("error: could not connect to MongoDB (check MONGO_URI)", file=sys.stderr)
+        return 1
+
+    totals = migrate(db, batch_size=args.batch_size, dry_run=args.dry_run, keep_arrays=args.keep_arrays)
+    verb = "would migrate" if args.dry_run else "migrated"
+    print(f"{verb} {totals['likes']} likes from {totals['posts']} posts")
+
+    if args.recount and not args.dry_run:
+        print(f"recounted: {recount_all(db, batch_size=args.batch_size)} posts corrected")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Fill the cultivation-tips cache for the most requested crops and languages.
+
+Run from the repository root (needs OPENAI_API_KEY, and MONGO_URI for the
+persistent tier so every server process benefits):
+
+    python -m backend.scripts.prewarm_tips
+    python -m backend.scripts.prewarm_tips --crops Wheat Rice --languages English Hindi --refresh
+
+Pairs already cached are skipped unless --refresh is given.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from backend import llm_client
+from backend.routes import tips
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--crops", nargs="+", default=tips.TOP_CROPS)
+    parser.add_argument("--languages", nargs="+", default=tips.SUPPORTED_LANGUAGES)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--refresh", action="store_true", help="regenerate pairs that are already cached")
+    args = parser.parse_args(argv)
+
+    if not llm_client.api_key():
+        print("error: OPENAI_API_KEY is not set", file=sys.stderr)
+        return 1
+
+    pairs = [(crop, language) for crop in args.crops for language in args.languages]
+    failures = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        futures = {pool.submit(tips.get_tips, crop, lang, args.refresh): (crop, lang) for crop, lang in pairs}
+        for future in as_completed(futures):
+            crop, lang = futures[future]
+            try:
+                _, cached = future.result()
+                print(f"{'cached ' if cached else 'filled '} {crop} / {lang}")
+            except Exception as exc:
+                failures += 1
+                print(f"FAILED  {crop} / {lang}: {exc}")
+
+    print(f"{len(pairs) - failures}/{len(pairs)} pairs warm in {time.perf_counter() - start:.1f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
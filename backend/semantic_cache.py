@@ -0,0 +1,322 @@
+"""
+Semantic answer cache for the chat assistant.
+
+Answered standalone questions are embedded locally (sentence-transformers)
+and kept in a persistent Chroma collection with the reply. A new question
+in the same language whose nearest stored question has cosine similarity
+>= CHAT_CACHE_THRESHOLD is answered from the index without calling the LLM.
+
+- Entries expire after CHAT_CACHE_TTL; beyond CHAT_CACHE_MAX_ENTRIES the
+  least recently hit ones are evicted.
+- `feedback(entry_id, helpful=False, user_id)` counts a bad hit, once per
+  user; after CHAT_CACHE_MAX_DOWNVOTES distinct users the entry is removed
+  so the question is answered afresh next time.
+- Chroma's on-disk store is single-process. With several gunicorn workers
+  set CHAT_CACHE_HOST to a Chroma server (`chroma run --path ...`) that
+  they all share; without one, the first process to lock CHAT_CACHE_DIR
+  owns the local store and the others run without the cache.
+- Like the other caches, failures are counted and swallowed: the chat
+  route falls back to the LLM.
+
+The embedding model is registered in the model registry as "chat_embedder".
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from backend import llm_client
+
+ENABLED = os.getenv("CHAT_SEMANTIC_CACHE", "1").lower() in ("1", "true", "yes")
+# Multilingual so Hindi questions match Hindi questions as well as English ones do
+EMBED_MODEL = os.getenv("CHAT_EMBED_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+CACHE_DIR = os.getenv(
+    "CHAT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chroma_chat_cache")
+)
+COLLECTION = os.getenv("CHAT_CACHE_COLLECTION", "chat_answers")
+HOST = os.getenv("CHAT_CACHE_HOST")
+PORT = int(os.getenv("CHAT_CACHE_PORT", "8000"))
+THRESHOLD = float(os.getenv("CHAT_CACHE_THRESHOLD", "0.92"))
+TTL = float(os.getenv("CHAT_CACHE_TTL", str(30 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "20000"))
+MAX_DOWNVOTES = int(os.getenv("CHAT_CACHE_MAX_DOWNVOTES", "3"))
+# Very short or very long messages are rarely standalone, reusable questions
+MIN_CHARS = int(os.getenv("CHAT_CACHE_MIN_CHARS", "12"))
+MAX_CHARS = int(os.getenv("CHAT_CACHE_MAX_CHARS", "500"))
+
+_collection = None
+_unavailable: Optional[str] = None
+_dir_lock = None
+_init_lock = threading.Lock()
+_write_lock = threading.Lock()
+_pruning = threading.Event()
+_stats_lock = threading.Lock()
+_stats: Dict[str, float] = {"lookups": 0, "hits": 0, "stored": 0, "evicted": 0, "downvotes": 0, "removed": 0, "errors": 0}
+
+
+def _reset_after_fork() -> None:
+    # The Chroma client holds a SQLite connection and background threads
+    global _collection, _init_lock, _write_lock, _stats_lock, _dir_lock
+    _collection = None
+    # An inherited flock is shared with the parent; the child must take its own
+    if _dir_lock is not None:
+        _dir_lock.close()
+        _dir_lock = None
+    _init_lock = threading.Lock()
+    _write_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _pruning.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def load_embedder():
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(EMBED_MODEL, device="cpu")
+
+
+def _count(key: str, value: float = 1) -> None:
+    with _stats_lock:
+        _stats[key] += value
+
+
+def _lock_cache_dir() -> None:
+    """Claim CACHE_DIR for this process, or raise OSError if another process has it."""
+    global _dir_lock
+    try:
+        import fcntl
+    except ImportError:
+        # Windows development server: a single process
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    handle = open(os.path.join(CACHE_DIR, ".lock"), "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        raise OSError(f"{CACHE_DIR} is in use by another process; set CHAT_CACHE_HOST to share a Chroma server")
+    _dir_lock = handle
+
+
+def _get_collection():
+    global _collection
+    if _collection is None:
+        with _init_lock:
+            if _collection is None:
+                import chromadb
+                from chromadb.config import Settings
+
+                settings = Settings(anonymized_telemetry=False)
+                if HOST:
+                    client = chromadb.HttpClient(host=HOST, port=PORT, settings=settings)
+                else:
+                    _lock_cache_dir()
+                    client = chromadb.PersistentClient(path=CACHE_DIR, settings=settings)
+                _collection = client.get_or_create_collection(COLLECTION, metadata={"hnsw:space": "cosine"})
+    return _collection
+
+
+def _embed(text: str) -> List[float]:
+    from backend.inference import registry
+
+    vector = registry.get("chat_embedder").encode([text], normalize_embeddings=True)[0]
+    return vector.tolist()
+
+
+def normalize(text: str) -> str:
+    return " ".join(str(text).split())
+
+
+def cacheable(question: str) -> bool:
+    return ENABLED and _unavailable is None and MIN_CHARS <= len(normalize(question)) <= MAX_CHARS
+
+
+def _disable(exc: Exception) -> None:
+    # A missing package or model will not appear mid-process; stop retrying
+    global _unavailable
+    if isinstance(exc, (ImportError, OSError)):
+        _unavailable = f"{type(exc).__name__}: {exc}"
+        print(f"Chat semantic cache disabled: {_unavailable}")
+
+
+def _scope(language: str, cutoff: float) -> Dict[str, Any]:
+    return {
+        "$and": [
+            {"language": normalize(language).casefold()},
+            {"model": llm_client.DEFAULT_MODEL},
+            {"created_at": {"$gte": cutoff}},
+        ]
+    }
+
+
+def lookup(question: str, language: str) -> Optional[Dict[str, Any]]:
+    """{"id", "reply", "similarity", "question"} for the closest fresh answer above the threshold, else None."""
+    if not cacheable(question):
+        return None
+    _count("lookups")
+    try:
+        embedding = _embed(normalize(question))
+        collection = _get_collection()
+        result = collection.query(
+            query_embeddings=[embedding],
+            n_results=1,
+            where=_scope(language, time.time() - TTL),
+            include=["metadatas", "distances", "documents"],
+        )
+    except Exception as exc:
+        _count("errors")
+        _disable(exc)
+        print(f"Chat semantic cache lookup failed: {exc}")
+        return None
+
+    if not result["ids"] or not result["ids"][0]:
+        return None
+    similarity = 1.0 - float(result["distances"][0][0])
+    if similarity < THRESHOLD:
+        return None
+
+    entry_id = result["ids"][0][0]
+    metadata = dict(result["metadatas"][0][0])
+    metadata["hits"] = int(metadata.get("hits", 0)) + 1
+    metadata["last_hit_at"] = time.time()
+    try:
+        with _write_lock:
+            collection.update(ids=[entry_id], metadatas=[metadata])
+    except Exception as exc:
+        # Only affects eviction order
+        _count("errors")
+        print(f"Chat semantic cache hit bookkeeping failed: {exc}")
+    _count("hits")
+    return {
+        "id": entry_id,
+        "reply": metadata["reply"],
+        "similarity": round(similarity, 4),
+        "question": result["documents"][0][0],
+    }
+
+
+def store(question: str, language: str, reply: str) -> Optional[str]:
+    """Index an answered question; returns the entry id (for feedback) or None."""
+    if not cacheable(question) or not reply.strip():
+        return None
+    entry_id = uuid.uuid4().hex
+    now = time.time()
+    try:
+        embedding = _embed(normalize(question))
+        collection = _get_collection()
+        with _write_lock:
+            collection.add(
+                ids=[entry_id],
+                embeddings=[embedding],
+                documents=[normalize(question)],
+                metadatas=[{
+                    "language": normalize(language).casefold(),
+                    "model": llm_client.DEFAULT_MODEL,
+                    "reply": reply,
+                    "created_at": now,
+                    "last_hit_at": now,
+                    "hits": 0,
+                    "downvotes": 0,
+                    "downvoted_by": "",
+                }],
+            )
+            size = collection.count()
+    except Exception as exc:
+        _count("errors")
+        _disable(exc)
+        print(f"Chat semantic cache store failed: {exc}")
+        return None
+    _count("stored")
+    if size > MAX_ENTRIES and not _pruning.is_set():
+        _pruning.set()
+        threading.Thread(target=prune, name="chat-cache-prune", daemon=True).start()
+    return entry_id
+
+
+def prune() -> int:
+    """Drop expired entries, then the least recently hit ones down to 90% of CHAT_CACHE_MAX_ENTRIES."""
+    removed = 0
+    try:
+        collection = _get_collection()
+        with _write_lock:
+            expired = collection.get(where={"created_at": {"$lt": time.time() - TTL}}, include=[])["ids"]
+            if expired:
+                collection.delete(ids=expired)
+                removed += len(expired)
+            excess = collection.count() - int(MAX_ENTRIES * 0.9)
+            if excess > 0:
+                entries = collection.get(include=["metadatas"])
+                ranked = sorted(
+                    zip(entries["ids"], entries["metadatas"]), key=lambda item: item[1].get("last_hit_at", 0)
+                )
+                victims = [entry_id for entry_id, _ in ranked[:excess]]
+                collection.delete(ids=victims)
+                removed += len(victims)
+    except Exception as exc:
+        _count("errors")
+        print(f"Chat semantic cache prune failed: {exc}")
+    finally:
+        _pruning.clear()
+    _count("evicted", removed)
+    return removed
+
+
+def feedback(entry_id: str, helpful: bool, user_id: str) -> Optional[bool]:
+    """
+    Record whether a cached answer was useful to `user_id`; repeat downvotes
+    from one user count once. Returns True if the entry was removed, False
+    if kept, None if it does not exist (or the cache is down).
+    """
+    try:
+        collection = _get_collection()
+        with _write_lock:
+            found = collection.get(ids=[entry_id], include=["metadatas"])
+            if not found["ids"]:
+                return None
+            if helpful:
+                return False
+            metadata = dict(found["metadatas"][0])
+            # Chroma metadata values are scalars, so voters are kept as a space-separated string
+            voters = (metadata.get("downvoted_by") or "").split()
+            if user_id in voters:
+                return False
+            _count("downvotes")
+            metadata["downvoted_by"] = " ".join(voters + [user_id])
+            metadata["downvotes"] = len(voters) + 1
+            if metadata["downvotes"] >= MAX_DOWNVOTES:
+                collection.delete(ids=[entry_id])
+                _count("removed")
+                return True
+            collection.update(ids=[entry_id], metadatas=[metadata])
+            return False
+    except Exception as exc:
+        _count("errors")
+        print(f"Chat semantic cache feedback failed: {exc}")
+        return None
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        counters = {key: int(value) for key, value in _stats.items()}
+    size = None
+    if _collection is not None:
+        try:
+            size = _collection.count()
+        except Exception:
+            pass
+    lookups = counters["lookups"]
+    return {
+        "enabled": ENABLED and _unavailable is None,
+        "unavailable": _unavailable,
+        "threshold": THRESHOLD,
+        "size": size,
+        "max_entries": MAX_ENTRIES,
+        "hit_rate": round(counters["hits"] / lookups, 4) if lookups else None,
+        **counters,
+    }
@@ -0,0 +1,88 @@
+"""
+Production entry point (pre-fork).
+
+    gunicorn -c backend/gunicorn.conf.py backend.wsgi:app
+
+The app is imported once in the gunicorn master (preload_app). Fork-safe
+model weights (Torch and scikit-learn; see PRELOAD_MODELS) are loaded
+here, then the heap is frozen with gc.freeze() so the garbage collector
+does not touch those objects and break copy-on-write sharing. Every worker
+therefore maps the same ResNet-50 pages instead of loading its own copy.
+
+TensorFlow and ONNX Runtime create thread pools that do not survive a
+fork, so Keras/ONNX models (and MODEL_WORKERS pools) are loaded in each
+worker by `post_fork` instead.
+"""
+from __future__ import annotations
+
+import gc
+import os
+import random
+from typing import List
+
+from backend import jobs
+from backend.app import create_app
+from backend.inference import onnx_backend, registry, workers
+
+# "auto": every fork-safe model; otherwise a comma-separated list, or "" for none
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "auto").strip()
+
+
+def fork_safe(name: str) -> bool:
+    """Models whose runtime starts no threads at load time (safe to load before forking)."""
+    if onnx_backend.backend_for(name) == "onnx":
+        return False
+    if name == "pest":
+        return True
+    if name == "hyperspectral":
+        from backend.inference import hyperspectral_model
+
+        return not hyperspectral_model.MODEL_PATH.endswith((".h5", ".keras"))
+    return False
+
+
+def preload_names() -> List[str]:
+    pooled = workers.configured()
+    if PRELOAD_MODELS.lower() == "auto":
+        candidates = [name for name in registry.served() if name not in pooled]
+        return [name for name in candidates if fork_safe(name)]
+    names = [n.strip() for n in PRELOAD_MODELS.split(",") if n.strip() and n.strip() not in pooled]
+    unsafe = [n for n in names if not fork_safe(n)]
+    if unsafe:
+        print(f"PRELOAD_MODELS: {', '.join(unsafe)} cannot be shared across forks; loading per worker instead")
+    return [n for n in names if fork_safe(n)]
+
+
+def preload() -> None:
+    for name in preload_names():
+        try:
+            registry.get(name)
+        except Exception as exc:
+            # Leave it to lazy loading in the workers, where the error will surface per request
+            print(f"Preload failed for model '{name}': {exc}")
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(slot: int = 0, slots: int = 1) -> None:
+    """
+    Per-worker initialisation (called from gunicorn's post_fork hook). `slot`
+    is this worker's stable index among `slots` live workers; MODEL_WORKERS
+    pools are divided between the slots rather than started in full by each.
+    """
+    registry.reset_after_fork()
+    random.seed()
+    if registry.is_loaded("pest"):
+        import torch
+
+        # Split cores between gunicorn workers instead of each one claiming all of them
+        threads = int(os.getenv("TORCH_THREADS_PER_WORKER", "0")) or max(1, (os.cpu_count() or 1) // max(1, slots))
+        torch.set_num_threads(threads)
+    workers.set_slot(slot, slots)
+    workers.start_from_env()
+    registry.warm_up_from_env(exclude=workers.configured())
+    jobs.start()
+
+
+app = create_app(load_models=False)
+preload()
@@ -0,0 +1,131 @@
+"""llm_client against a stub OpenAI server (http.server on a background thread)."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("requests")
+
+from backend import llm_client
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append(json.loads(body))
+        self.server.replies.pop(0)(self)
+
+    def log_message(self, *args):
+        pass
+
+
+def json_reply(status, body, headers=None):
+    def reply(handler):
+        data = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    return reply
+
+
+def completion(text):
+    return json_reply(200, {"choices": [{"message": {"content": text}}]})
+
+
+def sse_event(delta=None, finish_reason=None):
+    choice = {"delta": {"content": delta} if delta else {}, "finish_reason": finish_reason}
+    return f"data: {json.dumps({'choices': [choice]})}\n\n"
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.requests = []
+    server.replies = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setattr(llm_client, "BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.01)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_retries_5xx(stub):
+    retries = llm_client.stats()["retries"]
+    stub.replies = [
+        json_reply(503, {"error": {"message": "overloaded"}}, {"Retry-After": "0"}),
+        json_reply(502, {"error": {"message": "bad gateway"}}),
+        completion("hello"),
+    ]
+    assert llm_client.chat_completion([{"role": "user", "content": "hi"}]) == "hello"
+    assert len(stub.requests) == 3
+    assert llm_client.stats()["retries"] - retries == 2
+
+
+def test_gives_up_after_max_attempts(stub, monkeypatch):
+    monkeypatch.setattr(llm_client, "MAX_ATTEMPTS", 2)
+    stub.replies = [json_reply(500, {"error": {"message": "boom"}})] * 2
+    with pytest.raises(llm_client.LLMError) as excinfo:
+        llm_client.chat_completion([{"role": "user", "content": "hi"}])
+    assert excinfo.value.status == 500
+    assert len(stub.requests) == 2
+
+
+def test_no_retry_on_4xx(stub):
+    stub.replies = [json_reply(400, {"error": {"message": "bad request"}}), completion("unused")]
+    with pytest.raises(llm_client.LLMError) as excinfo:
+        llm_client.chat_completion([{"role": "user", "content": "hi"}])
+    assert excinfo.value.status == 400
+    assert "bad request" in excinfo.value.message
+    assert len(stub.requests) == 1
+
+
+def test_stream_is_incremental_and_handles_split_done(stub):
+    first_read = threading.Event()
+
+    def reply(handler):
+        def chunk(text):
+            data = text.encode()
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            handler.wfile.flush()
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        chunk(sse_event("Hel"))
+        # The rest is only sent once the client has the first delta
+        assert first_read.wait(5)
+        chunk(sse_event("lo"))
+        chunk(sse_event(finish_reason="stop"))
+        chunk("data: [DO")
+        chunk("NE]\n\n")
+        # Anything after [DONE] must be ignored
+        chunk(sse_event("ignored"))
+        handler.wfile.write(b"0\r\n\r\n")
+
+    stub.replies = [reply]
+    stream = llm_client.stream_chat_completion([{"role": "user", "content": "hi"}])
+    assert next(stream) == "Hel"
+    first_read.set()
+    assert "".join(stream) == "lo"
+    assert stream.finish_reason == "stop"
+    assert stub.requests[0]["stream"] is True
+
+
+def test_stream_error_status(stub):
+    stub.replies = [json_reply(401, {"error": {"message": "invalid key"}})]
+    stream = llm_client.stream_chat_completion([{"role": "user", "content": "hi"}])
+    with pytest.raises(llm_client.LLMError) as excinfo:
+        next(stream)
+    assert excinfo.value.status == 401
@@ -0,0 +1,169 @@
+"""Sentinel-2 ingestion against a tiny synthetic L2A .SAFE product (20x20 pixels at 10 m)."""
+import os
+
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip("rasterio")
+from rasterio.transform import from_origin
+
+from backend.inference import sentinel2
+
+TILE = "T43PGQ"
+DATATAKE = "20240101T052219"
+CRS = "EPSG:32643"
+ORIGIN = (600000.0, 1500200.0)
+SIZE = 20
+
+
+def _write_jp2(path, data, resolution):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with rasterio.open(
+        path,
+        "w",
+        driver="JP2OpenJPEG",
+        width=data.shape[1],
+        height=data.shape[0],
+        count=1,
+        dtype=data.dtype,
+        crs=CRS,
+        transform=from_origin(*ORIGIN, resolution, resolution),
+        QUALITY=100,
+        REVERSIBLE="YES",
+    ) as dst:
+        dst.write(data, 1)
+
+
+MTD = """<?xml version="1.0" encoding="UTF-8"?>
+<n1:Level-2A_User_Product xmlns:n1="https://psd-14.sentinel2.eo.esa.int/PSD/User_Product_Level-2A.xsd">
+  <n1:General_Info>
+    <Product_Info>
+      <PRODUCT_START_TIME>2024-01-01T05:22:19.024Z</PRODUCT_START_TIME>
+    </Product_Info>
+    <Product_Image_Characteristics>
+      <Spectral_Information_List>
+        <Spectral_Information bandId="1" physicalBand="B2"/>
+        <Spectral_Information bandId="2" physicalBand="B3"/>
+        <Spectral_Information bandId="3" physicalBand="B4"/>
+        <Spectral_Information bandId="4" physicalBand="B5"/>
+        <Spectral_Information bandId="7" physicalBand="B8"/>
+      </Spectral_Information_List>
+      <BOA_ADD_OFFSET_VALUES_LIST>
+        <BOA_ADD_OFFSET band_id="1">-1000</BOA_ADD_OFFSET>
+        <BOA_ADD_OFFSET band_id="2">-1000</BOA_ADD_OFFSET>
+        <BOA_ADD_OFFSET band_id="3">-1000</BOA_ADD_OFFSET>
+        <BOA_ADD_OFFSET band_id="4">-1000</BOA_ADD_OFFSET>
+        <BOA_ADD_OFFSET band_id="7">-1000</BOA_ADD_OFFSET>
+      </BOA_ADD_OFFSET_VALUES_LIST>
+    </Product_Image_Characteristics>
+  </n1:General_Info>
+</n1:Level-2A_User_Product>
+"""
+
+# Each 10 m band is a distinct ramp so band order and windows can be checked exactly
+BAND_DATA = {
+    band: (1000 * (i + 1) + np.arange(SIZE * SIZE).reshape(SIZE, SIZE)).astype(np.uint16)
+    for i, band in enumerate(sentinel2.DEFAULT_BANDS)
+}
+
+
+@pytest.fixture(scope="module")
+def safe(tmp_path_factory):
+    root = tmp_path_factory.mktemp("s2") / f"S2B_MSIL2A_{DATATAKE}_N0510_R062_{TILE}_20240101T080000.SAFE"
+    img = root / "GRANULE" / f"L2A_{TILE}_A035000_{DATATAKE}" / "IMG_DATA"
+    for band, data in BAND_DATA.items():
+        _write_jp2(str(img / "R10m" / f"{TILE}_{DATATAKE}_{band}_10m.jp2"), data, 10)
+
+    # B05 at 20 m: left half 100, right half 300
+    b05 = np.full((SIZE // 2, SIZE // 2), 100, dtype=np.uint16)
+    b05[:, SIZE // 4 :] = 300
+    _write_jp2(str(img / "R20m" / f"{TILE}_{DATATAKE}_B05_20m.jp2"), b05, 20)
+
+    # SCL at 20 m: vegetation (4) everywhere, high-probability cloud (9) in the top-left 2x2 pixels
+    scl = np.full((SIZE // 2, SIZE // 2), 4, dtype=np.uint8)
+    scl[:2, :2] = 9
+    _write_jp2(str(img / "R20m" / f"{TILE}_{DATATAKE}_SCL_20m.jp2"), scl, 20)
+
+    (root / "MTD_MSIL2A.xml").write_text(MTD)
+    return str(root)
+
+
+def test_parse_safe(safe):
+    product = sentinel2.parse_safe(safe)
+    assert product.level == "L2A"
+    assert product.tile_id == TILE
+    assert product.sensing_time == "2024-01-01T05:22:19.024Z"
+    assert sorted(product.bands) == ["B02", "B03", "B04", "B05", "B08"]
+    assert product.band_path("B05")[1] == 20
+    assert product.band_path("b04")[1] == 10
+    assert list(product.scl) == [20]
+    assert product.offsets["B02"] == -1000.0 and product.offsets["B05"] == -1000.0
+    with pytest.raises(ValueError):
+        product.band_path("B11")
+
+
+def test_ingest_default_bands(safe, tmp_path):
+    out = str(tmp_path / "stack.npy")
+    meta = sentinel2.ingest(safe, out, block_rows=7)
+    stack = np.load(out)
+    assert stack.shape == (SIZE, SIZE, 4) and stack.dtype == np.float32
+    for i, band in enumerate(sentinel2.DEFAULT_BANDS):
+        np.testing.assert_array_equal(stack[:, :, i], BAND_DATA[band])
+    assert meta["shape"] == [SIZE, SIZE, 4]
+    assert meta["tile_id"] == TILE
+    assert meta["transform"][:3] == [10.0, 0.0, ORIGIN[0]]
+    assert meta["masked_fraction"] is None
+
+
+def test_ingest_bbox_window(safe, tmp_path):
+    out = str(tmp_path / "window.npy")
+    # 5x4 pixels starting at column 3, row 2
+    minx, maxy = ORIGIN[0] + 30, ORIGIN[1] - 20
+    meta = sentinel2.ingest(safe, out, bbox=(minx, maxy - 40, minx + 50, maxy))
+    stack = np.load(out)
+    assert stack.shape == (4, 5, 4)
+    np.testing.assert_array_equal(stack[:, :, 0], BAND_DATA["B02"][2:6, 3:8])
+    assert meta["transform"][2] == minx and meta["transform"][5] == maxy
+
+    with pytest.raises(ValueError):
+        sentinel2.ingest(safe, out, bbox=(0, 0, 10, 10))
+
+
+def test_ingest_resamples_20m_band(safe, tmp_path):
+    out = str(tmp_path / "b05.npy")
+    sentinel2.ingest(safe, out, bands=["B05"], block_rows=7)
+    b05 = np.load(out)[:, :, 0]
+    assert b05.shape == (SIZE, SIZE)
+    # Away from the edge between the halves, the upsampled band keeps the 20 m values
+    np.testing.assert_allclose(b05[:, :9], 100)
+    np.testing.assert_allclose(b05[:, 11:], 300)
+    assert ((b05[:, 9:11] >= 100) & (b05[:, 9:11] <= 300)).all()
+
+
+def test_ingest_harmonize(safe, tmp_path):
+    out = str(tmp_path / "boa.npy")
+    meta = sentinel2.ingest(safe, out, bands=["B02"], harmonize=True)
+    np.testing.assert_array_equal(np.load(out)[:, :, 0], BAND_DATA["B02"].astype(np.float32) - 1000)
+    assert meta["harmonized"] is True
+
+
+def test_ingest_scl_mask(safe, tmp_path):
+    out = str(tmp_path / "masked.npy")
+    meta = sentinel2.ingest(safe, out, mask_clouds=True, block_rows=7)
+    stack = np.load(out)
+    cloudy = np.zeros((SIZE, SIZE), dtype=bool)
+    cloudy[:4, :4] = True  # the 2x2 cloudy SCL pixels on the 10 m grid
+    assert np.isnan(stack[cloudy]).all()
+    np.testing.assert_array_equal(stack[~cloudy][:, 0], BAND_DATA["B02"][~cloudy])
+    assert meta["masked_fraction"] == 16 / (SIZE * SIZE)
+
+
+def test_mask_clouds_needs_scl(safe, tmp_path):
+    product = sentinel2.parse_safe(safe)
+    scl_path = product.scl[20]
+    os.rename(scl_path, scl_path + ".bak")
+    try:
+        with pytest.raises(ValueError):
+            sentinel2.ingest(safe, str(tmp_path / "x.npy"), mask_clouds=True)
+    finally:
+        os.rename(scl_path + ".bak", scl_path)